@@ -1,18 +1,26 @@
-try:
-    import renderdoc as rd
-    import qrenderdoc as qrd
+import importlib
+import sys
 
-    renderdoc_present = True
-except ImportError:
-    renderdoc_present = False
-    pass
+# Importing the package (which every CLI does) mustn't import anything heavy:
+# renderdoc.ui pulls in renderdoc, qrenderdoc and PySide2, which are slow to import and may not work outside RenderDoc.
+#
+# RenderDoc loads the package as an extension and calls register()/unregister() on it,
+# so those import renderdoc.ui when they're called instead of when the package is imported.
 
-# try:
-#     pyrenderdoc
-#     renderdoc_ui_present = True
-# except NameError:
-#     renderdoc_ui_present = False
+def register(version: str, ctx):
+    from .renderdoc import ui
+    ui.register(version, ctx)
 
-if renderdoc_present: # and renderdoc_ui_present:
-    # TODO don't try to import renderdoc.ui if we're running in a shell script? 'pyrenderdoc' in globals() doesn't work as a test for this though...
-    from .renderdoc.ui import *
\ No newline at end of file
+def unregister():
+    # The UI can only be registered if it was imported, so don't import it just to unregister
+    ui = sys.modules.get(f"{__name__}.renderdoc.ui")
+    if ui is not None:
+        ui.unregister()
+
+# Subpackages are also imported on first attribute access, e.g. yk_analysis.analysis_helpers (needs Python 3.7+)
+LAZY_SUBMODULES = ["analysis_helpers", "benchmarks", "renderdoc"]
+
+def __getattr__(name: str):
+    if name in LAZY_SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,13 +1,25 @@
 import json
+import os
 import sqlite3
 import argparse
+import multiprocessing
+from hashlib import sha256
 from dataclasses import dataclass
-from typing import Any, Dict, Generator, List, Set, Tuple
+from typing import Any, Dict, Generator, Iterator, List, Optional, Set, Tuple
 from yk_analysis.analysis_helpers.db import ReadOnlyDb
-from yk_analysis.analysis_helpers.data import ShaderAggregate
+from yk_analysis.analysis_helpers.data import ReportWriter, ShaderAggregate, iter_report, load_report_fingerprints, remove_report_fingerprints, report_sort_key, save_report_fingerprints, shader_display_name
 
 EXPECTED_DRAWCALL_DB_VERSION = 1
 
+# The game DBs are static extracted snapshots, so open them immutable with generous mmap/page cache sizes
+DB_OPTIONS: Dict[str, Any] = dict(
+    immutable=True,
+    mmap_size=1 << 30,
+    cache_size_kib=256 * 1024,
+)
+
+TEXTURE_COLUMNS = "TexDiffuse, TexRefl, TexMulti, TexRm, TexTs, TexNormal, TexRt, TexRd"
+
 def cursor_iter(cursor, num_of_rows=100) -> Generator[Tuple, None, None]:
     while True:
         rows = cursor.fetchmany(num_of_rows)
@@ -15,39 +27,68 @@ def cursor_iter(cursor, num_of_rows=100) -> Generator[Tuple, None, None]:
         for row in rows:
             yield row
 
+# Helpers for folding a single AttribSet row into a shader's running aggregate.
+# Shared by analyze_shader and analyze_all_shaders so both modes produce identical results.
+def merge_textures(textures: List[bool], attribset_textures: Tuple):
+    for i in range(len(attribset_textures)):
+        if attribset_textures[i] is not None:
+            textures[i] = True
+
+# The JSON columns are decoded into (material key, truthy) pairs and set extra property indices.
+# Passing a decode cache dict makes each distinct JSON string only be decoded once, which matters when scanning every row.
+def decode_material(attribset_material: str) -> Tuple[Tuple[str, bool], ...]:
+    decoded = []
+    for (k, v) in json.loads(attribset_material).items():
+        is_truthy = bool(v)
+        if hasattr(v, "__iter__"):
+            is_truthy = any(v)
+        decoded.append((k, is_truthy))
+    return tuple(decoded)
+
+def decode_extra_properties(attribset_extras: str) -> Tuple[int, ...]:
+    decoded_extras = json.loads(attribset_extras)
+    return tuple(i for i in range(16) if decoded_extras[i])
+
+def merge_material(material: Dict[str, Any], attribset_material: str, decode_cache: Optional[Dict[str, Tuple[Tuple[str, bool], ...]]] = None):
+    if decode_cache is None:
+        decoded = decode_material(attribset_material)
+    else:
+        decoded = decode_cache.get(attribset_material)
+        if decoded is None:
+            decoded = decode_cache[attribset_material] = decode_material(attribset_material)
+    # Later rows overwrite earlier ones' entries, but keys keep the position they were first seen in
+    material.update(decoded)
+
+def merge_extra_properties(extra_properties: List[bool], attribset_extras: str, decode_cache: Optional[Dict[str, Tuple[int, ...]]] = None):
+    if decode_cache is None:
+        decoded = decode_extra_properties(attribset_extras)
+    else:
+        decoded = decode_cache.get(attribset_extras)
+        if decoded is None:
+            decoded = decode_cache[attribset_extras] = decode_extra_properties(attribset_extras)
+    for i in decoded:
+        extra_properties[i] = True
+
 def analyze_shader(shader: str, gmd_db: ReadOnlyDb) -> ShaderAggregate:
     # Find all unique AttribSet.Flags associated with this shader
-    gmd_db.cur.execute("SELECT DISTINCT Flags FROM AttribSet WHERE Shader = ?", (shader,))
     flags = {
         int.from_bytes(x)
-        for (x,) in cursor_iter(gmd_db.cur)
+        for (x,) in gmd_db.query("SELECT DISTINCT Flags FROM AttribSet WHERE Shader IS ?", (shader,))
     }
     # Find which texture slots are used with this shader
-    gmd_db.cur.execute("SELECT TexDiffuse, TexRefl, TexMulti, TexRm, TexTs, TexNormal, TexRt, TexRd FROM AttribSet WHERE Shader = ?", (shader,))
     textures = [False] * 8
-    for attribset_textures in cursor_iter(gmd_db.cur):
-        for i in range(len(attribset_textures)):
-            if attribset_textures[i] is not None:
-                textures[i] = True
+    for attribset_textures in gmd_db.query(f"SELECT {TEXTURE_COLUMNS} FROM AttribSet WHERE Shader IS ?", (shader,)):
+        merge_textures(textures, attribset_textures)
     # Find which parts of the material are used with this shader
-    gmd_db.cur.execute("SELECT Material, ExtraProperties FROM AttribSet WHERE Shader = ?", (shader,))
     material = {}
     extra_properties = [False] * 16
-    for (attribset_material, attribset_extras) in cursor_iter(gmd_db.cur):
-        for (k, v) in json.loads(attribset_material).items():
-            is_truthy = bool(v)
-            if hasattr(v, "__iter__"):
-                is_truthy = any(v)
-            material[k] = is_truthy
-        decoded_extras = json.loads(attribset_extras)
-        for i in range(16):
-            if decoded_extras[i]:
-                extra_properties[i] = True
+    for (attribset_material, attribset_extras) in gmd_db.query("SELECT Material, ExtraProperties FROM AttribSet WHERE Shader IS ?", (shader,)):
+        merge_material(material, attribset_material)
+        merge_extra_properties(extra_properties, attribset_extras)
     # Find which vertex layout flags, bytespervert, and matrices are used with this shader
-    gmd_db.cur.execute("SELECT DISTINCT VertLayoutFlags, BytesPerVert, MatrixCount FROM DrawCalls INNER JOIN AttribSet ON DrawCalls.AttribSetId = AttribSet.ROWID WHERE AttribSet.Shader = ?", (shader,))
     vertex_format = set()
     uses_matrices = set()
-    for (draw_vlf, draw_bpv, draw_matrices) in cursor_iter(gmd_db.cur):
+    for (draw_vlf, draw_bpv, draw_matrices) in gmd_db.query("SELECT DISTINCT VertLayoutFlags, BytesPerVert, MatrixCount FROM DrawCalls INNER JOIN AttribSet ON DrawCalls.AttribSetId = AttribSet.ROWID WHERE AttribSet.Shader IS ?", (shader,)):
         vertex_format.add((
             int.from_bytes(draw_vlf),
             draw_bpv
@@ -64,38 +105,284 @@ def analyze_shader(shader: str, gmd_db: ReadOnlyDb) -> ShaderAggregate:
         uses_matrices=uses_matrices
     )
 
+def analyze_all_shaders(gmd_db: ReadOnlyDb) -> Dict[str, ShaderAggregate]:
+    # Equivalent to calling analyze_shader() on every DISTINCT AttribSet.Shader,
+    # but built from one streaming pass over AttribSet and one pass over the DrawCalls join
+    # instead of ~4 queries per shader.
+    shaders: Dict[str, ShaderAggregate] = {}
+    material_cache: Dict[str, Tuple[Tuple[str, bool], ...]] = {}
+    extras_cache: Dict[str, Tuple[int, ...]] = {}
+
+    # Rows are visited in ROWID order, the same order analyze_shader sees them in,
+    # so "last row wins" material entries and key ordering match.
+    for (shader_name, attribset_flags, *attribset_textures, attribset_material, attribset_extras) in gmd_db.query(f"SELECT Shader, Flags, {TEXTURE_COLUMNS}, Material, ExtraProperties FROM AttribSet ORDER BY ROWID"):
+        shader = shaders.get(shader_name)
+        if shader is None:
+            shader = ShaderAggregate(
+                shader=shader_name,
+                flags=set(),
+                textures=[False] * 8,
+                material={},
+                extra_properties=[False] * 16,
+                vertex_format=set(),
+                uses_matrices=set()
+            )
+            shaders[shader_name] = shader
+        shader.flags.add(int.from_bytes(attribset_flags))
+        merge_textures(shader.textures, attribset_textures)
+        merge_material(shader.material, attribset_material, material_cache)
+        merge_extra_properties(shader.extra_properties, attribset_extras, extras_cache)
+
+    for (shader_name, draw_vlf, draw_bpv, draw_matrices) in gmd_db.query("SELECT DISTINCT AttribSet.Shader, VertLayoutFlags, BytesPerVert, MatrixCount FROM DrawCalls INNER JOIN AttribSet ON DrawCalls.AttribSetId = AttribSet.ROWID"):
+        shader = shaders[shader_name]
+        shader.vertex_format.add((
+            int.from_bytes(draw_vlf),
+            draw_bpv
+        ))
+        shader.uses_matrices.add(draw_matrices > 0)
+
+    return shaders
+
+def analyze_all_shaders_in_games(gmd_db: ReadOnlyDb, schemas: List[str]) -> Dict[Tuple[int, str], ShaderAggregate]:
+    # Like analyze_all_shaders, for several games' DBs ATTACHed to one connection (see ReadOnlyDb.attach).
+    # Returns {(index into schemas, shader): aggregate}, built from one UNION ALL scan over every game's AttribSet
+    # and one over every game's DrawCalls join.
+    # UNION ALL runs its arms in order and each arm is in ROWID order, so every game's rows are seen in the same order as in analyze_all_shaders.
+    shaders: Dict[Tuple[int, str], ShaderAggregate] = {}
+    material_cache: Dict[str, Tuple[Tuple[str, bool], ...]] = {}
+    extras_cache: Dict[str, Tuple[int, ...]] = {}
+
+    attribset_scan = " UNION ALL ".join(
+        f"SELECT * FROM (SELECT {game}, Shader, Flags, {TEXTURE_COLUMNS}, Material, ExtraProperties FROM {schema}.AttribSet ORDER BY ROWID)"
+        for game, schema in enumerate(schemas)
+    )
+    for (game, shader_name, attribset_flags, *attribset_textures, attribset_material, attribset_extras) in gmd_db.query(attribset_scan):
+        shader = shaders.get((game, shader_name))
+        if shader is None:
+            shader = ShaderAggregate(
+                shader=shader_name,
+                flags=set(),
+                textures=[False] * 8,
+                material={},
+                extra_properties=[False] * 16,
+                vertex_format=set(),
+                uses_matrices=set()
+            )
+            shaders[(game, shader_name)] = shader
+        shader.flags.add(int.from_bytes(attribset_flags))
+        merge_textures(shader.textures, attribset_textures)
+        merge_material(shader.material, attribset_material, material_cache)
+        merge_extra_properties(shader.extra_properties, attribset_extras, extras_cache)
+
+    drawcalls_scan = " UNION ALL ".join(
+        f"SELECT DISTINCT {game}, a.Shader, d.VertLayoutFlags, d.BytesPerVert, d.MatrixCount FROM {schema}.DrawCalls d INNER JOIN {schema}.AttribSet a ON d.AttribSetId = a.ROWID"
+        for game, schema in enumerate(schemas)
+    )
+    for (game, shader_name, draw_vlf, draw_bpv, draw_matrices) in gmd_db.query(drawcalls_scan):
+        shader = shaders[(game, shader_name)]
+        shader.vertex_format.add((
+            int.from_bytes(draw_vlf),
+            draw_bpv
+        ))
+        shader.uses_matrices.add(draw_matrices > 0)
+
+    return shaders
+
+# SQL versions of the merge_* helpers' truthiness rules, for JSON1 json_each rows.
+# Python's bool() of a decoded JSON value:
+def sql_json_truthy(t: str, v: str) -> str:
+    return f"(CASE {t} WHEN 'array' THEN json_array_length({v}) > 0 WHEN 'object' THEN {v} != '{{}}' WHEN 'text' THEN {v} != '' WHEN 'null' THEN 0 ELSE {v} != 0 END)"
+# merge_material's rule, where arrays are truthy if any element is:
+SQL_MATERIAL_TRUTHY = f"(CASE j.type WHEN 'array' THEN EXISTS(SELECT 1 FROM json_each(j.value) e WHERE {sql_json_truthy('e.type', 'e.value')}) ELSE {sql_json_truthy('j.type', 'j.value')} END)"
+
+# Enough to keep json_each ids (offsets into the JSON text) from overlapping between ROWIDs
+SQL_MATERIAL_ROW_STRIDE = 1 << 32
+
+def parse_hex_list(hex_list: Optional[str]) -> List[str]:
+    return hex_list.split(",") if hex_list is not None else []
+
+def analyze_all_shaders_sql(gmd_db: ReadOnlyDb) -> Dict[str, ShaderAggregate]:
+    # Equivalent to analyze_all_shaders, but SQLite does the reducing (using JSON1 for the JSON columns),
+    # so Python only sees one row per shader from each query rather than one per AttribSet.
+    # The JSON columns are only decoded once per distinct value for each shader, because materials are often shared.
+    shaders: Dict[str, ShaderAggregate] = {}
+
+    texture_bits = ", ".join(f"MAX({column} IS NOT NULL)" for column in TEXTURE_COLUMNS.split(", "))
+    for (shader_name, flags_hex, *bits) in gmd_db.query(f"SELECT Shader, group_concat(DISTINCT hex(Flags)), {texture_bits} FROM AttribSet GROUP BY Shader"):
+        shaders[shader_name] = ShaderAggregate(
+            shader=shader_name,
+            flags={int(x, 16) if x else 0 for x in parse_hex_list(flags_hex)},
+            textures=[bool(b) for b in bits],
+            material={},
+            extra_properties=[False] * 16,
+            vertex_format=set(),
+            uses_matrices=set()
+        )
+
+    extras_bits = ", ".join(f"MAX(COALESCE(json_extract(ExtraProperties, '$[{i}]'), 0) != 0)" for i in range(16))
+    for (shader_name, *bits) in gmd_db.query(f"SELECT Shader, {extras_bits} FROM (SELECT DISTINCT Shader, ExtraProperties FROM AttribSet) GROUP BY Shader"):
+        shaders[shader_name].extra_properties = [bool(b) for b in bits]
+
+    # Material keys keep the order they were first seen in, and take their truthiness from the last row which has them,
+    # like merge_material applied in ROWID order. Both are worked out from ROWID so the scan order doesn't matter.
+    for (shader_name, material_json) in gmd_db.query(f"""
+        SELECT shader, json_group_array(json_array(first_seen, key, last_truthy % 2)) FROM (
+            SELECT a.Shader AS shader, j.key AS key,
+                MIN(a.first_row * {SQL_MATERIAL_ROW_STRIDE} + j.id) AS first_seen,
+                MAX(a.last_row * 2 + {SQL_MATERIAL_TRUTHY}) AS last_truthy
+            FROM (SELECT Shader, Material, MIN(ROWID) AS first_row, MAX(ROWID) AS last_row FROM AttribSet GROUP BY Shader, Material) a, json_each(a.Material) j
+            GROUP BY a.Shader, j.key
+        ) GROUP BY shader
+    """):
+        material = shaders[shader_name].material
+        for _first_seen, key, truthy in sorted(json.loads(material_json)):
+            material[key] = bool(truthy)
+
+    for (shader_name, vertex_formats, any_matrices, all_matrices) in gmd_db.query("SELECT AttribSet.Shader, group_concat(DISTINCT hex(VertLayoutFlags) || ':' || BytesPerVert), MAX(MatrixCount > 0), MIN(MatrixCount > 0) FROM DrawCalls INNER JOIN AttribSet ON DrawCalls.AttribSetId = AttribSet.ROWID GROUP BY AttribSet.Shader"):
+        shader = shaders[shader_name]
+        for vertex_format in parse_hex_list(vertex_formats):
+            draw_vlf, draw_bpv = vertex_format.split(":")
+            shader.vertex_format.add((int(draw_vlf, 16) if draw_vlf else 0, int(draw_bpv)))
+        shader.uses_matrices.update({bool(any_matrices), bool(all_matrices)})
+
+    return shaders
+
+def shader_fingerprints(gmd_db: ReadOnlyDb) -> Dict[str, str]:
+    # "<AttribSet row count>:<hash>" for every shader, over exactly the values its aggregate is built from,
+    # so incremental runs can tell which shaders need recomputing.
+    # AttribSet rows are hashed in ROWID order (which decides material key order) but ROWIDs themselves aren't,
+    # so rows added for other shaders don't change this shader's fingerprint.
+    hashes = {}
+    counts: Dict[str, int] = {}
+    texture_bits = " | ".join(f"(({column} IS NOT NULL) << {i})" for i, column in enumerate(TEXTURE_COLUMNS.split(", ")))
+    for (shader_name, *row) in gmd_db.query(f"SELECT Shader, Flags, {texture_bits}, Material, ExtraProperties FROM AttribSet ORDER BY ROWID"):
+        h = hashes.get(shader_name)
+        if h is None:
+            h = hashes[shader_name] = sha256()
+            counts[shader_name] = 0
+        h.update(repr(row).encode())
+        counts[shader_name] += 1
+    for (shader_name, *row) in gmd_db.query("SELECT DISTINCT AttribSet.Shader, VertLayoutFlags, BytesPerVert, MatrixCount > 0 FROM DrawCalls INNER JOIN AttribSet ON DrawCalls.AttribSetId = AttribSet.ROWID ORDER BY 1, 2, 3, 4"):
+        hashes[shader_name].update(repr(row).encode())
+    return {shader_name: f"{counts[shader_name]}:{h.hexdigest()}" for shader_name, h in hashes.items()}
+
+def print_shader_list(title: str, shaders: List[str]):
+    print(f"{title}: {len(shaders)}")
+    for shader_name in shaders:
+        print(f"\t{shader_display_name(shader_name)}")
+
+# Each worker process opens its own connection - the DB is opened mode=ro, so this is safe.
+worker_db: Optional[ReadOnlyDb] = None
+
+def init_worker(db_path: str):
+    global worker_db
+    worker_db = ReadOnlyDb(db_path, expected_version=EXPECTED_DRAWCALL_DB_VERSION, **DB_OPTIONS)
+
+def analyze_shader_in_worker(shader: str) -> ShaderAggregate:
+    assert worker_db is not None
+    return analyze_shader(shader, worker_db)
+
+def analyze_shaders_parallel(db_path: str, shaders: List[str], jobs: int) -> Iterator[ShaderAggregate]:
+    # Splits the shaders across `jobs` worker processes running analyze_shader.
+    # Results are streamed back as they complete, but yielded in the same order as `shaders`.
+    # Small chunks keep the workers evenly loaded, because some shaders have far more AttribSets than others.
+    chunksize = max(1, len(shaders) // (jobs * 16))
+    with multiprocessing.Pool(jobs, initializer=init_worker, initargs=(db_path,)) as pool:
+        yield from pool.imap(analyze_shader_in_worker, shaders, chunksize=chunksize)
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("db")
     parser.add_argument("report_file")
+    parser.add_argument("--mode", choices=["per-shader", "single-scan", "sql"],
+                        help="per-shader runs several queries for each shader, "
+                             "single-scan builds every shader from one pass over AttribSet and one over DrawCalls, "
+                             "sql has SQLite aggregate each shader (needs JSON1). "
+                             "Defaults to single-scan, or per-shader with --jobs")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes to split the shaders across (per-shader mode only)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse the aggregates from the existing report_file, only recomputing shaders whose AttribSet/DrawCalls rows changed "
+                             "since it was written (uses the report's .fingerprints.json, falls back to a full run without it)")
+    parser.add_argument("--write-fingerprints", action="store_true",
+                        help="Write the report's .fingerprints.json, so a later --incremental run can use it (implied by --incremental)")
+    parser.add_argument("--no-invariants", action="store_true",
+                        help="Don't check the DB against the invariants in analysis_helpers/invariants.py")
+    parser.add_argument("--columnar-cache",
+                        help="Directory to cache the columns loaded for the invariant checks in, which makes later runs on the same DB much faster")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print per-query timings, row counts and query plans at the end (worker processes aren't profiled)")
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.mode is None:
+        args.mode = "per-shader" if args.jobs > 1 else "single-scan"
+    if args.jobs > 1 and args.mode != "per-shader" and not args.incremental:
+        parser.error("--jobs is only supported in per-shader and incremental mode")
+
+    db = ReadOnlyDb(args.db, expected_version=EXPECTED_DRAWCALL_DB_VERSION, profile=args.profile, **DB_OPTIONS)
+    # Fingerprinting every shader is a full pass over both tables, so it's only done when asked for
+    write_fingerprints = args.incremental or args.write_fingerprints
+    fingerprints = shader_fingerprints(db) if write_fingerprints else None
+    previous_fingerprints = load_report_fingerprints(args.report_file) if args.incremental else None
+    if args.incremental and previous_fingerprints is None:
+        print(f"No fingerprints for {args.report_file}, analysing every shader")
+
+    if previous_fingerprints is not None:
+        # Keep the previous aggregate for every shader that hasn't changed, and recompute the rest with analyze_shader.
+        # The whole previous report is read in first, because the new one replaces it.
+        with open(args.report_file, "r") as f:
+            previous = {
+                shader.shader: shader for shader in iter_report(f)
+                if shader.shader in fingerprints and previous_fingerprints.get(shader.shader) == fingerprints[shader.shader]
+            }
+        # Every current shader without a reusable aggregate is recomputed.
+        # That includes shaders the fingerprints list but the report doesn't have, which are counted as changed.
+        recompute = sorted((shader_name for shader_name in fingerprints if shader_name not in previous), key=report_sort_key)
+        changed = [shader_name for shader_name in recompute if shader_name in previous_fingerprints]
+        added = [shader_name for shader_name in recompute if shader_name not in previous_fingerprints]
+        removed = sorted((shader_name for shader_name in previous_fingerprints if shader_name not in fingerprints), key=report_sort_key)
+        print_shader_list("Changed shaders", changed)
+        print_shader_list("Added shaders", added)
+        print_shader_list("Removed shaders", removed)
+        print(f"Reusing {len(previous)} unchanged shaders")
+
+        if args.jobs > 1 and recompute:
+            recomputed = dict(zip(recompute, analyze_shaders_parallel(args.db, recompute, args.jobs)))
+        else:
+            recomputed = {shader_name: analyze_shader(shader_name, db) for shader_name in recompute}
+        shader_aggregates = (
+            recomputed[shader_name] if shader_name in recomputed else previous[shader_name]
+            for shader_name in sorted(fingerprints, key=report_sort_key)
+        )
+    elif args.mode in ("single-scan", "sql"):
+        all_shaders = analyze_all_shaders(db) if args.mode == "single-scan" else analyze_all_shaders_sql(db)
+        shader_aggregates = (all_shaders[shader_name] for shader_name in sorted(all_shaders, key=report_sort_key))
+    else:
+        shaders = sorted(set(n for (n,) in db.query("SELECT DISTINCT Shader FROM AttribSet")), key=report_sort_key)
+        if args.jobs > 1:
+            shader_aggregates = analyze_shaders_parallel(args.db, shaders, args.jobs)
+        else:
+            shader_aggregates = (analyze_shader(shader_name, db) for shader_name in shaders)
+
+    # Write to a temporary file first, so an interrupted run doesn't leave a half-written report next to the old fingerprints
+    tmp_report_path = f"{args.report_file}.tmp"
+    with open(tmp_report_path, "w") as report_file:
+        report_writer = ReportWriter(report_file)
+        for shader in shader_aggregates:
+            report_writer.write(shader)
+    os.replace(tmp_report_path, args.report_file)
+    if fingerprints is not None:
+        save_report_fingerprints(args.report_file, fingerprints)
+    else:
+        # Fingerprints from an earlier run no longer describe this report
+        remove_report_fingerprints(args.report_file)
+
+    if not args.no_invariants:
+        # Imported here, because the invariant checks need NumPy and the rest of this script doesn't
+        from yk_analysis.analysis_helpers.invariants import check_invariants, print_invariant_results
+        print_invariant_results(check_invariants(db, cache_dir=args.columnar_cache))
 
-    db = ReadOnlyDb(args.db, expected_version=1)
-    db.cur.execute("SELECT DISTINCT Shader FROM AttribSet")
-    shaders = set(n for (n,) in cursor_iter(db.cur))
-
-    # Look for notable points
-    shaders_always_use_same_attribset_flags = True
-    shaders_always_use_same_vertexlayout = True
-    shaders_are_either_skinned_or_unskinned = True
-
-    with open(args.report_file, "w") as report_file:
-        for shader_name in shaders:
-            shader = analyze_shader(shader_name, db)
-            if shaders_always_use_same_attribset_flags and len(shader.flags) > 1:
-                print(f"Shader {shader.shader} uses multiple attribset flags: ")
-                for flag in shader.flags:
-                    print(f"\t0x{flag:08x}")
-                shaders_always_use_same_attribset_flags = False
-            if shaders_always_use_same_vertexlayout and len(shader.vertex_format) > 1:
-                print(f"Shader {shader.shader} uses multiple vertex layouts")
-                for (vertex_layout_flags, bytes_per_vertex) in shader.vertex_format:
-                    print(f"\t0x{vertex_layout_flags:08x}\t{bytes_per_vertex:d} bytes")
-                shaders_always_use_same_vertexlayout = False
-            if shaders_are_either_skinned_or_unskinned and len(shader.uses_matrices) > 1:
-                print(f"Shader {shader.shader} works with both skinned and unskinned")
-                shaders_are_either_skinned_or_unskinned = False
-        
-            print(f"{shader}", file=report_file)
-    
\ No newline at end of file
+    if args.profile:
+        db.print_profile()
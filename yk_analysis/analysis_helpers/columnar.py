@@ -0,0 +1,241 @@
+import itertools
+import json
+import os
+import shutil
+from hashlib import sha256
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from yk_analysis.analysis_helpers.db import ReadOnlyDb, db_content_fingerprint
+
+# Loads columns of a table into one NumPy array per column, fetching rows in large chunks
+# and converting each chunk in bulk instead of one tuple at a time.
+#
+# Column kinds:
+FLAGS = "flags"        # BLOB flags (e.g. VertLayoutFlags) -> uint64, read big-endian like int.from_bytes(). NULL -> 0
+INT = "int"            # INTEGER -> int64. NULL -> 0
+CATEGORY = "category"  # TEXT (e.g. Shader) -> int32 codes into ColumnarTable.categories[column]. NULL -> -1
+PRESENT = "present"    # any column -> bool, True if it's NOT NULL (e.g. texture slots)
+COLUMN_KINDS = [FLAGS, INT, CATEGORY, PRESENT]
+
+# Rows fetched from SQLite per chunk
+CHUNK_ROWS = 64 * 1024
+
+# Flags blobs are at most 64 bits
+FLAGS_BYTES = 8
+
+class ColumnarTable:
+    # ROWID is always loaded (as an int64 column called "ROWID"), and rows are in ROWID order
+    table: str
+    columns: Dict[str, np.ndarray]
+    categories: Dict[str, List[str]]
+
+    def __init__(self, table: str, columns: Dict[str, np.ndarray], categories: Dict[str, List[str]]):
+        self.table = table
+        self.columns = columns
+        self.categories = categories
+
+    def __len__(self) -> int:
+        return len(self.columns["ROWID"])
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def find_rows(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # (row indices, found) for an array of ROWIDs, e.g. DrawCalls.AttribSetId -> the matching AttribSet rows.
+        # found is False for ids with no row, whose row indices are meaningless.
+        rowids = self.columns["ROWID"]
+        rows = np.searchsorted(rowids, ids)
+        found = rows < len(rowids)
+        found[found] = rowids[rows[found]] == ids[found]
+        return rows, found
+
+    def rows_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        # Like find_rows, for when every id must exist
+        rows, found = self.find_rows(ids)
+        if not found.all():
+            raise ValueError(f"{np.count_nonzero(~found)} ids don't exist in {self.table}, e.g. {ids[~found][0]}")
+        return rows
+
+def flags_to_uint64(blobs: Sequence[Optional[bytes]]) -> np.ndarray:
+    # Every blob is normally 8 bytes, so they can be joined and reinterpreted in one go
+    try:
+        joined = b"".join(blobs)
+    except TypeError:
+        # There are NULLs
+        joined = b""
+    if len(joined) != FLAGS_BYTES * len(blobs):
+        if any(blob is not None and len(blob) > FLAGS_BYTES for blob in blobs):
+            raise ValueError(f"Flags blob longer than {FLAGS_BYTES} bytes")
+        # Zero-extend shorter blobs on the left, which keeps their big-endian value
+        joined = b"".join((blob or b"").rjust(FLAGS_BYTES, b"\0") for blob in blobs)
+    return np.frombuffer(joined, dtype=">u8").astype(np.uint64)
+
+def ints_to_int64(values: Sequence[Optional[int]]) -> np.ndarray:
+    try:
+        return np.array(values, dtype=np.int64)
+    except TypeError:
+        # There are NULLs
+        return np.array([0 if v is None else v for v in values], dtype=np.int64)
+
+def select_expression(column: str, kind: str) -> str:
+    if kind == PRESENT:
+        return f"{column} IS NOT NULL"
+    return column
+
+# Each chunk of row tuples goes through one structured array conversion, which is much cheaper than transposing it in Python.
+# Blobs and text stay Python objects in it, and are converted afterwards.
+# Category values are given provisional codes with a C-level map() over dict.setdefault, and renumbered 0..n-1 at the end.
+CHUNK_FIELD_DTYPES = {FLAGS: object, INT: np.int64, CATEGORY: object, PRESENT: np.bool_}
+EMPTY_COLUMN_DTYPES = {FLAGS: np.uint64, INT: np.int64, CATEGORY: np.int32, PRESENT: np.bool_}
+
+def load_table_from_db(db: ReadOnlyDb, table: str, columns: List[Tuple[str, str]], chunk_rows: int) -> ColumnarTable:
+    all_columns = [("ROWID", INT)] + columns
+    chunk_dtype = np.dtype([(f"f{i}", CHUNK_FIELD_DTYPES[kind]) for i, (_column, kind) in enumerate(all_columns)])
+    # For chunks with NULLs in INT columns
+    nullable_chunk_dtype = np.dtype([(f"f{i}", object) for i in range(len(all_columns))])
+    chunks: Dict[str, List[np.ndarray]] = {column: [] for column, _kind in all_columns}
+    category_codes: Dict[str, Dict[Optional[str], int]] = {column: {} for column, kind in columns if kind == CATEGORY}
+    category_counters = {column: itertools.count() for column in category_codes}
+
+    cursor = db.cursor()
+    # No ORDER BY, so SQLite can scan a covering index instead of the table if it has one (e.g. the sidecar's AttribSet(Shader)).
+    # Rows are sorted by ROWID afterwards if they need to be.
+    cursor.execute(f"SELECT ROWID, {', '.join(select_expression(column, kind) for column, kind in columns)} FROM {table}")
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        try:
+            chunk = np.array(rows, dtype=chunk_dtype)
+        except TypeError:
+            chunk = np.array(rows, dtype=nullable_chunk_dtype)
+        for i, (column, kind) in enumerate(all_columns):
+            values = chunk[f"f{i}"]
+            if kind == FLAGS:
+                chunks[column].append(flags_to_uint64(values.tolist()))
+            elif kind == INT:
+                chunks[column].append(values if values.dtype == np.int64 else ints_to_int64(values.tolist()))
+            elif kind == CATEGORY:
+                chunks[column].append(np.fromiter(
+                    map(category_codes[column].setdefault, values.tolist(), category_counters[column]),
+                    dtype=np.int64, count=len(values)
+                ))
+            else:
+                chunks[column].append(values.astype(np.bool_))
+
+    kinds = dict(all_columns)
+    arrays = {
+        column: np.concatenate(column_chunks) if column_chunks else np.zeros(0, dtype=EMPTY_COLUMN_DTYPES[kinds[column]])
+        for column, column_chunks in chunks.items()
+    }
+    categories: Dict[str, List[str]] = {}
+    for column, codes in category_codes.items():
+        values_by_code = {code: value for value, code in codes.items()}
+        used_codes, arrays[column] = np.unique(arrays[column], return_inverse=True)
+        arrays[column] = arrays[column].astype(np.int32)
+        categories[column] = [values_by_code[code] for code in used_codes.tolist()]
+        if None in codes:
+            null_code = categories[column].index(None)
+            categories[column].pop(null_code)
+            arrays[column][arrays[column] == null_code] = -1
+            arrays[column][arrays[column] > null_code] -= 1
+
+    rowids = arrays["ROWID"]
+    if len(rowids) > 1 and not (rowids[1:] > rowids[:-1]).all():
+        order = np.argsort(rowids, kind="stable")
+        arrays = {column: array[order] for column, array in arrays.items()}
+    return ColumnarTable(table, arrays, categories)
+
+# The on-disk cache is a directory per (DB, table, columns) holding one .npy per column, which are memory-mapped when loaded,
+# and a meta.json with the categories and the fingerprint of the DB it was built from.
+# It's rebuilt in place when the DB changes.
+CACHE_FORMAT = "yk_columnar_cache"
+CACHE_VERSION = 1
+
+def cache_dir_for(cache_dir: str, db_path: str, table: str, columns: List[Tuple[str, str]]) -> str:
+    # The basename keeps the directory recognisable, the path hash keeps same-named DBs in different folders apart
+    path_key = sha256(os.path.abspath(db_path).encode()).hexdigest()[:8]
+    columns_key = sha256(json.dumps(columns).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{os.path.basename(db_path)}.{path_key}.{table}.{columns_key}")
+
+def load_cached_table(path: str, table: str, fingerprint: str) -> Optional[ColumnarTable]:
+    try:
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta.get("format") != CACHE_FORMAT or meta.get("version") != CACHE_VERSION or meta.get("fingerprint") != fingerprint:
+            return None
+        arrays = {column: np.load(os.path.join(path, f"{i}.npy"), mmap_mode="r") for i, column in enumerate(meta["columns"])}
+    except (OSError, ValueError, KeyError):
+        return None
+    return ColumnarTable(table, arrays, meta["categories"])
+
+def save_cached_table(path: str, loaded: ColumnarTable, fingerprint: str):
+    # Build in a temporary directory and swap it in, so a half-written cache is never loaded
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    column_names = list(loaded.columns)
+    for i, column in enumerate(column_names):
+        np.save(os.path.join(tmp_path, f"{i}.npy"), loaded.columns[column])
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({
+            "format": CACHE_FORMAT,
+            "version": CACHE_VERSION,
+            "fingerprint": fingerprint,
+            "columns": column_names,
+            "categories": loaded.categories,
+        }, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+def load_table(db: ReadOnlyDb, table: str, columns: List[Tuple[str, str]], chunk_rows: int = CHUNK_ROWS, cache_dir: Optional[str] = None) -> ColumnarTable:
+    # columns is a list of (column name, kind).
+    # With a cache_dir, the result is saved there and memory-mapped back on later calls until the DB changes.
+    for column, kind in columns:
+        if kind not in COLUMN_KINDS:
+            raise ValueError(f"Column {column} has unknown kind {kind}, expected one of {COLUMN_KINDS}")
+    if cache_dir is None:
+        return load_table_from_db(db, table, columns, chunk_rows)
+
+    fingerprint = db_content_fingerprint(db.path)
+    path = cache_dir_for(cache_dir, db.path, table, columns)
+    cached = load_cached_table(path, table, fingerprint)
+    if cached is not None:
+        return cached
+    loaded = load_table_from_db(db, table, columns, chunk_rows)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_cached_table(path, loaded, fingerprint)
+    return loaded
+
+def group_counts(keys: Sequence[np.ndarray]) -> Tuple[List[np.ndarray], np.ndarray]:
+    # Vectorized GROUP BY keys[0], keys[1], ...: returns (the distinct key combinations, one array per key, and their counts),
+    # sorted by keys[0] then keys[1] etc.
+    n = len(keys[0])
+    if n == 0:
+        return [k[:0] for k in keys], np.zeros(0, dtype=np.int64)
+    # lexsort sorts by the last key first
+    order = np.lexsort(tuple(reversed(keys)))
+    sorted_keys = [k[order] for k in keys]
+    changes = np.zeros(n, dtype=np.bool_)
+    changes[0] = True
+    for k in sorted_keys:
+        changes[1:] |= k[1:] != k[:-1]
+    starts = np.flatnonzero(changes)
+    counts = np.diff(np.append(starts, n))
+    return [k[starts] for k in sorted_keys], counts
+
+def shader_draw_distributions(db: ReadOnlyDb, cache_dir: Optional[str] = None) -> Dict[Optional[str], Dict[Tuple[int, int, int], int]]:
+    # {shader: {(VertLayoutFlags, BytesPerVert, MatrixCount): number of draws}} over the whole DrawCalls table.
+    # Draws whose AttribSet has a NULL Shader are under None, like in a plain SQL GROUP BY.
+    attribsets = load_table(db, "AttribSet", [("Shader", CATEGORY)], cache_dir=cache_dir)
+    draws = load_table(db, "DrawCalls", [("AttribSetId", INT), ("VertLayoutFlags", FLAGS), ("BytesPerVert", INT), ("MatrixCount", INT)], cache_dir=cache_dir)
+    # Like the INNER JOIN it replaces, draws without a matching AttribSet are left out
+    rows, found = attribsets.find_rows(draws["AttribSetId"])
+    draw_shaders = attribsets["Shader"][rows[found]]
+    (shader_codes, vlf, bpv, matrix_count), counts = group_counts([draw_shaders, draws["VertLayoutFlags"][found], draws["BytesPerVert"][found], draws["MatrixCount"][found]])
+
+    shader_names = attribsets.categories["Shader"]
+    distributions: Dict[Optional[str], Dict[Tuple[int, int, int], int]] = {}
+    for shader_code, draw_vlf, draw_bpv, draw_matrices, count in zip(shader_codes.tolist(), vlf.tolist(), bpv.tolist(), matrix_count.tolist(), counts.tolist()):
+        distributions.setdefault(None if shader_code < 0 else shader_names[shader_code], {})[(draw_vlf, draw_bpv, draw_matrices)] = count
+    return distributions
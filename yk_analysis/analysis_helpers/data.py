@@ -1,14 +1,358 @@
-
 from dataclasses import dataclass
-from typing import Any, Dict, List, Set, Tuple
+import json
+import os
+import sys
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, TextIO, Tuple, Union
+
+if TYPE_CHECKING:
+    import numpy as np
 
 
 @dataclass
 class ShaderAggregate:
-    shader: str
+    shader: Optional[str] # None for AttribSets with a NULL Shader
     flags: Set[int]
     textures: List[bool]
     material: Dict[str, Any]
     extra_properties: List[bool] # 16 bools, extra_properties[i] = True if for any attribset using this shader extra_properties[i] != 0
     vertex_format: Set[Tuple[int, int]]
-    uses_matrices: Set[bool]
\ No newline at end of file
+    uses_matrices: Set[bool]
+
+
+# Material key tuples are interned, so every CompactShaderAggregate with the same material layout shares one tuple
+interned_material_keys: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+def intern_material_keys(keys: Iterable[str]) -> Tuple[str, ...]:
+    key_tuple = tuple(keys)
+    interned = interned_material_keys.get(key_tuple)
+    if interned is None:
+        interned = tuple(sys.intern(k) for k in key_tuple)
+        interned_material_keys[interned] = interned
+    return interned
+
+class CompactShaderAggregate:
+    # Same contents as ShaderAggregate, for holding, pickling and comparing many aggregates at once.
+    # The fixed-width bool lists are bitmasks (bit i = element i), the material is an interned key tuple
+    # plus a bitmask of which keys are truthy, and the sets are sorted tuples.
+    # uses_matrices is a bitmask where bit 0 = used unskinned, bit 1 = used skinned, like in reports.
+    #
+    # The ShaderAggregate fields are available as read-only properties, which build a fresh list/set/dict on each access.
+    __slots__ = ("shader", "flag_values", "textures_mask", "material_keys", "material_mask",
+                 "extra_properties_mask", "vertex_format_values", "uses_matrices_mask")
+
+    shader: Optional[str]
+    flag_values: Tuple[int, ...]
+    textures_mask: int
+    material_keys: Tuple[str, ...]
+    material_mask: int
+    extra_properties_mask: int
+    vertex_format_values: Tuple[Tuple[int, int], ...]
+    uses_matrices_mask: int
+
+    def __init__(self, shader: Optional[str], flag_values: Tuple[int, ...], textures_mask: int,
+                 material_keys: Tuple[str, ...], material_mask: int, extra_properties_mask: int,
+                 vertex_format_values: Tuple[Tuple[int, int], ...], uses_matrices_mask: int):
+        self.shader = shader
+        self.flag_values = flag_values
+        self.textures_mask = textures_mask
+        self.material_keys = intern_material_keys(material_keys)
+        self.material_mask = material_mask
+        self.extra_properties_mask = extra_properties_mask
+        self.vertex_format_values = vertex_format_values
+        self.uses_matrices_mask = uses_matrices_mask
+
+    @staticmethod
+    def from_aggregate(s: ShaderAggregate) -> 'CompactShaderAggregate':
+        return CompactShaderAggregate(
+            shader=s.shader,
+            flag_values=tuple(sorted(s.flags)),
+            textures_mask=bools_to_bitmask(s.textures),
+            material_keys=tuple(s.material.keys()),
+            material_mask=bools_to_bitmask([bool(v) for v in s.material.values()]),
+            extra_properties_mask=bools_to_bitmask(s.extra_properties),
+            vertex_format_values=tuple(sorted(s.vertex_format)),
+            uses_matrices_mask=bools_to_bitmask([False in s.uses_matrices, True in s.uses_matrices]),
+        )
+
+    def to_aggregate(self) -> ShaderAggregate:
+        return ShaderAggregate(
+            shader=self.shader,
+            flags=self.flags,
+            textures=self.textures,
+            material=self.material,
+            extra_properties=self.extra_properties,
+            vertex_format=self.vertex_format,
+            uses_matrices=self.uses_matrices,
+        )
+
+    @property
+    def flags(self) -> Set[int]:
+        return set(self.flag_values)
+
+    @property
+    def textures(self) -> List[bool]:
+        return bitmask_to_bools(self.textures_mask, 8)
+
+    @property
+    def material(self) -> Dict[str, Any]:
+        return {k: bool((self.material_mask >> i) & 1) for i, k in enumerate(self.material_keys)}
+
+    @property
+    def extra_properties(self) -> List[bool]:
+        return bitmask_to_bools(self.extra_properties_mask, 16)
+
+    @property
+    def vertex_format(self) -> Set[Tuple[int, int]]:
+        return set(self.vertex_format_values)
+
+    @property
+    def uses_matrices(self) -> Set[bool]:
+        return {b for i, b in enumerate((False, True)) if (self.uses_matrices_mask >> i) & 1}
+
+    def astuple(self) -> Tuple:
+        return tuple(getattr(self, slot) for slot in CompactShaderAggregate.__slots__)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CompactShaderAggregate):
+            return NotImplemented
+        return (self.shader == other.shader and self.flag_values == other.flag_values
+                and self.textures_mask == other.textures_mask and self.material_mask == other.material_mask
+                and self.extra_properties_mask == other.extra_properties_mask
+                and self.uses_matrices_mask == other.uses_matrices_mask
+                and (self.material_keys is other.material_keys or self.material_keys == other.material_keys)
+                and self.vertex_format_values == other.vertex_format_values)
+
+    def __hash__(self) -> int:
+        return hash(self.astuple())
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{slot}={getattr(self, slot)!r}" for slot in CompactShaderAggregate.__slots__)
+        return f"CompactShaderAggregate({fields})"
+
+    def __getstate__(self) -> Tuple:
+        return self.astuple()
+
+    def __setstate__(self, state: Tuple):
+        for slot, value in zip(CompactShaderAggregate.__slots__, state):
+            setattr(self, slot, value)
+        # Unpickled tuples are fresh copies, share them again
+        self.material_keys = intern_material_keys(self.material_keys)
+
+AnyShaderAggregate = Union[ShaderAggregate, CompactShaderAggregate]
+
+# Bulk conversion between CompactShaderAggregates and NumPy arrays, one element per shader.
+# The variable-length flags and vertex formats are flattened into one values array each,
+# with an offsets array where shader i's values are values[offsets[i]:offsets[i + 1]].
+# Materials are stored as an index into the list of distinct material key tuples plus a truthiness bitmask,
+# which limits them to 64 keys.
+# NumPy is only imported by these, so the report CLIs don't pay for it.
+MATERIAL_MASK_BITS = 64
+
+def compact_aggregates_to_arrays(shaders: Sequence[CompactShaderAggregate]) -> Tuple[Dict[str, 'np.ndarray'], List[Tuple[str, ...]]]:
+    # Returns (arrays, material key tuples)
+    import numpy as np
+    material_key_index: Dict[Tuple[str, ...], int] = {}
+    for s in shaders:
+        if len(s.material_keys) > MATERIAL_MASK_BITS:
+            raise ValueError(f"Shader {s.shader} has {len(s.material_keys)} material keys, only {MATERIAL_MASK_BITS} fit in an array")
+        material_key_index.setdefault(s.material_keys, len(material_key_index))
+
+    flag_counts = np.fromiter((len(s.flag_values) for s in shaders), dtype=np.int64, count=len(shaders))
+    vertex_format_counts = np.fromiter((len(s.vertex_format_values) for s in shaders), dtype=np.int64, count=len(shaders))
+    arrays = {
+        "shader": np.array([s.shader for s in shaders], dtype=np.str_),
+        "textures": np.fromiter((s.textures_mask for s in shaders), dtype=np.uint8, count=len(shaders)),
+        "material_keys": np.fromiter((material_key_index[s.material_keys] for s in shaders), dtype=np.int32, count=len(shaders)),
+        "material": np.fromiter((s.material_mask for s in shaders), dtype=np.uint64, count=len(shaders)),
+        "extra_properties": np.fromiter((s.extra_properties_mask for s in shaders), dtype=np.uint16, count=len(shaders)),
+        "uses_matrices": np.fromiter((s.uses_matrices_mask for s in shaders), dtype=np.uint8, count=len(shaders)),
+        "flag_offsets": np.concatenate(([0], np.cumsum(flag_counts))),
+        "flags": np.fromiter((f for s in shaders for f in s.flag_values), dtype=np.uint64, count=int(flag_counts.sum())),
+        "vertex_format_offsets": np.concatenate(([0], np.cumsum(vertex_format_counts))),
+        "vertex_format": np.array([vf for s in shaders for vf in s.vertex_format_values], dtype=np.uint64).reshape(-1, 2),
+    }
+    return arrays, list(material_key_index)
+
+def compact_aggregates_from_arrays(arrays: Dict[str, 'np.ndarray'], material_keys: List[Tuple[str, ...]]) -> List[CompactShaderAggregate]:
+    flag_offsets = arrays["flag_offsets"].tolist()
+    flags = arrays["flags"].tolist()
+    vertex_format_offsets = arrays["vertex_format_offsets"].tolist()
+    vertex_format = [tuple(vf) for vf in arrays["vertex_format"].tolist()]
+    material_keys = [intern_material_keys(keys) for keys in material_keys]
+    return [
+        CompactShaderAggregate(
+            shader=shader,
+            flag_values=tuple(flags[flag_offsets[i]:flag_offsets[i + 1]]),
+            textures_mask=textures,
+            material_keys=material_keys[material_key_index],
+            material_mask=material,
+            extra_properties_mask=extra_properties,
+            vertex_format_values=tuple(vertex_format[vertex_format_offsets[i]:vertex_format_offsets[i + 1]]),
+            uses_matrices_mask=uses_matrices,
+        )
+        for i, (shader, textures, material_key_index, material, extra_properties, uses_matrices) in enumerate(zip(
+            arrays["shader"].tolist(), arrays["textures"].tolist(), arrays["material_keys"].tolist(),
+            arrays["material"].tolist(), arrays["extra_properties"].tolist(), arrays["uses_matrices"].tolist(),
+        ))
+    ]
+
+
+# Shader analysis reports are JSON Lines files.
+# The first line is a header identifying the format and version, every following line is one ShaderAggregate.
+# Sets are stored as sorted lists, and fixed-width bool lists are stored as integer bitmasks (bit i = element i).
+# uses_matrices is stored as a bitmask where bit 0 = used unskinned, bit 1 = used skinned.
+# Aggregates are always written in report_sort_key order, so readers can stream them.
+REPORT_FORMAT = "yk_shader_report"
+REPORT_VERSION = 1
+
+# AttribSet.Shader can be NULL, which is aggregated like any other shader and stored as null in reports
+NULL_SHADER_NAME = "(NULL shader)"
+
+def report_sort_key(shader: Optional[str]) -> Tuple:
+    # Order by name ignoring the two-character shader type prefix, so related shaders end up next to each other.
+    # The full name breaks ties. A NULL shader comes before every named one.
+    if shader is None:
+        return (0, "", "")
+    return (1, shader[2:], shader)
+
+def shader_display_name(shader: Optional[str]) -> str:
+    return NULL_SHADER_NAME if shader is None else shader
+
+def bools_to_bitmask(bools: List[bool]) -> int:
+    mask = 0
+    for i, b in enumerate(bools):
+        if b:
+            mask |= 1 << i
+    return mask
+
+def bitmask_to_bools(mask: int, length: int) -> List[bool]:
+    return [bool((mask >> i) & 1) for i in range(length)]
+
+def shader_aggregate_to_record(s: AnyShaderAggregate) -> Dict[str, Any]:
+    if isinstance(s, CompactShaderAggregate):
+        return {
+            "shader": s.shader,
+            "flags": list(s.flag_values),
+            "textures": s.textures_mask,
+            "material": s.material,
+            "extra_properties": s.extra_properties_mask,
+            "vertex_format": list(s.vertex_format_values),
+            "uses_matrices": s.uses_matrices_mask,
+        }
+    return {
+        "shader": s.shader,
+        "flags": sorted(s.flags),
+        "textures": bools_to_bitmask(s.textures),
+        "material": s.material,
+        "extra_properties": bools_to_bitmask(s.extra_properties),
+        "vertex_format": sorted(s.vertex_format),
+        "uses_matrices": bools_to_bitmask([False in s.uses_matrices, True in s.uses_matrices]),
+    }
+
+def shader_aggregate_from_record(record: Dict[str, Any]) -> ShaderAggregate:
+    uses_matrices = record["uses_matrices"]
+    return ShaderAggregate(
+        shader=record["shader"],
+        flags=set(record["flags"]),
+        textures=bitmask_to_bools(record["textures"], 8),
+        material=record["material"],
+        extra_properties=bitmask_to_bools(record["extra_properties"], 16),
+        vertex_format={(vlf, bpv) for (vlf, bpv) in record["vertex_format"]},
+        uses_matrices={b for i, b in enumerate((False, True)) if (uses_matrices >> i) & 1},
+    )
+
+def compact_shader_aggregate_from_record(record: Dict[str, Any]) -> CompactShaderAggregate:
+    # Reports already store the fixed-width fields as bitmasks, so they're used as-is
+    material = record["material"]
+    return CompactShaderAggregate(
+        shader=record["shader"],
+        flag_values=tuple(sorted(record["flags"])),
+        textures_mask=record["textures"],
+        material_keys=tuple(material.keys()),
+        material_mask=bools_to_bitmask([bool(v) for v in material.values()]),
+        extra_properties_mask=record["extra_properties"],
+        vertex_format_values=tuple(sorted((vlf, bpv) for (vlf, bpv) in record["vertex_format"])),
+        uses_matrices_mask=record["uses_matrices"],
+    )
+
+class ReportWriter:
+    f: TextIO
+    last_key: Optional[Tuple]
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.last_key = None
+        f.write(json.dumps({"format": REPORT_FORMAT, "version": REPORT_VERSION}) + "\n")
+
+    def write(self, s: AnyShaderAggregate):
+        key = report_sort_key(s.shader)
+        if self.last_key is not None and key <= self.last_key:
+            raise ValueError(f"Shader {shader_display_name(s.shader)} written out of order - reports must be sorted by report_sort_key")
+        self.last_key = key
+        self.f.write(json.dumps(shader_aggregate_to_record(s), separators=(",", ":")) + "\n")
+
+def iter_report(f: TextIO, compact: bool = False) -> Iterator[AnyShaderAggregate]:
+    # Streams ShaderAggregates out of a report one line at a time, in report_sort_key order.
+    # With compact=True they're CompactShaderAggregates instead.
+    header_line = f.readline()
+    try:
+        header = json.loads(header_line)
+    except json.JSONDecodeError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != REPORT_FORMAT:
+        raise ValueError(f"{getattr(f, 'name', 'File')} is not a shader analysis report - reports from before the versioned format need to be regenerated with analyse_shaders.py")
+    if header.get("version") != REPORT_VERSION:
+        raise ValueError(f"Report version {header.get('version')} doesn't match supported version {REPORT_VERSION}")
+
+    from_record = compact_shader_aggregate_from_record if compact else shader_aggregate_from_record
+    for l in f:
+        if l.strip():
+            yield from_record(json.loads(l))
+
+
+# Incremental analysis keeps a fingerprint of each shader's DB rows next to the report (see analyse_shaders.shader_fingerprints),
+# as {"format", "version", "report_version", "shaders": {shader: fingerprint}, "null_shader": fingerprint or null}.
+# JSON object keys can't be null, so the NULL shader's fingerprint is stored on its own.
+REPORT_FINGERPRINTS_FORMAT = "yk_shader_report_fingerprints"
+REPORT_FINGERPRINTS_VERSION = 2
+
+def report_fingerprints_path(report_path: str) -> str:
+    return f"{report_path}.fingerprints.json"
+
+def load_report_fingerprints(report_path: str) -> Optional[Dict[Optional[str], str]]:
+    # Returns None if the report or its fingerprints are missing or out of date
+    if not os.path.exists(report_path):
+        return None
+    try:
+        with open(report_fingerprints_path(report_path), "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(data, dict)
+            or data.get("format") != REPORT_FINGERPRINTS_FORMAT
+            or data.get("version") != REPORT_FINGERPRINTS_VERSION
+            or data.get("report_version") != REPORT_VERSION):
+        return None
+    fingerprints: Dict[Optional[str], str] = dict(data["shaders"])
+    if data.get("null_shader") is not None:
+        fingerprints[None] = data["null_shader"]
+    return fingerprints
+
+def save_report_fingerprints(report_path: str, fingerprints: Dict[Optional[str], str]):
+    data = {
+        "format": REPORT_FINGERPRINTS_FORMAT,
+        "version": REPORT_FINGERPRINTS_VERSION,
+        "report_version": REPORT_VERSION,
+        "shaders": {shader: fingerprint for shader, fingerprint in fingerprints.items() if shader is not None},
+        "null_shader": fingerprints.get(None),
+    }
+    tmp_path = f"{report_fingerprints_path(report_path)}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, report_fingerprints_path(report_path))
+
+def remove_report_fingerprints(report_path: str):
+    try:
+        os.remove(report_fingerprints_path(report_path))
+    except FileNotFoundError:
+        pass
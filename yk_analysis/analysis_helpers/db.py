@@ -1,12 +1,182 @@
+from hashlib import sha256
+import os
 import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# How much of each end of a DB file goes into db_content_fingerprint
+FINGERPRINT_SAMPLE_BYTES = 64 * 1024
+
+def db_content_fingerprint(path: str) -> str:
+    # Cheap fingerprint of a DB file's contents, for invalidating anything derived from it.
+    # Hashes the file size and the first and last 64KiB - the start holds the SQLite header
+    # (including the change counter) and schema, and appended rows change the size and end.
+    size = os.path.getsize(path)
+    h = sha256()
+    h.update(size.to_bytes(8, "little"))
+    with open(path, "rb") as f:
+        h.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+        if size > FINGERPRINT_SAMPLE_BYTES:
+            f.seek(max(FINGERPRINT_SAMPLE_BYTES, size - FINGERPRINT_SAMPLE_BYTES))
+            h.update(f.read())
+    return h.hexdigest()
+
+# Read-optimized copy of a DB built by prepare_db.py, see analysis_helpers/sidecar.py
+def sidecar_db_path(path: str) -> str:
+    return f"{path}.ro.sqlite"
+
+def read_only_uri(path: str, immutable: bool = False) -> str:
+    # immutable=1 tells SQLite the file can't change underneath it, so it skips all locking and change detection.
+    # Only use it for DBs nothing else is writing to.
+    uri = f"file:{path}?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+    return uri
+
+def connect_read_only(path: str, immutable: bool = False, cached_statements: int = 128) -> sqlite3.Connection:
+    return sqlite3.Connection(read_only_uri(path, immutable), uri=True, cached_statements=cached_statements)
+
+def open_sidecar_db(path: str, immutable: bool = False, cached_statements: int = 128) -> Optional[sqlite3.Connection]:
+    # Returns a connection to the sidecar for the DB at path, if one exists and was built from the current contents of path.
+    sidecar_path = sidecar_db_path(path)
+    if not os.path.exists(sidecar_path):
+        return None
+    conn = connect_read_only(sidecar_path, immutable, cached_statements)
+    try:
+        (fingerprint,) = conn.execute("SELECT Fingerprint FROM SidecarSource").fetchone()
+    except (sqlite3.Error, TypeError):
+        fingerprint = None
+    if fingerprint != db_content_fingerprint(path):
+        print(f"Ignoring out of date sidecar {sidecar_path}, rerun prepare_db.py to rebuild it", file=sys.stderr)
+        conn.close()
+        return None
+    return conn
+
+@dataclass
+class QueryStats:
+    calls: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+    # Parameters of the first call, used for EXPLAIN QUERY PLAN
+    example_params: Tuple = ()
 
 class ReadOnlyDb:
+    path: str
+    immutable: bool
+    mmap_size: int
+    cache_size_kib: Optional[int]
+    attached: Dict[str, str]
     conn: sqlite3.Connection
     cur: sqlite3.Cursor
     version: int
-    def __init__(self, path, expected_version):
-        self.conn = sqlite3.Connection(f"file:{path}?mode=ro", uri=True)
+    using_sidecar: bool
+    profile: bool
+    query_stats: Dict[str, QueryStats]
+    def __init__(self, path, expected_version, use_sidecar: bool = True,
+                 immutable: bool = False, mmap_size: int = 0, cache_size_kib: Optional[int] = None,
+                 cached_statements: int = 128, profile: bool = False):
+        self.path = path
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.attached = {}
+        # If prepare_db.py has built an up-to-date sidecar for this DB, transparently read from that instead.
+        # It has the same tables and contents, plus indexes for the queries the analysis tools run.
+        sidecar_conn = open_sidecar_db(path, immutable, cached_statements) if use_sidecar else None
+        self.using_sidecar = sidecar_conn is not None
+        if sidecar_conn is not None:
+            self.conn = sidecar_conn
+        else:
+            self.conn = connect_read_only(path, immutable, cached_statements)
+        # Memory-map up to mmap_size bytes of the DB instead of read()ing pages into the page cache
+        if mmap_size:
+            self.conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+        if cache_size_kib is not None:
+            # Negative cache_size = size in KiB instead of in pages
+            self.conn.execute(f"PRAGMA cache_size = {-int(cache_size_kib)}")
+        self.profile = profile
+        self.query_stats = {}
         self.cur = self.conn.cursor()
         self.version = self.cur.execute("SELECT user_version FROM pragma_user_version").fetchone()[0]
         if self.version != expected_version:
-            raise RuntimeError(f"DB user_version {self.version} doesn't match requested version {expected_version}")
\ No newline at end of file
+            raise RuntimeError(f"DB user_version {self.version} doesn't match requested version {expected_version}")
+
+    def attach(self, path: str, schema: str, expected_version: int, use_sidecar: bool = True):
+        # ATTACHes another read-only DB as `schema`, so one query can read several DBs (e.g. UNION ALL over several games' tables).
+        # It's opened with the same options as the main DB, and its sidecar is used instead if it's up to date.
+        # SQLite allows 10 attached DBs by default.
+        if schema in self.attached or schema in ("main", "temp"):
+            raise ValueError(f"Schema {schema} is already in use")
+        quoted_schema = '"' + schema.replace('"', '""') + '"'
+        attached_path = path
+        if use_sidecar and os.path.exists(sidecar_db_path(path)):
+            self.conn.execute(f"ATTACH DATABASE ? AS {quoted_schema}", (read_only_uri(sidecar_db_path(path), self.immutable),))
+            try:
+                (fingerprint,) = self.conn.execute(f"SELECT Fingerprint FROM {quoted_schema}.SidecarSource").fetchone()
+            except (sqlite3.Error, TypeError):
+                fingerprint = None
+            if fingerprint == db_content_fingerprint(path):
+                attached_path = sidecar_db_path(path)
+            else:
+                print(f"Ignoring out of date sidecar {sidecar_db_path(path)}, rerun prepare_db.py to rebuild it", file=sys.stderr)
+                self.conn.execute(f"DETACH DATABASE {quoted_schema}")
+        if attached_path == path:
+            self.conn.execute(f"ATTACH DATABASE ? AS {quoted_schema}", (read_only_uri(path, self.immutable),))
+
+        (version,) = self.conn.execute(f"PRAGMA {quoted_schema}.user_version").fetchone()
+        if version != expected_version:
+            self.conn.execute(f"DETACH DATABASE {quoted_schema}")
+            raise RuntimeError(f"DB {path} user_version {version} doesn't match requested version {expected_version}")
+        if self.mmap_size:
+            self.conn.execute(f"PRAGMA {quoted_schema}.mmap_size = {int(self.mmap_size)}")
+        if self.cache_size_kib is not None:
+            self.conn.execute(f"PRAGMA {quoted_schema}.cache_size = {-int(self.cache_size_kib)}")
+        self.attached[schema] = attached_path
+
+    def cursor(self) -> sqlite3.Cursor:
+        # Independent cursor, for running queries alongside ones already in progress on self.cur
+        return self.conn.cursor()
+
+    def query(self, sql: str, params: Tuple = (), num_of_rows: int = 1000) -> Iterator[Tuple]:
+        # Streams the rows of a query on its own cursor, so several queries can be iterated at once.
+        # If profiling is enabled, the time spent inside SQLite and the number of rows are recorded per query string.
+        cursor = self.conn.cursor()
+        if not self.profile:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(num_of_rows)
+                if not rows: break
+                yield from rows
+            return
+
+        stats = self.query_stats.get(sql)
+        if stats is None:
+            stats = QueryStats(example_params=tuple(params))
+            self.query_stats[sql] = stats
+        stats.calls += 1
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        stats.seconds += time.perf_counter() - start
+        while True:
+            start = time.perf_counter()
+            rows = cursor.fetchmany(num_of_rows)
+            stats.seconds += time.perf_counter() - start
+            if not rows: break
+            stats.rows += len(rows)
+            yield from rows
+
+    def explain(self, sql: str, params: Tuple = ()) -> List[str]:
+        return [
+            detail
+            for (_id, _parent, _notused, detail) in self.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        ]
+
+    def print_profile(self, file=sys.stdout):
+        # Prints the per-query counters collected by query(), slowest first, with each query's plan
+        print(f"{'Calls': >8}\t{'Rows': >10}\t{'Seconds': >9}\t{'ms/call': >9}\tQuery", file=file)
+        for sql, stats in sorted(self.query_stats.items(), key=lambda item: item[1].seconds, reverse=True):
+            print(f"{stats.calls: >8}\t{stats.rows: >10}\t{stats.seconds: >9.3f}\t{1000 * stats.seconds / stats.calls: >9.3f}\t{' '.join(sql.split())}", file=file)
+            for detail in self.explain(sql, stats.example_params):
+                print(f"\t\t\t\t\t{detail}", file=file)
@@ -0,0 +1,141 @@
+import sys
+from typing import Callable, Dict, List, NamedTuple, Optional, TextIO, Tuple
+import numpy as np
+from yk_analysis.analysis_helpers.columnar import CATEGORY, FLAGS, INT, ColumnarTable, group_counts, load_table
+from yk_analysis.analysis_helpers.data import NULL_SHADER_NAME, report_sort_key
+from yk_analysis.analysis_helpers.db import ReadOnlyDb
+from yk_analysis.analysis_helpers.vertex import GMDVertexBufferLayout
+
+# Invariants we expect the game data to follow, checked over whole tables at once with the columnar loader.
+#
+# Each invariant looks at some columns of AttribSet or DrawCalls, grouped by shader.
+# Either every shader must only use one combination of the columns' values,
+# or each combination must pass an `allowed` test (vectorized, over arrays of distinct combinations).
+# Every violating shader is reported, with the number of rows using each offending combination.
+
+class Invariant(NamedTuple):
+    name: str
+    table: str
+    columns: Tuple[str, ...]
+    allowed: Optional[Callable[..., np.ndarray]] = None
+
+# Columns available to invariants.
+# DrawCalls also has Skinned (MatrixCount > 0), LayoutStride (GMDVertexBufferLayout.stride() of VertLayoutFlags, -1 if it doesn't decode)
+# and AttribSetFound (whether AttribSetId refers to an AttribSet row).
+# Draws without an AttribSet have no shader, so they're left out of every invariant that doesn't use AttribSetFound.
+ATTRIBSET_COLUMNS = [("Shader", CATEGORY), ("Flags", FLAGS)]
+DRAWCALLS_COLUMNS = [("AttribSetId", INT), ("VertLayoutFlags", FLAGS), ("BytesPerVert", INT), ("MatrixCount", INT)]
+
+INVARIANTS = [
+    Invariant("Shaders use one set of AttribSet flags", "AttribSet", ("Flags",)),
+    Invariant("DrawCalls.AttribSetId refers to an AttribSet row", "DrawCalls", ("AttribSetId", "AttribSetFound"),
+              allowed=lambda attribset_id, found: found),
+    Invariant("Shaders use one vertex layout", "DrawCalls", ("VertLayoutFlags", "BytesPerVert")),
+    Invariant("Shaders are either skinned or unskinned", "DrawCalls", ("Skinned",)),
+    Invariant("VertLayoutFlags decode to a vertex layout", "DrawCalls", ("VertLayoutFlags", "LayoutStride"),
+              allowed=lambda vlf, stride: stride >= 0),
+    # Undecodable layouts are already reported above
+    Invariant("BytesPerVert matches the vertex layout stride", "DrawCalls", ("VertLayoutFlags", "BytesPerVert", "LayoutStride"),
+              allowed=lambda vlf, bpv, stride: (stride < 0) | (bpv == stride)),
+]
+
+COLUMN_FORMATTERS: Dict[str, Callable[[int], str]] = {
+    "Flags": lambda v: f"0x{v:08x}",
+    "VertLayoutFlags": lambda v: f"0x{v:08x}",
+    "BytesPerVert": lambda v: f"{v:d} bytes",
+    "Skinned": lambda v: "skinned" if v else "unskinned",
+    "LayoutStride": lambda v: f"stride {v:d}" if v >= 0 else "doesn't decode",
+    "AttribSetId": lambda v: f"AttribSetId {v:d}",
+    "AttribSetFound": lambda v: "found" if v else "missing",
+}
+
+ROW_NAMES = {"AttribSet": "AttribSets", "DrawCalls": "draws"}
+
+# Shader codes in the "Shader" columns, besides indices into the shader names.
+# NULL_SHADER_CODE is what the columnar loader gives NULL categories.
+NULL_SHADER_CODE = -1
+MISSING_ATTRIBSET_CODE = -2
+MISSING_ATTRIBSET_NAME = "(no AttribSet)"
+
+class InvariantResult(NamedTuple):
+    invariant: Invariant
+    # {shader: [(values of invariant.columns, number of rows using them)]} in report_sort_key order
+    violations: Dict[str, List[Tuple[Tuple[int, ...], int]]]
+
+def layout_strides(vertex_layout_flags: np.ndarray) -> np.ndarray:
+    unique_flags, layout_indices = np.unique(vertex_layout_flags, return_inverse=True)
+    strides = []
+    for flags in unique_flags.tolist():
+        try:
+            strides.append(GMDVertexBufferLayout.build_vertex_buffer_layout_from_flags(flags).stride())
+        except (ValueError, RuntimeError):
+            strides.append(-1)
+    return np.array(strides, dtype=np.int64)[layout_indices.reshape(-1)]
+
+def load_invariant_columns(db: ReadOnlyDb, cache_dir: Optional[str]) -> Tuple[List[str], Dict[str, Dict[str, np.ndarray]]]:
+    # Returns (shader names, {table: {column: per-row array}}), where the "Shader" column holds indices into shader names
+    attribsets: ColumnarTable = load_table(db, "AttribSet", ATTRIBSET_COLUMNS, cache_dir=cache_dir)
+    draws: ColumnarTable = load_table(db, "DrawCalls", DRAWCALLS_COLUMNS, cache_dir=cache_dir)
+    attribset_rows, attribset_found = attribsets.find_rows(draws["AttribSetId"])
+    draw_shaders = np.full(len(draws), MISSING_ATTRIBSET_CODE, dtype=np.int32)
+    draw_shaders[attribset_found] = attribsets["Shader"][attribset_rows[attribset_found]]
+    return attribsets.categories["Shader"], {
+        "AttribSet": {
+            "Shader": attribsets["Shader"],
+            "Flags": attribsets["Flags"],
+        },
+        "DrawCalls": {
+            "Shader": draw_shaders,
+            "AttribSetId": draws["AttribSetId"],
+            "AttribSetFound": attribset_found,
+            "VertLayoutFlags": draws["VertLayoutFlags"],
+            "BytesPerVert": draws["BytesPerVert"],
+            "Skinned": draws["MatrixCount"] > 0,
+            "LayoutStride": layout_strides(draws["VertLayoutFlags"]),
+        },
+    }
+
+def check_invariants(db: ReadOnlyDb, invariants: List[Invariant] = INVARIANTS, cache_dir: Optional[str] = None) -> List[InvariantResult]:
+    shader_names, tables = load_invariant_columns(db, cache_dir)
+    results = []
+    for invariant in invariants:
+        table = tables[invariant.table]
+        columns = [table["Shader"]] + [table[c] for c in invariant.columns]
+        if "AttribSetFound" in table and "AttribSetFound" not in invariant.columns:
+            columns = [column[table["AttribSetFound"]] for column in columns]
+        (shader_codes, *values), counts = group_counts(columns)
+        if invariant.allowed is None:
+            # group_counts sorts by shader, so each shader's combinations are contiguous and in the same order as np.unique's
+            _codes, n_combinations = np.unique(shader_codes, return_counts=True)
+            violating = np.repeat(n_combinations > 1, n_combinations)
+        else:
+            violating = ~np.asarray(invariant.allowed(*values), dtype=np.bool_)
+
+        violations: Dict[str, List[Tuple[Tuple[int, ...], int]]] = {}
+        for shader_code, *row_values, count in zip(shader_codes[violating].tolist(), *(v[violating].tolist() for v in values), counts[violating].tolist()):
+            if shader_code == NULL_SHADER_CODE:
+                shader_name = NULL_SHADER_NAME
+            elif shader_code == MISSING_ATTRIBSET_CODE:
+                shader_name = MISSING_ATTRIBSET_NAME
+            else:
+                shader_name = shader_names[shader_code]
+            violations.setdefault(shader_name, []).append((tuple(row_values), count))
+        results.append(InvariantResult(
+            invariant,
+            {shader_name: violations[shader_name] for shader_name in sorted(violations, key=report_sort_key)}
+        ))
+    return results
+
+def print_invariant_results(results: List[InvariantResult], file: TextIO = sys.stdout):
+    for result in results:
+        invariant = result.invariant
+        if not result.violations:
+            print(f"OK:   {invariant.name}", file=file)
+            continue
+        print(f"FAIL: {invariant.name} - {len(result.violations)} shaders", file=file)
+        rows = ROW_NAMES.get(invariant.table, "rows")
+        for shader_name, shader_violations in result.violations.items():
+            print(f"\tShader {shader_name}", file=file)
+            for values, count in shader_violations:
+                shown = "\t".join(COLUMN_FORMATTERS.get(c, str)(v) for c, v in zip(invariant.columns, values))
+                print(f"\t\t{shown}\t{count} {rows}", file=file)
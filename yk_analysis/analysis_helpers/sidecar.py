@@ -0,0 +1,177 @@
+import mmap
+import os
+import sqlite3
+import struct
+from typing import Optional, Set, Tuple
+from yk_analysis.analysis_helpers.db import db_content_fingerprint, sidecar_db_path
+
+# Read-optimized companions for the (read-only) game DBs, built by prepare_db.py.
+#
+# The sidecar DB (<db>.ro.sqlite) is a copy of every table, ROWIDs included, plus indexes on the keys our queries use.
+# ReadOnlyDb opens it instead of the original DB when it's up to date.
+#
+# The shader table (<db>.shaders.bin) is a sorted SHA256 -> (stage, encoding, category, name) table
+# which the RenderDoc plugin can mmap and binary search without SQLite.
+
+# (table, columns) for each index added to the sidecar, only created if the table has all the columns.
+# The ShaderBytes index covers every column the shader lookup reads, so it never touches the (large) table rows.
+SIDECAR_INDEXES = [
+    ("AttribSet", ["Shader"]),
+    ("DrawCalls", ["AttribSetId"]),
+    ("ShaderBytes", ["SHA256", "ShaderStage", "BytesType", "Category", "ShaderName"]),
+]
+
+def shader_table_path(path: str) -> str:
+    return f"{path}.shaders.bin"
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def build_sidecar_db(path: str):
+    fingerprint = db_content_fingerprint(path)
+    out_path = sidecar_db_path(path)
+    # Build into a temporary file, so a half-built sidecar is never picked up
+    tmp_path = f"{out_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    # uri=True so the source can be ATTACHed read-only
+    conn = sqlite3.connect(f"file:{tmp_path}", uri=True)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("ATTACH DATABASE ? AS src", (f"file:{path}?mode=ro",))
+    (user_version,) = conn.execute("PRAGMA src.user_version").fetchone()
+
+    tables = conn.execute("SELECT name, sql FROM src.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall()
+    for table, sql in tables:
+        # Reuse the original CREATE TABLE statement so column types and constraints match
+        conn.execute(sql)
+        columns = ", ".join(quote_identifier(name) for (_cid, name, *_rest) in conn.execute(f"PRAGMA src.table_info({quote_identifier(table)})"))
+        # Keep ROWIDs, because DrawCalls.AttribSetId refers to AttribSet.ROWID
+        conn.execute(f"INSERT INTO main.{quote_identifier(table)} (ROWID, {columns}) SELECT ROWID, {columns} FROM src.{quote_identifier(table)}")
+
+    for (sql,) in conn.execute("SELECT sql FROM src.sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall():
+        conn.execute(sql)
+    for table, index_columns in SIDECAR_INDEXES:
+        table_columns = set(name for (_cid, name, *_rest) in conn.execute(f"PRAGMA main.table_info({quote_identifier(table)})"))
+        if all(c in table_columns for c in index_columns):
+            index_name = quote_identifier(f"sidecar_{table}_{'_'.join(index_columns)}")
+            conn.execute(f"CREATE INDEX {index_name} ON {quote_identifier(table)} ({', '.join(quote_identifier(c) for c in index_columns)})")
+
+    conn.execute("CREATE TABLE SidecarSource(Fingerprint TEXT)")
+    conn.execute("INSERT INTO SidecarSource VALUES (?)", (fingerprint,))
+    conn.execute(f"PRAGMA user_version = {int(user_version)}")
+    conn.commit()
+    conn.execute("DETACH DATABASE src")
+    # Give the query planner statistics for the new indexes
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, out_path)
+
+
+# Shader table layout, all little-endian:
+# header: magic, format version, DB user_version, record count, source DB fingerprint (raw sha256)
+# records: sorted by (SHA256, key string), each (SHA256, key string offset, key string length)
+# strings: "ShaderStage\0BytesType\0Category\0ShaderName" in UTF-8, offsets are relative to the end of the records
+SHADER_TABLE_MAGIC = b"YKSHDTBL"
+SHADER_TABLE_VERSION = 1
+SHADER_TABLE_HEADER = struct.Struct("<8sIiI32s")
+SHADER_TABLE_RECORD = struct.Struct("<32sII")
+
+def build_shader_table(path: str) -> bool:
+    # Returns False without building anything if the DB has no ShaderBytes table, e.g. a GMD model DB
+    fingerprint = db_content_fingerprint(path)
+    conn = sqlite3.Connection(f"file:{path}?mode=ro", uri=True)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ShaderBytes'").fetchone() is None:
+        conn.close()
+        return False
+    (user_version,) = conn.execute("SELECT user_version FROM pragma_user_version").fetchone()
+    entries = sorted(
+        (bytes(digest), "\0".join((str(shader_stage), str(bytes_type), str(cat), str(s_name))).encode("utf-8"))
+        for (digest, shader_stage, bytes_type, cat, s_name) in conn.execute("SELECT DISTINCT SHA256, ShaderStage, BytesType, Category, ShaderName FROM ShaderBytes")
+    )
+    conn.close()
+
+    records = bytearray()
+    strings = bytearray()
+    for digest, key in entries:
+        records += SHADER_TABLE_RECORD.pack(digest, len(strings), len(key))
+        strings += key
+
+    out_path = shader_table_path(path)
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SHADER_TABLE_HEADER.pack(SHADER_TABLE_MAGIC, SHADER_TABLE_VERSION, user_version, len(entries), bytes.fromhex(fingerprint)))
+        f.write(records)
+        f.write(strings)
+    os.replace(tmp_path, out_path)
+    return True
+
+class ShaderHashTable:
+    # Memory-mapped view of a shader table file.
+    # Lookups binary search the fixed-size records, so nothing is parsed up front.
+    mm: mmap.mmap
+    user_version: int
+    count: int
+    fingerprint: bytes
+    strings_start: int
+
+    def __init__(self, table_path: str):
+        with open(table_path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.user_version, self.count, self.fingerprint = SHADER_TABLE_HEADER.unpack_from(self.mm, 0)
+        if magic != SHADER_TABLE_MAGIC or version != SHADER_TABLE_VERSION:
+            self.mm.close()
+            raise ValueError(f"{table_path} is not a version {SHADER_TABLE_VERSION} shader table")
+        self.strings_start = SHADER_TABLE_HEADER.size + self.count * SHADER_TABLE_RECORD.size
+
+    @staticmethod
+    def open_for_db(path: str, expected_version: int) -> Optional['ShaderHashTable']:
+        # Returns the shader table for the DB at path if it exists and was built from the DB's current contents
+        table_path = shader_table_path(path)
+        if not os.path.exists(table_path):
+            return None
+        table = ShaderHashTable(table_path)
+        if table.fingerprint.hex() != db_content_fingerprint(path) or table.user_version != expected_version:
+            table.close()
+            return None
+        return table
+
+    def close(self):
+        self.mm.close()
+
+    def digest_at(self, i: int) -> bytes:
+        start = SHADER_TABLE_HEADER.size + i * SHADER_TABLE_RECORD.size
+        return self.mm[start:start + 32]
+
+    def lookup(self, shader_stage: str, bytes_type: str, digest: bytes) -> Set[Tuple[str, str]]:
+        # Equivalent to SELECT Category, ShaderName FROM ShaderBytes WHERE ShaderStage = ? AND BytesType = ? AND SHA256 = ?
+        names: Set[Tuple[str, str]] = set()
+        # Find the first record with this digest
+        # (by hand, because RenderDoc's embedded Python may predate bisect's key argument)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.digest_at(mid) < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        i = lo
+        while i < self.count:
+            record_digest, offset, length = SHADER_TABLE_RECORD.unpack_from(self.mm, SHADER_TABLE_HEADER.size + i * SHADER_TABLE_RECORD.size)
+            if record_digest != digest:
+                break
+            start = self.strings_start + offset
+            record_stage, record_bytes_type, cat, s_name = self.mm[start:start + length].decode("utf-8").split("\0")
+            if record_stage == shader_stage and record_bytes_type == bytes_type:
+                names.add((cat, s_name))
+            i += 1
+        return names
+
+def prepare(path: str, shader_table: bool = True) -> bool:
+    # Returns whether a shader table was built
+    build_sidecar_db(path)
+    if shader_table:
+        return build_shader_table(path)
+    return False
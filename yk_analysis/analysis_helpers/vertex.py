@@ -2,9 +2,20 @@
 
 from dataclasses import dataclass
 from enum import Enum
+import functools
 import sys
-from typing import Iterable, Optional, Set, Tuple
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
 
+# NumPy is only imported by the array helpers that need it, so decoding layouts from flags
+# (e.g. in export_shader_analysis_report.py) doesn't pay for importing it.
+if TYPE_CHECKING:
+    import numpy as np
+
+@functools.lru_cache(maxsize=None)
+def endian_dtype(kind: str, big_endian: bool) -> 'np.dtype':
+    # e.g. endian_dtype("f2", True) = np.dtype(">f2")
+    import numpy as np
+    return np.dtype((">" if big_endian else "<") + kind)
 
 class VecCompFmt(Enum):
     Byte_0_1 = 0  # Fixed-point byte representation scaled between 0 and 1
@@ -23,25 +34,27 @@ class VecCompFmt(Enum):
             return 4
         raise RuntimeError(f"Nonexistent VecCompFmt called size_bytes: {self}")
 
-    # def numpy_native_dtype(self, big_endian: bool):
-    #     if self in [VecCompFmt.Byte_0_1, VecCompFmt.Byte_Minus1_1, VecCompFmt.Byte_0_255]:
-    #         return np.uint8
-    #     elif self == VecCompFmt.U16:
-    #         return BIG_ENDIAN_U16 if big_endian else LITTLE_ENDIAN_U16
-    #     elif self == VecCompFmt.Float16:
-    #         return BIG_ENDIAN_F16 if big_endian else LITTLE_ENDIAN_F16
-    #     elif self == VecCompFmt.Float32:
-    #         return BIG_ENDIAN_F32 if big_endian else LITTLE_ENDIAN_F32
-    #     raise RuntimeError(f"Nonexistent VecCompFmt called numpy_native_dtype: {self}")
-
-    # def numpy_transformed_dtype(self):
-    #     if self == VecCompFmt.Byte_0_255:
-    #         return np.uint8
-    #     elif self == VecCompFmt.U16:
-    #         return np.uint16
-    #     else:
-    #         # Upgrade Float16 to Float32 so we can manipulate it without rounding error
-    #         return np.float32
+    def numpy_native_dtype(self, big_endian: bool):
+        import numpy as np
+        if self in [VecCompFmt.Byte_0_1, VecCompFmt.Byte_Minus1_1, VecCompFmt.Byte_0_255]:
+            return np.uint8
+        elif self == VecCompFmt.U16:
+            return endian_dtype("u2", big_endian)
+        elif self == VecCompFmt.Float16:
+            return endian_dtype("f2", big_endian)
+        elif self == VecCompFmt.Float32:
+            return endian_dtype("f4", big_endian)
+        raise RuntimeError(f"Nonexistent VecCompFmt called numpy_native_dtype: {self}")
+
+    def numpy_transformed_dtype(self):
+        import numpy as np
+        if self == VecCompFmt.Byte_0_255:
+            return np.uint8
+        elif self == VecCompFmt.U16:
+            return np.uint16
+        else:
+            # Upgrade Float16 to Float32 so we can manipulate it without rounding error
+            return np.float32
 
 
 @dataclass(frozen=True)
@@ -55,67 +68,72 @@ class VecStorage:
     def native_size_bytes(self):
         return self.comp_fmt.native_size_bytes() * self.n_comps
 
-    # def numpy_native_dtype(self, big_endian: bool):
-    #     return np.dtype((self.comp_fmt.numpy_native_dtype(big_endian), self.n_comps))
-
-    # def numpy_transformed_dtype(self):
-    #     return np.dtype((self.comp_fmt.numpy_transformed_dtype(), self.n_comps))
-
-    # def preallocate(self, n_vertices: int) -> np.ndarray:
-    #     return np.zeros(
-    #         n_vertices,
-    #         dtype=self.numpy_transformed_dtype(),
-    #     )
-
-    # def transform_native_fmt_array(self, src: np.ndarray) -> np.ndarray:
-    #     expected_dtype = self.comp_fmt.numpy_transformed_dtype()
-    #     if self.comp_fmt in [VecCompFmt.Byte_0_255, VecCompFmt.U16, VecCompFmt.Float16, VecCompFmt.Float32]:
-    #         # Always make a copy, even if the byte order is the same as we want.
-    #         # The Blender side wants to do bone remapping etc. so we want a mutable version.
-    #         # src is backed by `bytes` -> is immutable.
-    #         # Float16 gets upgraded to float32 on transform to avoid rounding errors, so use same_kind instead of equiv
-    #         return src.astype(expected_dtype, casting='same_kind', copy=True)
-    #     elif self.comp_fmt == VecCompFmt.Byte_0_1:
-    #         # src must have dtype == vector of uint8
-    #         # it's always safe to cast uint8 -> float16 and float32, they can represent all values
-    #         data = src.astype(expected_dtype, casting='safe')
-    #         # (0, 255) -> (0, 1) by dividing by 255
-    #         data = data / 255.0
-    #         return data
-    #     elif self.comp_fmt == VecCompFmt.Byte_Minus1_1:
-    #         # src must have dtype == vector of uint8
-    #         # it's always safe to cast uint8 -> float16 and float32, they can represent all values
-    #         data = src.astype(expected_dtype, casting='safe')
-    #         # (0, 255) -> (0, 1) by dividing by 255
-    #         # (0, 1) -> (-1, 1) by multiplying by 2, subtracting 1
-    #         data = ((data / 255.0) * 2.0) - 1.0
-    #         return data
-    #     raise RuntimeError(f"Invalid VecStorage called transform_native_fmt_array: {self}")
-
-    # def untransform_array(self, big_endian: bool, transformed: np.ndarray) -> np.ndarray:
-    #     expected_dtype = self.comp_fmt.numpy_native_dtype(big_endian)
-    #     if self.comp_fmt in [VecCompFmt.Byte_0_255, VecCompFmt.U16, VecCompFmt.Float16, VecCompFmt.Float32]:
-    #         if transformed.dtype == expected_dtype:  # If the byte order is the same, passthru
-    #             return transformed
-    #         else:  # else make a copy with transformed byte order
-    #             # Float16 is transformed as float32 to avoid rounding errors, so use same_kind instead of equiv
-    #             return transformed.astype(expected_dtype, casting='same_kind')
-    #     elif self.comp_fmt == VecCompFmt.Byte_0_1:
-    #         # (0, 1) -> (0, 255) by multiplying by 255
-    #         data = transformed * 255.0
-    #         # Do rounding here because the cast doesn't do it right
-    #         np.around(data, out=data)
-    #         # storage = float, casting to int cannot preserve values -> use 'unsafe'
-    #         return data.astype(expected_dtype, casting='unsafe')
-    #     elif self.comp_fmt == VecCompFmt.Byte_Minus1_1:
-    #         # (-1, 1) to (0, 1) by adding 1, dividing by 2
-    #         # (0, 1) to (0, 255) by multiplying by 255
-    #         data = ((transformed + 1.0) / 2.0) * 255.0
-    #         # Do rounding here because the cast doesn't do it right
-    #         np.around(data, out=data)
-    #         # storage = float, casting to int cannot preserve values -> use 'unsafe'
-    #         return data.astype(expected_dtype, casting='unsafe')
-    #     raise RuntimeError(f"Invalid VecStorage called transform_native_fmt_array: {self}")
+    def numpy_native_dtype(self, big_endian: bool):
+        import numpy as np
+        # Use an explicit shape, so single-component vectors still get a trailing axis
+        return np.dtype((self.comp_fmt.numpy_native_dtype(big_endian), (self.n_comps,)))
+
+    def numpy_transformed_dtype(self):
+        import numpy as np
+        return np.dtype((self.comp_fmt.numpy_transformed_dtype(), (self.n_comps,)))
+
+    def preallocate(self, n_vertices: int) -> 'np.ndarray':
+        import numpy as np
+        return np.zeros(
+            n_vertices,
+            dtype=self.numpy_transformed_dtype(),
+        )
+
+    def transform_native_fmt_array(self, src: 'np.ndarray') -> 'np.ndarray':
+        expected_dtype = self.comp_fmt.numpy_transformed_dtype()
+        if self.comp_fmt in [VecCompFmt.Byte_0_255, VecCompFmt.U16, VecCompFmt.Float16, VecCompFmt.Float32]:
+            # Always make a copy, even if the byte order is the same as we want.
+            # The Blender side wants to do bone remapping etc. so we want a mutable version.
+            # src is backed by `bytes` -> is immutable.
+            # Float16 gets upgraded to float32 on transform to avoid rounding errors, so use same_kind instead of equiv
+            return src.astype(expected_dtype, casting='same_kind', copy=True)
+        elif self.comp_fmt == VecCompFmt.Byte_0_1:
+            # src must have dtype == vector of uint8
+            # it's always safe to cast uint8 -> float16 and float32, they can represent all values
+            data = src.astype(expected_dtype, casting='safe')
+            # (0, 255) -> (0, 1) by dividing by 255
+            data = data / 255.0
+            return data
+        elif self.comp_fmt == VecCompFmt.Byte_Minus1_1:
+            # src must have dtype == vector of uint8
+            # it's always safe to cast uint8 -> float16 and float32, they can represent all values
+            data = src.astype(expected_dtype, casting='safe')
+            # (0, 255) -> (0, 1) by dividing by 255
+            # (0, 1) -> (-1, 1) by multiplying by 2, subtracting 1
+            data = ((data / 255.0) * 2.0) - 1.0
+            return data
+        raise RuntimeError(f"Invalid VecStorage called transform_native_fmt_array: {self}")
+
+    def untransform_array(self, big_endian: bool, transformed: 'np.ndarray') -> 'np.ndarray':
+        import numpy as np
+        expected_dtype = self.comp_fmt.numpy_native_dtype(big_endian)
+        if self.comp_fmt in [VecCompFmt.Byte_0_255, VecCompFmt.U16, VecCompFmt.Float16, VecCompFmt.Float32]:
+            if transformed.dtype == expected_dtype:  # If the byte order is the same, passthru
+                return transformed
+            else:  # else make a copy with transformed byte order
+                # Float16 is transformed as float32 to avoid rounding errors, so use same_kind instead of equiv
+                return transformed.astype(expected_dtype, casting='same_kind')
+        elif self.comp_fmt == VecCompFmt.Byte_0_1:
+            # (0, 1) -> (0, 255) by multiplying by 255
+            data = transformed * 255.0
+            # Do rounding here because the cast doesn't do it right
+            np.around(data, out=data)
+            # storage = float, casting to int cannot preserve values -> use 'unsafe'
+            return data.astype(expected_dtype, casting='unsafe')
+        elif self.comp_fmt == VecCompFmt.Byte_Minus1_1:
+            # (-1, 1) to (0, 1) by adding 1, dividing by 2
+            # (0, 1) to (0, 255) by multiplying by 255
+            data = ((transformed + 1.0) / 2.0) * 255.0
+            # Do rounding here because the cast doesn't do it right
+            np.around(data, out=data)
+            # storage = float, casting to int cannot preserve values -> use 'unsafe'
+            return data.astype(expected_dtype, casting='unsafe')
+        raise RuntimeError(f"Invalid VecStorage called transform_native_fmt_array: {self}")
 
 
 # VertexBufferLayouts are external dependencies (shaders have a fixed layout, which we can't control) so they are frozen
@@ -133,34 +151,165 @@ class GMDVertexBufferLayout:
 
     packing_flags: int
 
+    def component_counts(self) -> Tuple[int, ...]:
+        # Number of components for each entry in VERTEX_COMPONENT_NAMES, 0 if the attribute isn't present
+        return (
+            self.pos_storage.n_comps,
+            self.weights_storage.n_comps if self.weights_storage else 0,
+            self.bones_storage.n_comps if self.bones_storage else 0,
+            self.normal_storage.n_comps if self.normal_storage else 0,
+            self.tangent_storage.n_comps if self.tangent_storage else 0,
+            self.unk_storage.n_comps if self.unk_storage else 0,
+            self.col0_storage.n_comps if self.col0_storage else 0,
+            self.col1_storage.n_comps if self.col1_storage else 0,
+        ) + tuple(
+            self.uv_storages[i].n_comps if i < len(self.uv_storages) else 0
+            for i in range(8)
+        )
+
+    def storages(self) -> Tuple[Tuple[str, VecStorage], ...]:
+        # (name, storage) for each attribute present in the layout, in vertex buffer order
+        storages = (
+            self.pos_storage,
+            self.weights_storage,
+            self.bones_storage,
+            self.normal_storage,
+            self.tangent_storage,
+            self.unk_storage,
+            self.col0_storage,
+            self.col1_storage,
+        ) + self.uv_storages
+        return tuple(
+            (name, storage)
+            for name, storage in zip(VERTEX_COMPONENT_NAMES, storages)
+            if storage is not None
+        )
+
+    def attribute_offsets(self) -> Dict[str, int]:
+        # Byte offset of each present attribute from the start of a vertex
+        offsets = {}
+        offset = 0
+        for name, storage in self.storages():
+            offsets[name] = offset
+            offset += storage.native_size_bytes()
+        return offsets
+
+    def stride(self) -> int:
+        # Size of a single vertex in bytes
+        return sum(storage.native_size_bytes() for _name, storage in self.storages())
+
+    def numpy_native_dtype(self, big_endian: bool) -> 'np.dtype':
+        # Structured dtype for a single vertex, with one field per present attribute
+        import numpy as np
+        storages = self.storages()
+        offsets = self.attribute_offsets()
+        return np.dtype({
+            "names": [name for name, _storage in storages],
+            "formats": [storage.numpy_native_dtype(big_endian) for _name, storage in storages],
+            "offsets": [offsets[name] for name, _storage in storages],
+            "itemsize": self.stride(),
+        })
+
+    def view_native_vertices(self, data, big_endian: bool, vertex_count: Optional[int] = None, offset: int = 0) -> 'np.ndarray':
+        # Zero-copy view of raw vertex bytes (bytes, bytearray, memoryview, mmap...) as an array of vertices.
+        # If data is immutable the view is read-only - use decode_vertices to get mutable copies.
+        import numpy as np
+        return np.frombuffer(
+            data,
+            dtype=self.numpy_native_dtype(big_endian),
+            count=-1 if vertex_count is None else vertex_count,
+            offset=offset
+        )
+
+    def memmap_native_vertices(self, path: str, big_endian: bool, vertex_count: Optional[int] = None, offset: int = 0, mode: str = 'r') -> 'np.memmap':
+        # Like view_native_vertices, but maps the vertices directly out of a file.
+        # If vertex_count is None, the vertices run from offset to the end of the file.
+        import numpy as np
+        return np.memmap(
+            path,
+            dtype=self.numpy_native_dtype(big_endian),
+            mode=mode,
+            offset=offset,
+            shape=None if vertex_count is None else (vertex_count,)
+        )
+
+    def decode_vertices(self, native: 'np.ndarray') -> Dict[str, 'np.ndarray']:
+        # Converts an array with dtype numpy_native_dtype() into {name: (n_vertices, n_comps) array} in the transformed formats
+        return {
+            name: storage.transform_native_fmt_array(native[name])
+            for name, storage in self.storages()
+        }
+
+    def encode_vertices(self, big_endian: bool, attributes: Dict[str, 'np.ndarray']) -> 'np.ndarray':
+        # Inverse of decode_vertices.
+        # Returns an array with dtype numpy_native_dtype(big_endian), use .tobytes() to get the raw vertex buffer.
+        import numpy as np
+        n_vertices = len(attributes["pos"])
+        native = np.zeros(n_vertices, dtype=self.numpy_native_dtype(big_endian))
+        for name, storage in self.storages():
+            native[name] = storage.untransform_array(big_endian, attributes[name])
+        return native
+
     @staticmethod
     def build_vertex_buffer_layout_from_flags(vertex_packing_flags: int, checked: bool = True) -> 'GMDVertexBufferLayout':
+        # Real data only uses a few hundred distinct flags, and layouts are immutable, so share decoded layouts.
+        return _cached_vertex_buffer_layout_from_flags(int(vertex_packing_flags), checked)
+
+    @staticmethod
+    def build_vertex_buffer_layouts_from_flag_array(vertex_packing_flags: 'np.ndarray', checked: bool = True) -> Tuple[List['GMDVertexBufferLayout'], 'np.ndarray']:
+        # Decodes each unique value in an array of 64-bit flags once.
+        # Returns (layouts, layout_indices) where layouts[layout_indices[i]] is the layout for vertex_packing_flags[i].
+        import numpy as np
+        unique_flags, layout_indices = np.unique(np.asarray(vertex_packing_flags, dtype=np.uint64), return_inverse=True)
+        layouts = [
+            GMDVertexBufferLayout.build_vertex_buffer_layout_from_flags(int(flags), checked)
+            for flags in unique_flags
+        ]
+        return layouts, layout_indices.reshape(-1)
+
+    @staticmethod
+    def component_counts_from_flag_array(vertex_packing_flags: 'np.ndarray', checked: bool = True) -> Dict[str, 'np.ndarray']:
+        # Returns {name: n_comps[i]} for each name in VERTEX_COMPONENT_NAMES, with one entry per element of vertex_packing_flags.
+        import numpy as np
+        layouts, layout_indices = GMDVertexBufferLayout.build_vertex_buffer_layouts_from_flag_array(vertex_packing_flags, checked)
+        counts_per_layout = np.array(
+            [layout.component_counts() for layout in layouts],
+            dtype=np.uint8
+        ).reshape(len(layouts), len(VERTEX_COMPONENT_NAMES))
+        counts = counts_per_layout[layout_indices]
+        return {
+            name: counts[:, i]
+            for i, name in enumerate(VERTEX_COMPONENT_NAMES)
+        }
+
+    @staticmethod
+    def decode_vertex_buffer_layout_from_flags(vertex_packing_flags: int, checked: bool = True) -> 'GMDVertexBufferLayout':
+        # Uncached version of build_vertex_buffer_layout_from_flags.
         # This derived from the 010 template
         # Bit-checking logic - keep track of the bits we examine, to ensure we don't miss anything
-        if checked:
-            touched_packing_bits: Set[int] = set()
-
-            def touch_bits(bit_indices: Iterable[int]):
-                touched_bits = set(bit_indices)
-                touched_packing_bits.update(touched_bits)
-        else:
-            def touch_bits(bit_indices: Iterable[int]):
-                pass
+        touched_packing_bits = 0
 
         # Helper for extracting a bitrange start:length and marking those bits as touched.
         def extract_bits(start, length):
-            touch_bits(range(start, start + length))
+            nonlocal touched_packing_bits
+            mask = (1 << length) - 1
+            touched_packing_bits |= mask << start
 
-            # Extract bits by shifting down to start and generating a mask of `length` 1's in binary
-            # TODO that is the worst possible way to generate that mask.
-            return (vertex_packing_flags >> start) & int('1' * length, 2)
+            # Extract bits by shifting down to start and masking with `length` 1's in binary
+            return (vertex_packing_flags >> start) & mask
 
         # Helper for extracting a bitmask and marking those bits as touched.
         def extract_bitmask(bitmask):
-            touch_bits([i for i in range(32) if ((bitmask >> i) & 1)])
+            nonlocal touched_packing_bits
+            touched_packing_bits |= bitmask
 
             return vertex_packing_flags & bitmask
 
+        # Helper for marking a bitrange start:end as touched without extracting it.
+        def touch_bit_range(start, end):
+            nonlocal touched_packing_bits
+            touched_packing_bits |= ((1 << (end - start)) - 1) << start
+
         # If the given vector type is `en`abled, extract the bits start:start+2 and find the VecStorage they refer to.
         # If the vector uses full-precision float components, the length is set by `full_precision_n_comps`.
         # If the vector uses byte-size components, the format of those bytes is set by `byte_fmt`.
@@ -213,7 +362,7 @@ class GMDVertexBufferLayout:
         unk_storage = extract_vector_type(unk_en, 17, full_precision_n_comps=3, byte_fmt=VecCompFmt.Byte_0_1)
 
         # TODO: Are we sure these bits aren't used for something?
-        touch_bits((19, 20))
+        touch_bit_range(19, 21)
 
         # col0 is diffuse and opacity for GMD versions up to 0x03000B
         col0_en = extract_bitmask(0x0020_0000)
@@ -253,7 +402,7 @@ class GMDVertexBufferLayout:
 
                     if len(uv_storages) == uv_count:
                         # Touch the rest of the bits
-                        touch_bits(range(32 + ((i + 1) * 4), 64))
+                        touch_bit_range(32 + ((i + 1) * 4), 64)
                         break
 
                 # if len(uv_storages) != uv_count:
@@ -262,24 +411,25 @@ class GMDVertexBufferLayout:
                 #         f"but specified {len(uv_storages)}")
             else:
                 # Touch all of the uv bits, without doing anything with them
-                touch_bits(range(32, 64))
+                touch_bit_range(32, 64)
                 print(
                     f"Layout Flags {vertex_packing_flags:016x} claimed to have {uv_count} UVs "
                     f"but UVs are disabled", file=sys.stderr)
         else:
             # No UVs at all
-            touch_bits(range(32, 64))
+            touch_bit_range(32, 64)
             uv_storages = []
             pass
 
         # print(uv_storages)
 
         if checked:
-            expected_touched_bits = {x for x in range(64)}
+            expected_touched_bits = (1 << 64) - 1
             if touched_packing_bits != expected_touched_bits:
+                untouched_bits = {x for x in range(64) if not ((touched_packing_bits >> x) & 1)}
                 raise ValueError(
                     f"Incomplete vertex format parse - "
-                    f"bits {expected_touched_bits - touched_packing_bits} were not touched")
+                    f"bits {untouched_bits} were not touched")
 
         return GMDVertexBufferLayout(
             pos_storage=pos_storage,
@@ -294,3 +444,21 @@ class GMDVertexBufferLayout:
 
             packing_flags=vertex_packing_flags,
         )
+
+
+# Names for the entries of GMDVertexBufferLayout.component_counts(), in vertex buffer order
+VERTEX_COMPONENT_NAMES = (
+    "pos",
+    "weights",
+    "bones",
+    "normal",
+    "tangent",
+    "unk",
+    "col0",
+    "col1",
+) + tuple(f"uv{i}" for i in range(8))
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_vertex_buffer_layout_from_flags(vertex_packing_flags: int, checked: bool) -> GMDVertexBufferLayout:
+    return GMDVertexBufferLayout.decode_vertex_buffer_layout_from_flags(vertex_packing_flags, checked)
@@ -0,0 +1,56 @@
+import argparse
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+from yk_analysis.analysis_helpers.columnar import shader_draw_distributions
+from yk_analysis.analysis_helpers.db import ReadOnlyDb
+from yk_analysis.analyse_shaders import DB_OPTIONS
+
+# Compares computing the per-shader (VertLayoutFlags, BytesPerVert, MatrixCount) draw distribution
+# row by row in Python with the columnar loader's vectorized group-by, with and without its on-disk cache,
+# and checks they agree.
+
+def distributions_per_row(db: ReadOnlyDb) -> Dict[Optional[str], Dict[Tuple[int, int, int], int]]:
+    counts: Counter = Counter()
+    for (shader_name, draw_vlf, draw_bpv, draw_matrices) in db.query("SELECT AttribSet.Shader, VertLayoutFlags, BytesPerVert, MatrixCount FROM DrawCalls INNER JOIN AttribSet ON DrawCalls.AttribSetId = AttribSet.ROWID"):
+        counts[(shader_name, int.from_bytes(draw_vlf), draw_bpv, draw_matrices)] += 1
+    distributions: Dict[Optional[str], Dict[Tuple[int, int, int], int]] = {}
+    for (shader_name, draw_vlf, draw_bpv, draw_matrices), count in counts.items():
+        distributions.setdefault(shader_name, {})[(draw_vlf, draw_bpv, draw_matrices)] = count
+    return distributions
+
+def time_best(f, repeat: int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db")
+    parser.add_argument("--repeat", type=int, default=3, help="Run each mode this many times and keep the fastest")
+    args = parser.parse_args()
+
+    db = ReadOnlyDb(args.db, expected_version=1, **DB_OPTIONS)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        per_row_seconds, reference = time_best(lambda: distributions_per_row(db), args.repeat)
+        columnar_seconds, columnar = time_best(lambda: shader_draw_distributions(db), args.repeat)
+        # The first cached call builds the cache, the rest memory-map it
+        build_seconds, _ = time_best(lambda: shader_draw_distributions(db, cache_dir=cache_dir), 1)
+        cached_seconds, cached = time_best(lambda: shader_draw_distributions(db, cache_dir=cache_dir), args.repeat)
+
+    print(f"{'Mode': <24}\t{'Seconds': >9}\tSpeedup")
+    for mode, seconds in [("per-row", per_row_seconds), ("columnar", columnar_seconds),
+                          ("columnar (cache build)", build_seconds), ("columnar (cached)", cached_seconds)]:
+        print(f"{mode: <24}\t{seconds: >9.3f}\t{per_row_seconds / seconds:.2f}x")
+
+    for mode, result in [("columnar", columnar), ("columnar (cached)", cached)]:
+        if result != reference:
+            raise RuntimeError(f"{mode} distributions don't match per-row")
+    print(f"All modes agree on {sum(len(d) for d in reference.values())} distinct draw formats across {len(reference)} shaders")
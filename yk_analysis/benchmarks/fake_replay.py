@@ -0,0 +1,290 @@
+import enum
+import random
+import sys
+import time
+import types
+from typing import Dict, List, Optional, Sequence, Tuple
+from yk_analysis.benchmarks.generate_db import synthetic_shader_bytes
+
+# Headless stand-in for the small part of the RenderDoc replay API perform_analysis uses,
+# so it can be profiled and regression-tested on a machine without RenderDoc or a real capture.
+#
+# Call install_fake_renderdoc() before importing yk_analysis.renderdoc.analyse,
+# so `import renderdoc` inside it picks up the fake module.
+
+class ActionFlags(enum.IntFlag):
+    NoFlags = 0
+    Clear = 0x1
+    Drawcall = 0x2
+    Dispatch = 0x4
+    PushMarker = 0x40
+    Indexed = 0x10000
+
+class ShaderStage(enum.IntEnum):
+    Vertex = 0
+    Hull = 1
+    Domain = 2
+    Geometry = 3
+    Pixel = 4
+    Compute = 5
+
+class ShaderEncoding(enum.IntEnum):
+    Unknown = 0
+    DXBC = 1
+    GLSL = 2
+    SPIRV = 3
+
+class Topology(enum.IntEnum):
+    Unknown = 0
+    PointList = 1
+    LineList = 2
+    LineStrip = 3
+    LineLoop = 4
+    TriangleList = 5
+    TriangleStrip = 6
+
+class ResourceId:
+    # Like rd.ResourceId: hashable, comparable, and int()-able
+    def __init__(self, value: int = 0):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, ResourceId) and self.value == other.value
+
+    def __lt__(self, other):
+        return self.value < other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __int__(self):
+        return self.value
+
+    def __repr__(self):
+        return f"ResourceId::{self.value}"
+
+    @staticmethod
+    def Null() -> 'ResourceId':
+        return ResourceId(0)
+
+class APIEvent:
+    def __init__(self, eventId: int, chunkIndex: int):
+        self.eventId = eventId
+        self.chunkIndex = chunkIndex
+
+class ActionDescription:
+    def __init__(self, eventId: int, flags: ActionFlags, numIndices: int = 0, indexOffset: int = 0):
+        self.eventId = eventId
+        self.flags = flags
+        self.numIndices = numIndices
+        self.indexOffset = indexOffset
+        self.customName = ""
+        self.children: List['ActionDescription'] = []
+        self.parent: Optional['ActionDescription'] = None
+        self.previous: Optional['ActionDescription'] = None
+        self.next: Optional['ActionDescription'] = None
+        self.events: List[APIEvent] = []
+
+class ShaderReflection:
+    def __init__(self, encoding: ShaderEncoding, rawBytes: bytes):
+        self.encoding = encoding
+        self.rawBytes = rawBytes
+
+class D3D11Shader:
+    def __init__(self, resourceId: ResourceId, stage: ShaderStage, reflection: Optional[ShaderReflection]):
+        self.resourceId = resourceId
+        self.stage = stage
+        self.reflection = reflection
+
+class D3D11InputAssembly:
+    def __init__(self, topology: Topology):
+        self.topology = topology
+
+class D3D11State:
+    def __init__(self, vertexShader: D3D11Shader, pixelShader: D3D11Shader, topology: Topology):
+        self.vertexShader = vertexShader
+        self.pixelShader = pixelShader
+        self.inputAssembly = D3D11InputAssembly(topology)
+
+class SDObject:
+    # Structured data: a named value with named children
+    def __init__(self, name: str, value=None, children: Optional[List['SDObject']] = None):
+        self.name = name
+        self.value = value
+        self.children = children or []
+
+    def FindChild(self, childName: str) -> Optional['SDObject']:
+        for child in self.children:
+            if child.name == childName:
+                return child
+        return None
+
+    def GetChild(self, index: int) -> 'SDObject':
+        return self.children[index]
+
+    def NumChildren(self) -> int:
+        return len(self.children)
+
+    def AsResourceId(self) -> ResourceId:
+        return self.value
+
+    def AsInt(self) -> int:
+        return int(self.value)
+
+    def AsString(self) -> str:
+        return str(self.value)
+
+class SDChunk(SDObject):
+    pass
+
+class SDFile:
+    def __init__(self, chunks: List[SDChunk]):
+        self.chunks = chunks
+
+# D3D11_PRIMITIVE_TOPOLOGY values for the IASetPrimitiveTopology chunks
+D3D11_PRIMITIVE_TOPOLOGIES = {
+    Topology.TriangleList: 4,
+    Topology.TriangleStrip: 5,
+}
+
+class FakeDraw:
+    # What the fake capture binds for one draw
+    def __init__(self, vs: D3D11Shader, ps: D3D11Shader, topology: Topology):
+        self.vs = vs
+        self.ps = ps
+        self.topology = topology
+
+class ReplayController:
+    # Replays a generated capture. Seeks can be given an artificial cost, to model real replay
+    # where SetFrameEvent dominates, and are counted so callers can check how many they caused.
+    def __init__(self, root_actions: List[ActionDescription], draws: Dict[int, FakeDraw], sdfile: SDFile, seek_cost_s: float = 0.0):
+        self.root_actions = root_actions
+        self.draws = draws
+        self.sdfile = sdfile
+        self.seek_cost_s = seek_cost_s
+        self.num_seeks = 0
+        self.current_event = 0
+
+    def GetRootActions(self) -> List[ActionDescription]:
+        return self.root_actions
+
+    def SetFrameEvent(self, eventId: int, force: bool):
+        self.num_seeks += 1
+        self.current_event = eventId
+        if self.seek_cost_s:
+            # Busy-wait rather than sleep, so the cost shows up in CPU profiles like real replay would
+            end = time.perf_counter() + self.seek_cost_s
+            while time.perf_counter() < end:
+                pass
+
+    def GetD3D11PipelineState(self) -> D3D11State:
+        draw = self.draws[self.current_event]
+        return D3D11State(draw.vs, draw.ps, draw.topology)
+
+    def GetStructuredFile(self) -> SDFile:
+        return self.sdfile
+
+    def Shutdown(self):
+        pass
+
+def make_fake_renderdoc_module() -> types.ModuleType:
+    rd = types.ModuleType("renderdoc")
+    for obj in [ActionFlags, ShaderStage, ShaderEncoding, Topology, ResourceId, APIEvent, ActionDescription,
+                ShaderReflection, D3D11Shader, D3D11State, SDObject, SDChunk, SDFile, ReplayController]:
+        setattr(rd, obj.__name__, obj)
+    rd.__yk_fake__ = True
+    return rd
+
+def install_fake_renderdoc() -> types.ModuleType:
+    # Makes `import renderdoc` return the fake module. Must run before yk_analysis.renderdoc.analyse is imported.
+    existing = sys.modules.get("renderdoc")
+    if existing is not None:
+        if getattr(existing, "__yk_fake__", False):
+            return existing
+        raise RuntimeError("The real renderdoc module is already loaded, the fake can't replace it")
+    rd = make_fake_renderdoc_module()
+    sys.modules["renderdoc"] = rd
+    return rd
+
+def generate_fake_capture(shader_names: Sequence[str], n_draws: int, n_shader_pairs: int,
+                          state_run_length: float = 4.0, unknown_shader_fraction: float = 0.05,
+                          seek_cost_s: float = 0.0, seed: int = 0,
+                          draw_shapes: Optional[Dict[str, List[Tuple[int, Topology]]]] = None) -> ReplayController:
+    # Builds a capture of n_draws draws under a single marker, interspersed with clears.
+    # The structured file has a chunk for each action and for each VSSetShader/PSSetShader/IASetPrimitiveTopology
+    # which changes the state, except for the state the first draw uses which is set "before the capture started".
+    # Draws use n_shader_pairs distinct (vertex, pixel) shader pairs - the lower this is, the more shaders are reused.
+    # Consecutive draws keep the same pair for state_run_length draws on average, like a real frame sorted by material.
+    # Shaders are named after entries of shader_names, with rawBytes matching benchmarks/generate_db.py's ShaderBytes,
+    # except for unknown_shader_fraction of them which won't be found in the DB.
+    # draw_shapes optionally maps shader names to (numIndices, topology) pairs of the model DB's nodes using them,
+    # which most draws with that shader will copy so they can be matched to a GMD node.
+    rng = random.Random(seed)
+
+    next_resource_id = 1000
+    def make_shader(stage: ShaderStage, shader_name: str) -> D3D11Shader:
+        nonlocal next_resource_id
+        next_resource_id += 1
+        db_stage = "Vertex" if stage == ShaderStage.Vertex else "Fragment"
+        if rng.random() < unknown_shader_fraction:
+            raw_bytes = synthetic_shader_bytes(f"unknown_{next_resource_id}", db_stage)
+        else:
+            raw_bytes = synthetic_shader_bytes(shader_name, db_stage)
+        return D3D11Shader(ResourceId(next_resource_id), stage, ShaderReflection(ShaderEncoding.DXBC, raw_bytes))
+
+    pairs: List[Tuple[D3D11Shader, D3D11Shader, str]] = []
+    for _ in range(n_shader_pairs):
+        shader_name = rng.choice(shader_names)
+        pairs.append((make_shader(ShaderStage.Vertex, shader_name), make_shader(ShaderStage.Pixel, shader_name), shader_name))
+
+    marker = ActionDescription(eventId=1, flags=ActionFlags.PushMarker)
+    draws: Dict[int, FakeDraw] = {}
+    chunks: List[SDChunk] = [SDChunk("ID3D11DeviceContext::PushMarker")]
+    event_id = 1
+    pair = rng.choice(pairs)
+    # The state when the capture started
+    bound_vs: Optional[D3D11Shader] = pair[0]
+    bound_ps: Optional[D3D11Shader] = pair[1]
+    bound_topology: Optional[Topology] = None
+    previous: Optional[ActionDescription] = None
+    for _ in range(n_draws):
+        if rng.random() < 1.0 / max(state_run_length, 1.0):
+            pair = rng.choice(pairs)
+        event_id += 1
+        if rng.random() < 0.01:
+            chunks.append(SDChunk("ID3D11DeviceContext::ClearRenderTargetView"))
+            action = ActionDescription(eventId=event_id, flags=ActionFlags.Clear)
+        else:
+            indexed = rng.random() < 0.9
+            shapes = draw_shapes.get(pair[2]) if draw_shapes else None
+            if shapes and rng.random() < 0.9:
+                num_indices, topology = rng.choice(shapes)
+            else:
+                num_indices = rng.randrange(3, 30000, 3)
+                topology = Topology.TriangleList if rng.random() < 0.8 else Topology.TriangleStrip
+            if pair[0] is not bound_vs:
+                chunks.append(SDChunk("ID3D11DeviceContext::VSSetShader", children=[SDObject("pShader", pair[0].resourceId)]))
+                bound_vs = pair[0]
+            if pair[1] is not bound_ps:
+                chunks.append(SDChunk("ID3D11DeviceContext::PSSetShader", children=[SDObject("pShader", pair[1].resourceId)]))
+                bound_ps = pair[1]
+            if topology != bound_topology:
+                chunks.append(SDChunk("ID3D11DeviceContext::IASetPrimitiveTopology", children=[SDObject("Topology", D3D11_PRIMITIVE_TOPOLOGIES[topology])]))
+                bound_topology = topology
+            chunks.append(SDChunk("ID3D11DeviceContext::DrawIndexed" if indexed else "ID3D11DeviceContext::Draw"))
+            action = ActionDescription(
+                eventId=event_id,
+                flags=ActionFlags.Drawcall | (ActionFlags.Indexed if indexed else ActionFlags.NoFlags),
+                numIndices=num_indices,
+                indexOffset=rng.randrange(0, 100000) if indexed else 0,
+            )
+            draws[event_id] = FakeDraw(pair[0], pair[1], topology)
+        action.events.append(APIEvent(event_id, len(chunks) - 1))
+        action.parent = marker
+        action.previous = previous
+        if previous is not None:
+            previous.next = action
+        marker.children.append(action)
+        previous = action
+
+    return ReplayController([marker], draws, SDFile(chunks), seek_cost_s)
@@ -0,0 +1,274 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+from yk_analysis.analysis_helpers.vertex import GMDVertexBufferLayout
+
+# Generates a synthetic game DB with the same schema as the real ones (user_version 1, AttribSet, DrawCalls, ShaderBytes),
+# so the analysis tools can be benchmarked at any scale without a real game extraction.
+# Everything is derived from the seed, so the same arguments always produce the same DB.
+#
+# It can also generate a model DB to go with a game DB, which is a separate file with the GMD node columns
+# renderdoc/gmd_matcher.py reads, so the GMD node matching can be benchmarked too.
+
+SYNTHETIC_DB_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE AttribSet(
+    Shader TEXT NOT NULL,
+    Flags BLOB NOT NULL,
+    TexDiffuse TEXT,
+    TexRefl TEXT,
+    TexMulti TEXT,
+    TexRm TEXT,
+    TexTs TEXT,
+    TexNormal TEXT,
+    TexRt TEXT,
+    TexRd TEXT,
+    Material TEXT NOT NULL,
+    ExtraProperties TEXT NOT NULL
+);
+CREATE TABLE DrawCalls(
+    AttribSetId INTEGER NOT NULL,
+    VertLayoutFlags BLOB NOT NULL,
+    BytesPerVert INTEGER NOT NULL,
+    MatrixCount INTEGER NOT NULL
+);
+CREATE TABLE ShaderBytes(
+    ShaderStage TEXT NOT NULL,
+    BytesType TEXT NOT NULL,
+    SHA256 BLOB NOT NULL,
+    Category TEXT NOT NULL,
+    ShaderName TEXT NOT NULL,
+    Bytes BLOB NOT NULL
+);
+"""
+
+# One DrawCalls row per GMD node, with AttribSet holding the node's shader
+MODEL_DB_SCHEMA = """
+CREATE TABLE AttribSet(
+    Shader TEXT NOT NULL
+);
+CREATE TABLE DrawCalls(
+    AttribSetId INTEGER NOT NULL,
+    GMDFile TEXT NOT NULL,
+    NodeName TEXT NOT NULL,
+    DrawOrder INTEGER NOT NULL,
+    NumIndicesTriList INTEGER NOT NULL,
+    NumIndicesTriStrip INTEGER NOT NULL
+);
+"""
+
+MATERIAL_KEYS = ["diffuse", "opacity", "specular", "unk1", "unk2", "power", "intensity"]
+SHADER_FAMILIES = ["o1dzt", "o2dzt", "c1dzt", "e1dzt", "b1szt", "f1dzt", "h2dzt", "r1dzt"]
+SHADER_CATEGORIES = ["Character", "Stage", "Effect", "Common"]
+# Consecutive AttribSets are grouped into models of this many materials
+ATTRIBSETS_PER_MODEL = 8
+
+@dataclass
+class SyntheticShader:
+    name: str
+    weight: float # Relative popularity among AttribSets
+    flags: List[int] # Primary AttribSet.Flags first
+    texture_slots: List[bool]
+    extras_slots: List[bool]
+    vertex_layouts: List[int] # Primary VertLayoutFlags first
+    skinned: bool
+
+def synthetic_shader_bytes(shader_name: str, shader_stage: str) -> bytes:
+    # Stand-in for a compiled DXBC blob, a few KiB long and unique per (shader, stage)
+    seed = f"DXBC {shader_stage} {shader_name}".encode()
+    return seed + hashlib.sha256(seed).digest() * (64 + len(shader_name) % 64)
+
+def realistic_vertex_layout_flags(rng: random.Random, skinned: bool) -> int:
+    # Builds VertLayoutFlags from the kinds of attributes real models use (see GMDVertexBufferLayout)
+    if rng.random() < 0.8:
+        flags = 3 # 3 x float32 position
+    else:
+        flags = 4 | (1 << 3) # 4 x float16 position
+    if skinned:
+        flags |= 0x70 | (2 << 7) # Byte weights
+        flags |= 0x200 # Bones
+    flags |= 0x400 | (rng.choice([1, 2]) << 11) # Float16 or byte normals
+    if rng.random() < 0.7:
+        flags |= 0x2000 | (2 << 14) # Byte tangents
+    if rng.random() < 0.1:
+        flags |= 0x0001_0000 | (2 << 17) # Byte unk
+    if rng.random() < 0.6:
+        flags |= 0x0020_0000 | (2 << 22) # Byte col0
+    if rng.random() < 0.3:
+        flags |= 0x0100_0000 | (2 << 25) # Byte col1
+    n_uvs = rng.choice([1, 1, 1, 2, 2, 3])
+    flags |= (1 << 27) | (n_uvs << 28)
+    uv_bits = 0xFFFF_FFFF
+    for i in range(n_uvs):
+        # 2 x float16, 2 x float32, 4 x byte, 3 x float16
+        slot = rng.choice([0x4, 0x4, 0x0, 0x8, 0x5])
+        uv_bits = (uv_bits & ~(0xF << (i * 4))) | (slot << (i * 4))
+    return flags | (uv_bits << 32)
+
+def generate_shaders(rng: random.Random, n_shaders: int) -> List[SyntheticShader]:
+    shaders = []
+    for i in range(n_shaders):
+        skinned = rng.random() < 0.3
+        primary_layout = realistic_vertex_layout_flags(rng, skinned)
+        vertex_layouts = [primary_layout]
+        if rng.random() < 0.05:
+            vertex_layouts.append(realistic_vertex_layout_flags(rng, skinned))
+        flags = [rng.choice([0x0, 0x1, 0x2, 0x100, 0x101])]
+        if rng.random() < 0.05:
+            flags.append(rng.choice([0x0, 0x4, 0x200]))
+        shaders.append(SyntheticShader(
+            name=f"s{rng.choice('dkt')}_{rng.choice(SHADER_FAMILIES)}_{i:05d}",
+            # Zipf-ish popularity - a few shaders are used by most AttribSets
+            weight=1.0 / (i + 1),
+            flags=flags,
+            texture_slots=[rng.random() < p for p in [0.95, 0.3, 0.5, 0.4, 0.2, 0.7, 0.1, 0.1]],
+            extras_slots=[rng.random() < 0.15 for _ in range(16)],
+            vertex_layouts=vertex_layouts,
+            skinned=skinned,
+        ))
+    rng.shuffle(shaders)
+    return shaders
+
+def random_material(rng: random.Random) -> str:
+    def color():
+        if rng.random() < 0.1:
+            return [0.0, 0.0, 0.0]
+        return [round(rng.random(), 3) for _ in range(3)]
+    material = {
+        "diffuse": color(),
+        "opacity": rng.choice([0.0, 1.0, 1.0, 1.0, round(rng.random(), 3)]),
+        "specular": color(),
+        "unk1": color(),
+        "unk2": [0.0, 0.0, 0.0, 0.0] if rng.random() < 0.8 else [round(rng.random(), 3) for _ in range(4)],
+        "power": rng.choice([0.0, round(rng.uniform(1, 64), 3)]),
+        "intensity": rng.choice([0.0, 1.0]),
+    }
+    return json.dumps({k: material[k] for k in MATERIAL_KEYS})
+
+def generate_attribsets(rng: random.Random, shaders: List[SyntheticShader], n_attribsets: int) -> Iterator[Tuple]:
+    picked = rng.choices(range(len(shaders)), weights=[s.weight for s in shaders], k=n_attribsets)
+    for shader_idx in picked:
+        shader = shaders[shader_idx]
+        flags = shader.flags[0] if len(shader.flags) == 1 or rng.random() < 0.9 else rng.choice(shader.flags)
+        textures = [
+            f"tex_{rng.randrange(100000):05d}" if (used and rng.random() < 0.9) else None
+            for used in shader.texture_slots
+        ]
+        extras = [
+            (rng.randrange(1, 256) if rng.random() < 0.5 else 0) if used else 0
+            for used in shader.extras_slots
+        ]
+        yield (shader.name, flags.to_bytes(8, "big"), *textures, random_material(rng), json.dumps(extras))
+
+def generate_drawcalls(rng: random.Random, shaders: List[SyntheticShader], attribset_shaders: List[int], draws_per_attribset: float) -> Iterator[Tuple]:
+    for attribset_id, shader_idx in enumerate(attribset_shaders, start=1):
+        shader = shaders[shader_idx]
+        # Somewhere between 1 and 2*draws_per_attribset - 1 draws per AttribSet, averaging draws_per_attribset
+        n_draws = 1 + int(rng.random() * 2 * (draws_per_attribset - 1) + 0.5)
+        for _ in range(n_draws):
+            vertex_layout = shader.vertex_layouts[0] if len(shader.vertex_layouts) == 1 or rng.random() < 0.8 else rng.choice(shader.vertex_layouts)
+            bytes_per_vert = GMDVertexBufferLayout.build_vertex_buffer_layout_from_flags(vertex_layout).stride()
+            if shader.skinned:
+                # Occasionally a skinned shader is used on an unskinned mesh
+                matrix_count = rng.randrange(1, 64) if rng.random() < 0.98 else 0
+            else:
+                matrix_count = 0
+            yield (attribset_id, vertex_layout.to_bytes(8, "big"), bytes_per_vert, matrix_count)
+
+def generate_shader_bytes(rng: random.Random, shaders: List[SyntheticShader]) -> Iterator[Tuple]:
+    for shader in shaders:
+        category = rng.choice(SHADER_CATEGORIES)
+        for shader_stage in ["Vertex", "Fragment"]:
+            shader_bytes = synthetic_shader_bytes(shader.name, shader_stage)
+            yield (shader_stage, "DXBC", hashlib.sha256(shader_bytes).digest(), category, shader.name, shader_bytes)
+    # Some shaders compile to identical bytecode for one stage, so a single hash can map to several names
+    for _ in range(len(shaders) // 20):
+        original, alias = rng.sample(shaders, 2)
+        shader_stage = rng.choice(["Vertex", "Fragment"])
+        shader_bytes = synthetic_shader_bytes(original.name, shader_stage)
+        yield (shader_stage, "DXBC", hashlib.sha256(shader_bytes).digest(), rng.choice(SHADER_CATEGORIES), alias.name, shader_bytes)
+
+def default_shader_count(n_attribsets: int) -> int:
+    return min(2000, max(16, n_attribsets // 50))
+
+def generate_db(path: str, n_attribsets: int, n_shaders: int = 0, draws_per_attribset: float = 1.5, seed: int = 0):
+    if not n_shaders:
+        n_shaders = default_shader_count(n_attribsets)
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    shaders = generate_shaders(rng, n_shaders)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(SCHEMA)
+
+    attribset_shaders: List[int] = []
+    def record_shader(rows: Iterator[Tuple]) -> Iterator[Tuple]:
+        name_to_idx = {s.name: i for i, s in enumerate(shaders)}
+        for row in rows:
+            attribset_shaders.append(name_to_idx[row[0]])
+            yield row
+    conn.executemany("INSERT INTO AttribSet VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", record_shader(generate_attribsets(rng, shaders, n_attribsets)))
+    conn.executemany("INSERT INTO DrawCalls VALUES (?, ?, ?, ?)", generate_drawcalls(rng, shaders, attribset_shaders, draws_per_attribset))
+    conn.executemany("INSERT INTO ShaderBytes VALUES (?, ?, ?, ?, ?, ?)", generate_shader_bytes(rng, shaders))
+    conn.execute(f"PRAGMA user_version = {SYNTHETIC_DB_VERSION}")
+    conn.commit()
+    conn.close()
+
+def generate_model_nodes(rng: random.Random, draw_attribset_ids: Iterator[int]) -> Iterator[Tuple]:
+    # One GMD node per game DB draw, using the same AttribSet.
+    # Consecutive AttribSets are grouped into models, with the nodes numbered in draw order within each model.
+    draw_order = 0
+    last_model = None
+    for attribset_id in draw_attribset_ids:
+        model = (attribset_id - 1) // ATTRIBSETS_PER_MODEL
+        if model != last_model:
+            draw_order = 0
+            last_model = model
+        # The same mesh as a triangle list, and as a strip which needs a few degenerate triangles
+        n_triangles = rng.randrange(1, 10000)
+        num_indices_strip = n_triangles + 2 + 2 * rng.randrange(0, n_triangles // 4 + 1)
+        yield (attribset_id, f"model_{model:06d}.gmd", f"node_{rng.randrange(1000):03d}", draw_order, 3 * n_triangles, num_indices_strip)
+        draw_order += 1
+
+def generate_model_db(path: str, game_db_path: str, seed: int = 0):
+    # Builds a model DB whose nodes use the shaders and draws of the synthetic game DB at game_db_path
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    game_conn = sqlite3.connect(game_db_path)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(MODEL_DB_SCHEMA)
+    # Same ROWIDs as the game DB's AttribSets, so each node's AttribSetId can be copied over as-is
+    conn.executemany("INSERT INTO AttribSet(ROWID, Shader) VALUES (?, ?)", game_conn.execute("SELECT ROWID, Shader FROM AttribSet ORDER BY ROWID"))
+    conn.executemany("INSERT INTO DrawCalls VALUES (?, ?, ?, ?, ?, ?)",
+                     generate_model_nodes(rng, (attribset_id for (attribset_id,) in game_conn.execute("SELECT AttribSetId FROM DrawCalls ORDER BY ROWID"))))
+    conn.execute(f"PRAGMA user_version = {SYNTHETIC_DB_VERSION}")
+    conn.commit()
+    conn.close()
+    game_conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db")
+    parser.add_argument("--attribsets", type=int, default=100_000, help="Number of AttribSet rows, 1k-10M is sensible")
+    parser.add_argument("--shaders", type=int, default=0, help="Number of distinct shaders, defaults to scaling with --attribsets")
+    parser.add_argument("--draws-per-attribset", type=float, default=1.5, help="Average number of DrawCalls rows per AttribSet")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model-db", help="Also generate a model DB for the game DB's draws here, for renderdoc/gmd_matcher.py")
+    args = parser.parse_args()
+
+    generate_db(args.db, args.attribsets, args.shaders, args.draws_per_attribset, args.seed)
+    if args.model_db:
+        generate_model_db(args.model_db, args.db, args.seed)
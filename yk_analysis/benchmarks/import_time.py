@@ -0,0 +1,79 @@
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# Measures how long each CLI and helper module takes to import in a fresh interpreter, using python -X importtime,
+# and which heavy modules each one drags in.
+# With --check, exits with an error if a module that should be light imports a heavy one, so regressions get noticed.
+
+# Modules that are slow to import, or that only work inside RenderDoc
+HEAVY_MODULES = ["renderdoc", "qrenderdoc", "PySide2", "numpy"]
+
+# (module, heavy modules it's allowed to import)
+MODULES: List[Tuple[str, List[str]]] = [
+    ("yk_analysis", []),
+    ("yk_analysis.analysis_helpers.db", []),
+    ("yk_analysis.analysis_helpers.data", []),
+    ("yk_analysis.analysis_helpers.sidecar", []),
+    ("yk_analysis.analyse_shaders", []),
+    ("yk_analysis.prepare_db", []),
+    ("yk_analysis.analysis_helpers.vertex", []),
+    ("yk_analysis.export_shader_analysis_report", []),
+]
+
+def measure_import(module: str) -> Tuple[Optional[int], Dict[str, int]]:
+    # Returns (cumulative microseconds to import module or None if it failed, {top-level package: cumulative microseconds})
+    # for every package imported along the way
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        # Don't let an enclosing environment's PYTHONPROFILEIMPORTTIME etc. interfere, but keep PYTHONPATH for renderdoc
+        env={k: v for k, v in os.environ.items() if not k.startswith("PYTHONPROFILE")},
+    )
+    # Lines look like "import time:   self [us] | cumulative | imported package", nested imports are indented
+    total = None
+    packages: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        top_level = name.strip().split(".")[0]
+        packages[top_level] = max(packages.get(top_level, 0), int(cumulative_us))
+        if name.strip() == module:
+            total = int(cumulative_us)
+    if result.returncode != 0:
+        total = None
+    return total, packages
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5, help="Import each module this many times and keep the fastest")
+    parser.add_argument("--check", action="store_true", help="Exit with an error if a module imports a heavy module it shouldn't")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'Module': <46}\t{'ms': >8}\tHeavy imports")
+    for module, allowed_heavy in MODULES:
+        best: Optional[int] = None
+        heavy: Dict[str, int] = {}
+        for _ in range(args.repeat):
+            total, packages = measure_import(module)
+            if total is None:
+                break
+            if best is None or total < best:
+                best = total
+                heavy = {name: packages[name] for name in HEAVY_MODULES if name in packages}
+        if best is None:
+            print(f"{module: <46}\t{'failed': >8}")
+            failed = True
+            continue
+        print(f"{module: <46}\t{best / 1000: >8.1f}\t{', '.join(f'{name} ({us / 1000:.1f}ms)' for name, us in heavy.items()) or '-'}")
+        unexpected = [name for name in heavy if name not in allowed_heavy]
+        if args.check and unexpected:
+            print(f"\t{module} shouldn't import {', '.join(unexpected)}", file=sys.stderr)
+            failed = True
+
+    if args.check and failed:
+        sys.exit(1)
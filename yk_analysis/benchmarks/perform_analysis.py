@@ -0,0 +1,94 @@
+import argparse
+import cProfile
+import os
+import pstats
+import time
+from yk_analysis.analysis_helpers.db import ReadOnlyDb
+from yk_analysis.benchmarks.generate_db import generate_db, generate_model_db
+from yk_analysis.benchmarks.fake_replay import generate_fake_capture, install_fake_renderdoc
+
+# Times the RenderDoc plugin's perform_analysis against a fake capture (see fake_replay.py),
+# so it can be profiled without RenderDoc. Shader hashes in the capture match a synthetic DB from generate_db.py.
+
+# The fake has to be in place before analyse imports renderdoc
+rd = install_fake_renderdoc()
+from yk_analysis.renderdoc.analyse import BINDING_MODES, perform_analysis
+from yk_analysis.renderdoc.trace import AnalysisTrace
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="Synthetic DB to use, by default one is generated in bench_dbs/")
+    parser.add_argument("--attribsets", type=int, default=100_000, help="AttribSet rows in the generated DB")
+    parser.add_argument("--draws", type=int, default=100_000, help="Actions in the fake capture")
+    parser.add_argument("--shader-pairs", type=int, default=2000, help="Distinct vertex/pixel shader pairs used by the capture")
+    parser.add_argument("--run-length", type=float, default=4.0, help="Average number of consecutive draws using the same shader pair")
+    parser.add_argument("--unknown-fraction", type=float, default=0.05, help="Fraction of shaders which aren't in the DB")
+    parser.add_argument("--seek-cost-us", type=float, default=0.0, help="Simulated cost of each SetFrameEvent, in microseconds")
+    parser.add_argument("--name-cache", action="store_true", help="Use (and populate) the persistent shader name cache")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--profile", action="store_true", help="Print the top cProfile entries of one run")
+    parser.add_argument("--trace", help="Record a full debug trace of each run to this file")
+    parser.add_argument("--binding-mode", choices=BINDING_MODES, default="chunks", help="How perform_analysis finds each draw's shaders")
+    parser.add_argument("--gmd", action="store_true", help="Also match draws to GMD nodes, using a model DB generated next to the DB")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    db_path = args.db
+    if not db_path:
+        os.makedirs("bench_dbs", exist_ok=True)
+        db_path = os.path.join("bench_dbs", f"synthetic_{args.attribsets}_{args.seed}.db")
+        if not os.path.exists(db_path):
+            generate_db(db_path, args.attribsets, seed=args.seed)
+
+    db = ReadOnlyDb(db_path, expected_version=1)
+    shader_names = sorted(set(str(name) for (name,) in db.query("SELECT DISTINCT ShaderName FROM ShaderBytes")))
+    if not shader_names:
+        parser.error(f"{db_path} has no ShaderBytes rows to build a capture from")
+
+    db.conn.close()
+
+    draw_shapes = None
+    model_db_path = None
+    if args.gmd:
+        model_db_path = f"{os.path.splitext(db_path)[0]}.model.db"
+        if not os.path.exists(model_db_path) or os.path.getmtime(model_db_path) < os.path.getmtime(db_path):
+            generate_model_db(model_db_path, db_path, seed=args.seed)
+        # Make the capture's draws look like the model DB's nodes, so they can be matched
+        draw_shapes = {}
+        model_db = ReadOnlyDb(model_db_path, expected_version=1)
+        for shader, num_indices_list, num_indices_strip in model_db.query(
+            "SELECT AttribSet.Shader, NumIndicesTriList, NumIndicesTriStrip FROM DrawCalls JOIN AttribSet ON AttribSet.ROWID = DrawCalls.AttribSetId"
+        ):
+            draw_shapes.setdefault(shader, []).append((num_indices_list, rd.Topology.TriangleList))
+            draw_shapes[shader].append((num_indices_strip, rd.Topology.TriangleStrip))
+        model_db.conn.close()
+
+    start = time.perf_counter()
+    r = generate_fake_capture(shader_names, args.draws, args.shader_pairs, args.run_length, args.unknown_fraction,
+                              seek_cost_s=args.seek_cost_us * 1e-6, seed=args.seed, draw_shapes=draw_shapes)
+    print(f"Generated fake capture with {len(r.draws)} draws in {time.perf_counter() - start:.3f}s")
+
+    best = None
+    best_trace = None
+    for _ in range(args.repeat):
+        r.num_seeks = 0
+        trace = AnalysisTrace(args.trace)
+        start = time.perf_counter()
+        resource_names, action_names = perform_analysis(r, db_path, trace, use_name_cache=args.name_cache,
+                                                         model_db_path=model_db_path, binding_mode=args.binding_mode)
+        seconds = time.perf_counter() - start
+        trace.close()
+        if best is None or seconds < best:
+            best, best_trace = seconds, trace
+    named_resources = sum(1 for names in resource_names.values() if names)
+    print(f"perform_analysis: best {best:.3f}s of {args.repeat}, {len(r.draws) / best:.0f} draws/s")
+    print(f"{r.num_seeks} SetFrameEvent calls, {named_resources}/{len(resource_names)} shaders named, {len(action_names)} actions named")
+    print(best_trace.summary())
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        perform_analysis(r, db_path, None, use_name_cache=args.name_cache, model_db_path=model_db_path,
+                         binding_mode=args.binding_mode)
+        profiler.disable()
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
@@ -0,0 +1,65 @@
+import argparse
+import time
+from typing import Dict
+from yk_analysis.analysis_helpers.db import ReadOnlyDb
+from yk_analysis.analysis_helpers.data import CompactShaderAggregate, ShaderAggregate
+from yk_analysis.analyse_shaders import DB_OPTIONS, analyze_all_shaders, analyze_all_shaders_sql, analyze_shader
+
+# Times the per-shader, single-scan and sql aggregation modes of analyse_shaders.py against the same DB,
+# and checks that they produce identical aggregates.
+
+def run_per_shader(db: ReadOnlyDb) -> Dict[str, ShaderAggregate]:
+    shaders = sorted(set(n for (n,) in db.query("SELECT DISTINCT Shader FROM AttribSet")))
+    return {
+        shader_name: analyze_shader(shader_name, db)
+        for shader_name in shaders
+    }
+
+def run_single_scan(db: ReadOnlyDb) -> Dict[str, ShaderAggregate]:
+    return analyze_all_shaders(db)
+
+def run_sql(db: ReadOnlyDb) -> Dict[str, ShaderAggregate]:
+    return analyze_all_shaders_sql(db)
+
+MODES = {
+    "per-shader": run_per_shader,
+    "single-scan": run_single_scan,
+    "sql": run_sql,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db")
+    parser.add_argument("--repeat", type=int, default=1, help="Run each mode this many times and keep the fastest")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, ShaderAggregate]] = {}
+    timings: Dict[str, float] = {}
+    for mode, run in MODES.items():
+        best = None
+        for _ in range(args.repeat):
+            # Use a fresh connection per run, so page cache warmup is comparable between modes
+            db = ReadOnlyDb(args.db, expected_version=1, **DB_OPTIONS)
+            start = time.perf_counter()
+            results[mode] = run(db)
+            elapsed = time.perf_counter() - start
+            db.conn.close()
+            if best is None or elapsed < best:
+                best = elapsed
+        timings[mode] = best
+
+    n_shaders = len(results["per-shader"])
+    print(f"{'Mode': <12}\t{'Seconds': >9}\t{'Shaders/s': >10}\tSpeedup")
+    for mode, elapsed in timings.items():
+        print(f"{mode: <12}\t{elapsed: >9.3f}\t{n_shaders / elapsed: >10.1f}\t{timings['per-shader'] / elapsed:.2f}x")
+
+    # The modes must be interchangeable, so compare the aggregates for every shader
+    reference = results["per-shader"]
+    for mode, result in results.items():
+        if result.keys() != reference.keys():
+            raise RuntimeError(f"Mode {mode} found shaders {sorted(result.keys() ^ reference.keys())} that per-shader didn't")
+        for shader_name, shader in reference.items():
+            # ShaderAggregate equality ignores the order of material keys, the compact form doesn't
+            if result[shader_name] != shader or CompactShaderAggregate.from_aggregate(result[shader_name]) != CompactShaderAggregate.from_aggregate(shader):
+                raise RuntimeError(f"Mode {mode} disagrees with per-shader for {shader_name}:\n{result[shader_name]}\n{shader}")
+    print(f"All modes produced identical aggregates for {n_shaders} shaders")
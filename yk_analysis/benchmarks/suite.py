@@ -0,0 +1,132 @@
+import argparse
+import io
+import os
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, List, Tuple
+import numpy as np
+from yk_analysis.analysis_helpers.data import ReportWriter, iter_report, report_sort_key
+from yk_analysis.analysis_helpers.db import ReadOnlyDb
+from yk_analysis.analysis_helpers.vertex import GMDVertexBufferLayout
+from yk_analysis.analyse_shaders import DB_OPTIONS, analyze_all_shaders
+from yk_analysis.benchmarks.generate_db import generate_db
+from yk_analysis.benchmarks.shader_aggregation import MODES
+from yk_analysis.export_shader_analysis_report import export_report
+
+# Runs the analysis CLIs' core operations against synthetic DBs of increasing size,
+# reporting throughput and peak Python heap usage (via tracemalloc) for each.
+
+@dataclass
+class BenchmarkResult:
+    scale: int
+    name: str
+    items: int
+    item_name: str
+    seconds: float
+    peak_bytes: int
+
+def measure(f: Callable[[], int], memory: bool) -> Tuple[int, float, int]:
+    # Runs f once for timing, and again under tracemalloc for peak memory (tracing slows it down too much to time).
+    # f returns the number of items it processed.
+    start = time.perf_counter()
+    items = f()
+    seconds = time.perf_counter() - start
+    peak = 0
+    if memory:
+        tracemalloc.start()
+        f()
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return items, seconds, peak
+
+def open_db(db_path: str) -> ReadOnlyDb:
+    return ReadOnlyDb(db_path, expected_version=1, **DB_OPTIONS)
+
+def count_rows(db_path: str, table: str) -> int:
+    db = open_db(db_path)
+    (n,) = db.cur.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+    db.conn.close()
+    return n
+
+def benchmark_scale(scale: int, db_path: str, report_path: str, memory: bool, skip_per_shader_above: int) -> List[BenchmarkResult]:
+    results = []
+    n_attribsets = count_rows(db_path, "AttribSet")
+
+    # Shader aggregation, in each mode analyse_shaders supports
+    for mode, run in MODES.items():
+        if mode == "per-shader" and scale > skip_per_shader_above:
+            continue
+        def aggregate():
+            db = open_db(db_path)
+            run(db)
+            db.conn.close()
+            return n_attribsets
+        items, seconds, peak = measure(aggregate, memory)
+        results.append(BenchmarkResult(scale, f"aggregate ({mode})", items, "AttribSet rows", seconds, peak))
+
+    # Report export, from a report generated with the fastest aggregation mode
+    db = open_db(db_path)
+    shaders = analyze_all_shaders(db)
+    db.conn.close()
+    with open(report_path, "w") as f:
+        writer = ReportWriter(f)
+        for shader_name in sorted(shaders, key=report_sort_key):
+            writer.write(shaders[shader_name])
+    def export():
+        with open(report_path, "r") as f:
+            export_report(f, io.StringIO())
+        return len(shaders)
+    items, seconds, peak = measure(export, memory)
+    results.append(BenchmarkResult(scale, "export report", items, "shaders", seconds, peak))
+
+    # Holding a whole report in memory, as ShaderAggregates and as CompactShaderAggregates
+    for compact in (False, True):
+        def load_report():
+            with open(report_path, "r") as f:
+                return len(list(iter_report(f, compact=compact)))
+        items, seconds, peak = measure(load_report, memory)
+        results.append(BenchmarkResult(scale, f"load report ({'compact' if compact else 'dataclass'})", items, "shaders", seconds, peak))
+
+    # Vertex layout decoding for every DrawCalls row, per row through the cache and as a batch
+    db = open_db(db_path)
+    row_flags = [int.from_bytes(vlf) for (vlf,) in db.query("SELECT VertLayoutFlags FROM DrawCalls")]
+    db.conn.close()
+    row_flags_array = np.array(row_flags, dtype=np.uint64)
+    def decode_per_row():
+        for flags in row_flags:
+            GMDVertexBufferLayout.build_vertex_buffer_layout_from_flags(flags).component_counts()
+        return len(row_flags)
+    def decode_batch():
+        GMDVertexBufferLayout.component_counts_from_flag_array(row_flags_array)
+        return len(row_flags)
+    items, seconds, peak = measure(decode_per_row, memory)
+    results.append(BenchmarkResult(scale, "layout decode (per row)", items, "DrawCalls rows", seconds, peak))
+    items, seconds, peak = measure(decode_batch, memory)
+    results.append(BenchmarkResult(scale, "layout decode (batch)", items, "DrawCalls rows", seconds, peak))
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", default="1000,10000,100000",
+                        help="Comma-separated AttribSet row counts to generate DBs for, up to 10000000")
+    parser.add_argument("--workdir", default="bench_dbs", help="Where to keep generated DBs, which are reused between runs")
+    parser.add_argument("--regenerate", action="store_true", help="Regenerate DBs even if they already exist")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc runs")
+    parser.add_argument("--skip-per-shader-above", type=int, default=100_000,
+                        help="Don't benchmark per-shader aggregation above this scale, it takes too long")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    print(f"{'Scale': >10}\t{'Benchmark': <28}\t{'Seconds': >9}\t{'Throughput': >28}\t{'Peak MiB': >9}")
+    for scale in [int(x) for x in args.scales.split(",")]:
+        db_path = os.path.join(args.workdir, f"synthetic_{scale}_{args.seed}.db")
+        if args.regenerate or not os.path.exists(db_path):
+            generate_db(db_path, scale, seed=args.seed)
+        report_path = os.path.join(args.workdir, f"synthetic_{scale}_{args.seed}.report.jsonl")
+        for r in benchmark_scale(scale, db_path, report_path, memory=not args.no_memory, skip_per_shader_above=args.skip_per_shader_above):
+            throughput = f"{r.items / r.seconds:.0f} {r.item_name}/s"
+            peak = f"{r.peak_bytes / (1024 * 1024):.1f}" if not args.no_memory else "-"
+            print(f"{r.scale: >10}\t{r.name: <28}\t{r.seconds: >9.3f}\t{throughput: >28}\t{peak: >9}", flush=True)
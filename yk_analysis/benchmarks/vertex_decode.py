@@ -0,0 +1,67 @@
+import argparse
+import time
+import numpy as np
+from yk_analysis.analysis_helpers.vertex import GMDVertexBufferLayout, VecCompFmt, VecStorage
+
+# Checks that every VecCompFmt survives a native -> transformed -> native round trip in both byte orders,
+# then times decoding and re-encoding a large vertex buffer with the NumPy path.
+
+def random_native_values(storage: VecStorage, big_endian: bool, n_vertices: int, rng: np.random.Generator) -> np.ndarray:
+    native_dtype = storage.numpy_native_dtype(big_endian)
+    if storage.comp_fmt in [VecCompFmt.Float16, VecCompFmt.Float32]:
+        # Random bytes could be NaNs, which don't compare equal, so generate real numbers instead
+        values = rng.uniform(-1000.0, 1000.0, size=(n_vertices, storage.n_comps))
+        return values.astype(native_dtype.base)
+    else:
+        info = np.iinfo(native_dtype.base)
+        return rng.integers(info.min, info.max, size=(n_vertices, storage.n_comps), endpoint=True).astype(native_dtype.base)
+
+def check_round_trips(n_vertices: int, rng: np.random.Generator):
+    for comp_fmt in VecCompFmt:
+        for big_endian in [False, True]:
+            for n_comps in range(1, 5):
+                storage = VecStorage(comp_fmt, n_comps)
+                native = random_native_values(storage, big_endian, n_vertices, rng)
+                raw = native.tobytes()
+                view = np.frombuffer(raw, dtype=storage.numpy_native_dtype(big_endian))
+                transformed = storage.transform_native_fmt_array(view)
+                assert transformed.dtype == storage.comp_fmt.numpy_transformed_dtype()
+                assert transformed.shape == (n_vertices, n_comps)
+                round_tripped = storage.untransform_array(big_endian, transformed)
+                if round_tripped.tobytes() != raw:
+                    raise RuntimeError(f"{storage} (big_endian={big_endian}) didn't survive a round trip")
+    print(f"All {len(VecCompFmt)} VecCompFmts round-trip in both byte orders")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vertices", type=int, default=1_000_000)
+    parser.add_argument("--flags", type=lambda x: int(x, 0), default=0xFFFFFF812D61AF74,
+                        help="VertLayoutFlags for the benchmarked layout, defaults to one using every kind of attribute")
+    parser.add_argument("--big-endian", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    check_round_trips(1000, rng)
+
+    layout = GMDVertexBufferLayout.build_vertex_buffer_layout_from_flags(args.flags)
+    print(f"Layout 0x{args.flags:016x}: stride {layout.stride()} bytes, offsets {layout.attribute_offsets()}")
+    native = np.zeros(args.vertices, dtype=layout.numpy_native_dtype(args.big_endian))
+    for name, storage in layout.storages():
+        native[name] = random_native_values(storage, args.big_endian, args.vertices, rng)
+    raw = native.tobytes()
+
+    start = time.perf_counter()
+    view = layout.view_native_vertices(raw, args.big_endian)
+    decoded = layout.decode_vertices(view)
+    decode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encoded = layout.encode_vertices(args.big_endian, decoded).tobytes()
+    encode_time = time.perf_counter() - start
+
+    if encoded != raw:
+        raise RuntimeError("Vertex buffer didn't survive a round trip")
+    print(f"{'Operation': <10}\t{'Seconds': >9}\t{'Vertices/s': >12}\t{'MB/s': >8}")
+    for operation, elapsed in [("decode", decode_time), ("encode", encode_time)]:
+        print(f"{operation: <10}\t{elapsed: >9.4f}\t{args.vertices / elapsed: >12.0f}\t{len(raw) / elapsed / 1e6: >8.1f}")
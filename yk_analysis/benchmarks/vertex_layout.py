@@ -0,0 +1,234 @@
+import argparse
+import random
+import sys
+import time
+from typing import Iterable, Optional, Set
+import numpy as np
+from yk_analysis.analysis_helpers.vertex import GMDVertexBufferLayout, VecCompFmt, VecStorage, VERTEX_COMPONENT_NAMES
+
+# Compares decoding VertLayoutFlags one row at a time with the original set-based decoder,
+# one row at a time with the current uncached decoder, one row at a time through the layout cache,
+# and with the batch NumPy API.
+
+def baseline_decode_vertex_buffer_layout_from_flags(vertex_packing_flags: int, checked: bool = True) -> GMDVertexBufferLayout:
+    # The original set-based decoder, before decode_vertex_buffer_layout_from_flags tracked touched bits in a bitmask.
+    # Copied from the first version of vertex.py, minus its commented-out code, as the baseline to compare against.
+    # This derived from the 010 template
+    # Bit-checking logic - keep track of the bits we examine, to ensure we don't miss anything
+    if checked:
+        touched_packing_bits: Set[int] = set()
+
+        def touch_bits(bit_indices: Iterable[int]):
+            touched_bits = set(bit_indices)
+            touched_packing_bits.update(touched_bits)
+    else:
+        def touch_bits(bit_indices: Iterable[int]):
+            pass
+
+    # Helper for extracting a bitrange start:length and marking those bits as touched.
+    def extract_bits(start, length):
+        touch_bits(range(start, start + length))
+
+        # Extract bits by shifting down to start and generating a mask of `length` 1's in binary
+        # TODO that is the worst possible way to generate that mask.
+        return (vertex_packing_flags >> start) & int('1' * length, 2)
+
+    # Helper for extracting a bitmask and marking those bits as touched.
+    def extract_bitmask(bitmask):
+        touch_bits([i for i in range(32) if ((bitmask >> i) & 1)])
+
+        return vertex_packing_flags & bitmask
+
+    # If the given vector type is `en`abled, extract the bits start:start+2 and find the VecStorage they refer to.
+    # If the vector uses full-precision float components, the length is set by `full_precision_n_comps`.
+    # If the vector uses byte-size components, the format of those bytes is set by `byte_fmt`.
+    def extract_vector_type(en: bool, start: int,
+                            full_precision_n_comps: int, byte_fmt: VecCompFmt) -> Optional[VecStorage]:
+        bits = extract_bits(start, 2)
+        if en:
+            if bits == 0:
+                # Float32
+                comp_fmt = VecCompFmt.Float32
+                n_comps = full_precision_n_comps
+            elif bits == 1:
+                # Float16
+                comp_fmt = VecCompFmt.Float16
+                n_comps = 4
+            else:
+                # Some kind of fixed
+                comp_fmt = byte_fmt
+                n_comps = 4
+            return VecStorage(comp_fmt, n_comps)
+        else:
+            return None
+
+    # pos can be (3 or 4) * (half or full) floats
+    pos_count = extract_bits(0, 3)
+    pos_precision = extract_bits(3, 1)
+    pos_storage = VecStorage(
+        comp_fmt=VecCompFmt.Float16 if pos_precision == 1 else VecCompFmt.Float32,
+        n_comps=3 if pos_count == 3 else 4
+    )
+
+    weight_en = extract_bitmask(0x70)
+    weights_storage = extract_vector_type(weight_en, 7, full_precision_n_comps=4, byte_fmt=VecCompFmt.Byte_0_1)
+
+    bones_en = extract_bitmask(0x200)
+    bones_storage = VecStorage(VecCompFmt.Byte_0_255, 4) if bones_en else None
+
+    normal_en = extract_bitmask(0x400)
+    normal_storage = extract_vector_type(normal_en, 11, full_precision_n_comps=3,
+                                         byte_fmt=VecCompFmt.Byte_Minus1_1)
+
+    tangent_en = extract_bitmask(0x2000)
+    # Previously this was unpacked with 0_1 because it was arbitrary data.
+    # We interpret it as [-1,1] here, and assume it's always equal to the actual tangent.
+    # This is usually a good assumption because basically everything needs normal maps, especially character models
+    tangent_storage = extract_vector_type(tangent_en, 14, full_precision_n_comps=3,
+                                          byte_fmt=VecCompFmt.Byte_Minus1_1)
+
+    unk_en = extract_bitmask(0x0001_0000)
+    unk_storage = extract_vector_type(unk_en, 17, full_precision_n_comps=3, byte_fmt=VecCompFmt.Byte_0_1)
+
+    # TODO: Are we sure these bits aren't used for something?
+    touch_bits((19, 20))
+
+    # col0 is diffuse and opacity for GMD versions up to 0x03000B
+    col0_en = extract_bitmask(0x0020_0000)
+    col0_storage = extract_vector_type(col0_en, 22, full_precision_n_comps=4, byte_fmt=VecCompFmt.Byte_0_1)
+
+    # col1 is specular for GMD versions up to 0x03000B
+    col1_en = extract_bitmask(0x0100_0000)
+    col1_storage = extract_vector_type(col1_en, 25, full_precision_n_comps=4, byte_fmt=VecCompFmt.Byte_0_1)
+
+    # Extract the uv_enable and uv_count bits, to fill out the first 32 bits of the flags
+    uv_en = extract_bits(27, 1)
+    uv_count = extract_bits(28, 4)
+    uv_storages = []
+    if uv_count:
+        if uv_en:
+            # Iterate over all uv bits, checking for active UV slots
+            for i in range(8):
+                uv_slot_bits = extract_bits(32 + (i * 4), 4)
+                if uv_slot_bits == 0xF:
+                    continue
+
+                # format_bits is a value between 0 and 3
+                format_bits = (uv_slot_bits >> 2) & 0b11
+                if format_bits in [2, 3]:
+                    uv_storages.append(VecStorage(VecCompFmt.Byte_0_1, 4))
+                else:  # format_bits are 0 or 1
+                    bit_count_idx = uv_slot_bits & 0b11
+                    bit_count = (2, 3, 4, 1)[bit_count_idx]
+
+                    # Component format is float16 or float32
+                    uv_comp_fmt = VecCompFmt.Float16 if format_bits else VecCompFmt.Float32
+
+                    uv_storages.append(VecStorage(uv_comp_fmt, n_comps=bit_count))
+
+                if len(uv_storages) == uv_count:
+                    # Touch the rest of the bits
+                    touch_bits(range(32 + ((i + 1) * 4), 64))
+                    break
+        else:
+            # Touch all of the uv bits, without doing anything with them
+            touch_bits(range(32, 64))
+            print(
+                f"Layout Flags {vertex_packing_flags:016x} claimed to have {uv_count} UVs "
+                f"but UVs are disabled", file=sys.stderr)
+    else:
+        # No UVs at all
+        touch_bits(range(32, 64))
+        uv_storages = []
+        pass
+
+    if checked:
+        expected_touched_bits = {x for x in range(64)}
+        if touched_packing_bits != expected_touched_bits:
+            raise ValueError(
+                f"Incomplete vertex format parse - "
+                f"bits {expected_touched_bits - touched_packing_bits} were not touched")
+
+    return GMDVertexBufferLayout(
+        pos_storage=pos_storage,
+        weights_storage=weights_storage,
+        bones_storage=bones_storage,
+        normal_storage=normal_storage,
+        tangent_storage=tangent_storage,
+        unk_storage=unk_storage,
+        col0_storage=col0_storage,
+        col1_storage=col1_storage,
+        uv_storages=tuple(uv_storages),
+
+        packing_flags=vertex_packing_flags,
+    )
+
+def random_vertex_layout_flags(rng: random.Random) -> int:
+    flags = rng.getrandbits(64)
+    # Set uv_enable whenever uv_count is nonzero, otherwise the decoder complains about every value
+    if (flags >> 28) & 0xF:
+        flags |= 1 << 27
+    return flags
+
+def time_best(f, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of DrawCalls rows to simulate")
+    parser.add_argument("--unique", type=int, default=300, help="Number of distinct VertLayoutFlags values among the rows")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    unique_flags = [random_vertex_layout_flags(rng) for _ in range(args.unique)]
+    row_flags = [rng.choice(unique_flags) for _ in range(args.rows)]
+    row_flags_array = np.array(row_flags, dtype=np.uint64)
+
+    def baseline():
+        return [
+            baseline_decode_vertex_buffer_layout_from_flags(f).component_counts()
+            for f in row_flags
+        ]
+
+    def uncached():
+        return [
+            GMDVertexBufferLayout.decode_vertex_buffer_layout_from_flags(f).component_counts()
+            for f in row_flags
+        ]
+
+    def cached():
+        return [
+            GMDVertexBufferLayout.build_vertex_buffer_layout_from_flags(f).component_counts()
+            for f in row_flags
+        ]
+
+    def batch():
+        return GMDVertexBufferLayout.component_counts_from_flag_array(row_flags_array)
+
+    # Check they all agree before timing them
+    expected = np.array(baseline(), dtype=np.uint8)
+    assert np.array_equal(np.array(uncached(), dtype=np.uint8), expected)
+    assert np.array_equal(np.array(cached(), dtype=np.uint8), expected)
+    batch_counts = batch()
+    assert np.array_equal(np.stack([batch_counts[name] for name in VERTEX_COMPONENT_NAMES], axis=1), expected)
+
+    timings = {
+        "baseline": time_best(baseline, args.repeat),
+        "uncached": time_best(uncached, args.repeat),
+        "cached": time_best(cached, args.repeat),
+        "batch": time_best(batch, args.repeat),
+    }
+    print(f"{args.rows} rows, {args.unique} unique flags")
+    print("baseline = original set-based decoder, uncached = current decoder without the layout cache")
+    print(f"{'Method': <10}\t{'Seconds': >9}\t{'Rows/s': >12}\tSpeedup vs baseline")
+    for method, elapsed in timings.items():
+        print(f"{method: <10}\t{elapsed: >9.4f}\t{args.rows / elapsed: >12.0f}\t{timings['baseline'] / elapsed:.1f}x")
@@ -0,0 +1,99 @@
+import argparse
+import os
+import sys
+from typing import Dict, List, Optional, TextIO
+from yk_analysis.analysis_helpers.data import ShaderAggregate, report_sort_key, shader_display_name
+from yk_analysis.analysis_helpers.db import ReadOnlyDb
+from yk_analysis.analyse_shaders import DB_OPTIONS, EXPECTED_DRAWCALL_DB_VERSION, TEXTURE_COLUMNS, analyze_all_shaders_in_games
+
+# Compares shader feature usage between games.
+# Every game's DB is ATTACHed to one connection and aggregated in shared scans (analyze_all_shaders_in_games),
+# then each shader's features are printed as a feature x game matrix, with the features that differ between games marked.
+
+# Shown for shaders a game doesn't use
+MISSING = "-"
+
+def shader_features(s: ShaderAggregate) -> Dict[str, str]:
+    features = {
+        "Flags": " ".join(f"0x{flag:08x}" for flag in sorted(s.flags)),
+        "VertexFormats": " ".join(f"0x{vlf:08x}/{bpv:d}" for (vlf, bpv) in sorted(s.vertex_format)),
+    }
+    if s.uses_matrices == {False}:
+        features["(Un)skinned"] = "Unskin"
+    elif s.uses_matrices == {True}:
+        features["(Un)skinned"] = "Skin"
+    elif s.uses_matrices == {True, False}:
+        features["(Un)skinned"] = "Both"
+    else:
+        features["(Un)skinned"] = "None"
+    for column, used in zip(TEXTURE_COLUMNS.split(", "), s.textures):
+        features[column] = str(used)
+    for k, v in s.material.items():
+        features[f"Mat-{k}"] = str(v)
+    for i, e in enumerate(s.extra_properties):
+        features[f"Ext{i:02d}"] = str(e)
+    return features
+
+def compare_games(db_paths: List[str], names: List[str], out: TextIO = sys.stdout, show_all: bool = False):
+    db = ReadOnlyDb(db_paths[0], expected_version=EXPECTED_DRAWCALL_DB_VERSION, **DB_OPTIONS)
+    schemas = ["main"]
+    for i, db_path in enumerate(db_paths[1:], start=1):
+        schema = f"game{i}"
+        db.attach(db_path, schema, expected_version=EXPECTED_DRAWCALL_DB_VERSION)
+        schemas.append(schema)
+
+    aggregates = analyze_all_shaders_in_games(db, schemas)
+    shader_names = sorted(set(shader_name for (_game, shader_name) in aggregates), key=report_sort_key)
+
+    n_differing = 0
+    print("\t".join(["Shader", "Feature", "Differs"] + names), file=out)
+    for shader_name in shader_names:
+        per_game: List[Optional[Dict[str, str]]] = [
+            shader_features(aggregates[(game, shader_name)]) if (game, shader_name) in aggregates else None
+            for game in range(len(schemas))
+        ]
+        # Features in the order the first game using the shader lists them, then any other games' extra material keys
+        feature_names: Dict[str, None] = {"Present": None}
+        for features in per_game:
+            if features is not None:
+                feature_names.update(dict.fromkeys(features))
+
+        rows = []
+        for feature in feature_names:
+            if feature == "Present":
+                values = [str(features is not None) for features in per_game]
+            else:
+                values = [MISSING if features is None else features.get(feature, MISSING) for features in per_game]
+            # Games which don't use the shader don't count as differing, that's already shown by Present
+            differs = len(set(v for v, features in zip(values, per_game) if features is not None or feature == "Present")) > 1
+            rows.append((feature, differs, values))
+
+        if any(differs for _feature, differs, _values in rows):
+            n_differing += 1
+        elif not show_all:
+            continue
+        for feature, differs, values in rows:
+            if differs or show_all:
+                print("\t".join([shader_display_name(shader_name), feature, "*" if differs else ""] + values), file=out)
+
+    print(f"{n_differing}/{len(shader_names)} shaders differ between {', '.join(names)}", file=sys.stderr)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db", nargs="+", help="One DB per game")
+    parser.add_argument("--names", help="Comma-separated game names for the columns, defaults to the DB file names")
+    parser.add_argument("--all", action="store_true", help="Print every feature of every shader, not just the ones that differ")
+    parser.add_argument("-o", "--output", help="Write the matrix here instead of stdout")
+    args = parser.parse_args()
+
+    if len(args.db) < 2:
+        parser.error("Need at least two DBs to compare")
+    names = args.names.split(",") if args.names else [os.path.splitext(os.path.basename(path))[0] for path in args.db]
+    if len(names) != len(args.db):
+        parser.error(f"Got {len(names)} names for {len(args.db)} DBs")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            compare_games(args.db, names, f, show_all=args.all)
+    else:
+        compare_games(args.db, names, show_all=args.all)
@@ -0,0 +1,117 @@
+import argparse
+import sys
+from typing import Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+from yk_analysis.analysis_helpers.data import CompactShaderAggregate, iter_report, report_sort_key, shader_display_name
+from yk_analysis.analyse_shaders import TEXTURE_COLUMNS
+
+# Diffs two shader analysis reports, e.g. from before and after a game patch.
+# Both reports are streamed in report_sort_key order and merge-joined, so neither is held in memory.
+# Shaders are compared through a per-field key tuple of their CompactShaderAggregates, built once per shader,
+# so unchanged shaders are skipped with one tuple comparison and only changed fields get decoded and printed.
+
+TEXTURE_NAMES = TEXTURE_COLUMNS.split(", ")
+
+def bit_names(mask: int, names: List[str]) -> List[str]:
+    return [name for i, name in enumerate(names) if (mask >> i) & 1]
+
+def describe_set_change(old: Tuple, new: Tuple, fmt: Callable) -> str:
+    removed = sorted(set(old) - set(new))
+    added = sorted(set(new) - set(old))
+    return " ".join([f"+{fmt(v)}" for v in added] + [f"-{fmt(v)}" for v in removed])
+
+def describe_mask_change(old: int, new: int, names: List[str]) -> str:
+    return " ".join([f"+{name}" for name in bit_names(new & ~old, names)] + [f"-{name}" for name in bit_names(old & ~new, names)])
+
+def describe_material_change(old: CompactShaderAggregate, new: CompactShaderAggregate) -> str:
+    old_material = old.material
+    new_material = new.material
+    changes = [f"+{k}={v}" for k, v in new_material.items() if k not in old_material]
+    changes += [f"-{k}" for k in old_material if k not in new_material]
+    changes += [f"{k}: {old_material[k]} -> {v}" for k, v in new_material.items() if k in old_material and old_material[k] != v]
+    if not changes and list(old_material) != list(new_material):
+        changes.append("key order changed")
+    return ", ".join(changes)
+
+SKINNING_NAMES = ["unskinned", "skinned"]
+EXTRA_PROPERTY_NAMES = [f"Ext{i:02d}" for i in range(16)]
+
+# (field name, describe(old, new)), in the same order as field_keys()
+DIFF_FIELDS: List[Tuple[str, Callable[[CompactShaderAggregate, CompactShaderAggregate], str]]] = [
+    ("flags",
+     lambda old, new: describe_set_change(old.flag_values, new.flag_values, lambda f: f"0x{f:08x}")),
+    ("textures",
+     lambda old, new: describe_mask_change(old.textures_mask, new.textures_mask, TEXTURE_NAMES)),
+    ("material", describe_material_change),
+    ("extra_properties",
+     lambda old, new: describe_mask_change(old.extra_properties_mask, new.extra_properties_mask, EXTRA_PROPERTY_NAMES)),
+    ("vertex_format",
+     lambda old, new: describe_set_change(old.vertex_format_values, new.vertex_format_values, lambda vf: f"0x{vf[0]:08x}/{vf[1]:d}")),
+    ("uses_matrices",
+     lambda old, new: describe_mask_change(old.uses_matrices_mask, new.uses_matrices_mask, SKINNING_NAMES)),
+]
+
+def field_keys(s: CompactShaderAggregate) -> Tuple:
+    # One exact key per DIFF_FIELDS entry, in the same order, written out by hand because this runs for every shader.
+    # The fields are already bitmasks and sorted tuples, so equal keys mean equal fields, with no hash collisions to worry about.
+    # Material key tuples are interned, so comparing them is usually an identity check.
+    return (
+        s.flag_values,
+        s.textures_mask,
+        (s.material_keys, s.material_mask),
+        s.extra_properties_mask,
+        s.vertex_format_values,
+        s.uses_matrices_mask,
+    )
+
+def iter_sorted_report(f: TextIO) -> Iterator[Tuple[Tuple, CompactShaderAggregate, Tuple]]:
+    # Yields (sort key, aggregate, field keys), checking the report really is in report_sort_key order,
+    # because the merge-join silently gives wrong answers otherwise
+    last_key: Optional[Tuple] = None
+    for s in iter_report(f, compact=True):
+        key = report_sort_key(s.shader)
+        if last_key is not None and key <= last_key:
+            raise ValueError(f"{getattr(f, 'name', 'Report')} isn't sorted by report_sort_key at shader {shader_display_name(s.shader)}, regenerate it with analyse_shaders.py")
+        last_key = key
+        yield key, s, field_keys(s)
+
+def diff_reports(old_report: TextIO, new_report: TextIO, out: TextIO = sys.stdout) -> Dict[str, int]:
+    # Prints "+ shader" for added shaders, "- shader" for removed ones, and "~ shader" followed by the changed fields for changed ones.
+    # Returns the number of shaders in each category.
+    counts = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+    old_iter = iter_sorted_report(old_report)
+    new_iter = iter_sorted_report(new_report)
+    old = next(old_iter, None)
+    new = next(new_iter, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            print(f"- {shader_display_name(old[1].shader)}", file=out)
+            counts["removed"] += 1
+            old = next(old_iter, None)
+        elif old is None or new[0] < old[0]:
+            print(f"+ {shader_display_name(new[1].shader)}", file=out)
+            counts["added"] += 1
+            new = next(new_iter, None)
+        else:
+            (_key, old_shader, old_fields), (_key, new_shader, new_fields) = old, new
+            if old_fields == new_fields:
+                counts["unchanged"] += 1
+            else:
+                print(f"~ {shader_display_name(new_shader.shader)}", file=out)
+                for (name, describe), old_field, new_field in zip(DIFF_FIELDS, old_fields, new_fields):
+                    if old_field != new_field:
+                        print(f"\t{name}: {describe(old_shader, new_shader)}", file=out)
+                counts["changed"] += 1
+            old = next(old_iter, None)
+            new = next(new_iter, None)
+    return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old_report")
+    parser.add_argument("new_report")
+    args = parser.parse_args()
+
+    with open(args.old_report, "r") as old_report, open(args.new_report, "r") as new_report:
+        counts = diff_reports(old_report, new_report)
+    print(", ".join(f"{n} {category}" for category, n in counts.items()), file=sys.stderr)
+    sys.exit(1 if counts["added"] or counts["removed"] or counts["changed"] else 0)
@@ -1,21 +1,18 @@
 import argparse
-from typing import cast
-from yk_analysis.analysis_helpers.data import ShaderAggregate
+import itertools
+import sys
+from typing import TextIO, cast
+from yk_analysis.analysis_helpers.data import CompactShaderAggregate, iter_report, shader_display_name
 from yk_analysis.analysis_helpers.vertex import GMDVertexBufferLayout
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument("report")
-    args = parser.parse_args()
-
-    with open(args.report, "r") as f:
-        shader_analysis = [
-            eval(l)
-            for l in f.readlines()
-            if l.strip()
-        ]
-
-    shader_analysis.sort(key=lambda s: s.shader[2:])
+def export_report(report: TextIO, out: TextIO = sys.stdout):
+    # Reports are already sorted by report_sort_key, so they can be streamed straight through
+    shader_analysis = iter_report(report, compact=True)
+    # The material columns are taken from the first shader
+    first_shader = next(shader_analysis, None)
+    material_keys = first_shader.material.keys() if first_shader else []
+    if first_shader:
+        shader_analysis = itertools.chain([first_shader], shader_analysis)
 
     columns = [
         "NVertPos",
@@ -39,44 +36,23 @@ if __name__ == '__main__':
         "TexRt",
         "TexRd",
     ] + [
-        f"Mat-{k}" for k in shader_analysis[0].material.keys()
+        f"Mat-{k}" for k in material_keys
     ] + [
         f"Ext{i:02d}" for i in range(16)
     ]
 
 
-    print(f"{'Name': <30}\t", "\t".join(columns))
+    print(f"{'Name': <30}\t", "\t".join(columns), file=out)
     for s in shader_analysis:
-        s = cast(ShaderAggregate, s)
+        s = cast(CompactShaderAggregate, s)
 
-        print(f"{s.shader: <30}", end="\t")
+        print(f"{shader_display_name(s.shader): <30}", end="\t", file=out)
 
         # vertex flags
         (vflags, vbytes) = next(iter(s.vertex_format))
         layout = GMDVertexBufferLayout.build_vertex_buffer_layout_from_flags(vflags)
-        storage_ns = [
-            layout.pos_storage.n_comps,
-            layout.weights_storage.n_comps if layout.weights_storage else 0,
-            layout.bones_storage.n_comps if layout.bones_storage else 0,
-            layout.normal_storage.n_comps if layout.normal_storage else 0,
-            layout.tangent_storage.n_comps if layout.tangent_storage else 0,
-            layout.unk_storage.n_comps if layout.unk_storage else 0,
-            layout.col0_storage.n_comps if layout.col0_storage else 0,
-            layout.col1_storage.n_comps if layout.col1_storage else 0,
-        ] + [
-            layout.uv_storages[i].n_comps if i < len(layout.uv_storages) else 0
-            for i in range(8)
-        ]
-        # pos_storage: VecStorage
-        # weights_storage: Optional[VecStorage]
-        # bones_storage: Optional[VecStorage]
-        # normal_storage: Optional[VecStorage]
-        # tangent_storage: Optional[VecStorage]
-        # unk_storage: Optional[VecStorage]
-        # col0_storage: Optional[VecStorage]
-        # col1_storage: Optional[VecStorage]
-        # uv_storages: Tuple[VecStorage, ...] # max length 8
-        print("\t".join(str(x) for x in storage_ns), end="\t")
+        storage_ns = layout.component_counts()
+        print("\t".join(str(x) for x in storage_ns), end="\t", file=out)
 
         # skinning
         if s.uses_matrices == {False}:
@@ -87,12 +63,20 @@ if __name__ == '__main__':
             skin = "Both"
         else:
             skin = f"unk{s.uses_matrices}"
-        print(skin, end="\t")
+        print(skin, end="\t", file=out)
         
         for t in s.textures:
-            print(t, end="\t")
+            print(t, end="\t", file=out)
         for v in s.material.values():
-            print(v, end="\t")
+            print(v, end="\t", file=out)
         for e in s.extra_properties:
-            print(e, end="\t")
-        print()
\ No newline at end of file
+            print(e, end="\t", file=out)
+        print(file=out)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("report")
+    args = parser.parse_args()
+
+    with open(args.report, "r") as f:
+        export_report(f)
@@ -0,0 +1,21 @@
+import argparse
+from yk_analysis.analysis_helpers.db import sidecar_db_path
+from yk_analysis.analysis_helpers.sidecar import prepare, shader_table_path
+
+# Builds the read-optimized sidecar DB (and shader table) next to a game DB.
+# ReadOnlyDb and the RenderDoc plugin pick them up automatically, until the original DB changes.
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db", nargs="+")
+    parser.add_argument("--no-shader-table", action="store_true",
+                        help="Don't build the SHA256 -> shader name table used by the RenderDoc plugin")
+    args = parser.parse_args()
+
+    for db_path in args.db:
+        built_shader_table = prepare(db_path, shader_table=not args.no_shader_table)
+        print(f"Built {sidecar_db_path(db_path)}")
+        if built_shader_table:
+            print(f"Built {shader_table_path(db_path)}")
+        elif not args.no_shader_table:
+            print(f"Skipped the shader table for {db_path}, it has no ShaderBytes table")
@@ -1,10 +1,45 @@
+import time
 from hashlib import sha256
-from typing import Any, Dict, List, Optional, Set, Tuple, cast
+from threading import Event
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, cast
 import renderdoc as rd
 from yk_analysis.analysis_helpers.db import ReadOnlyDb
+from yk_analysis.analysis_helpers.sidecar import ShaderHashTable
+from yk_analysis.renderdoc.chunk_bindings import ChunkBinding, resolve_chunk_bindings
+from yk_analysis.renderdoc.gmd_matcher import TOPOLOGY_TRIANGLE_LIST, TOPOLOGY_TRIANGLE_STRIP, GMDNodeIndex
+from yk_analysis.renderdoc.name_cache import ShaderKey, ShaderNameCache
+from yk_analysis.renderdoc.trace import AnalysisTrace
 
 ShaderNameSet = Optional[Set[Tuple[str, str]]]
 
+# Keep IN (...) lists comfortably under SQLite's default host parameter limit of 999
+SHADER_LOOKUP_CHUNK_SIZE = 500
+
+# How many draws to replay between progress reports and checks for cancellation
+PROGRESS_INTERVAL = 1000
+# How many action names to hand to the results callback at once
+RESULT_BATCH_SIZE = 500
+
+# How perform_analysis finds the shaders bound at each draw, see perform_analysis
+BINDING_MODES = ["chunks", "replay"]
+
+# (phase description, done, total)
+ProgressCallback = Callable[[str, int, int], None]
+# (shader names, action names), called with shader names once they're final and then action names in batches
+ResultsCallback = Callable[[Dict[rd.ResourceId, ShaderNameSet], Dict[int, str]], None]
+
+class AnalysisCancelled(Exception):
+    pass
+
+# Everything the naming pass needs to know about a draw, recorded while replaying it.
+class DrawRecord(NamedTuple):
+    eventId: int
+    vsResourceId: rd.ResourceId
+    psResourceId: rd.ResourceId
+    indexOffset: int
+    numIndices: int
+    topology: Optional[str] # One of the gmd_matcher TOPOLOGY_ constants, or None if GMD nodes can't be drawn with it
+
 def condensed_manyname(names: ShaderNameSet) -> str:
     if not names:
         return "??"
@@ -14,84 +49,32 @@ def condensed_manyname(names: ShaderNameSet) -> str:
     else:
         return "(" + " | ".join(shader for _cat, shader in names) + ")"
 
-def perform_analysis(r: rd.ReplayController, db_path: str, dbg_file) -> Tuple[Dict[rd.ResourceId, ShaderNameSet], Dict[int, str]]:
-    if dbg_file:
-        cnt = 0
-        def print_d(*args):
-            nonlocal cnt
-            cnt += 1
-            dbg_file.write(f"dbg {cnt}: {' '.join(str(a) for a in args)}\n")
-            dbg_file.flush()
-            # mqt.InvokeOntoUIThread(lambda: ctx.Extensions().MessageDialog(f"dbg {cnt}: {s}", "Extension message"))
-    else:
-        def print_d(*args):
-            pass
-
-    print_d("opening db")
-    db = ReadOnlyDb(db_path, expected_version=1)
-    print_d("opened db")      
-    
-    shader_names: Dict[rd.ResourceId, ShaderNameSet] = {}
-
-    # Given a RenderDoc shader object, translates its data into DB-compatible formats and looks it up in the DB.
-    # If this shader has been lookedup before, returns the contents of shader_names[s.resourceId].
-    # Otherwise sets shader_names[s.resourceId] with the possible names retrieved from the DB.
-    def lookup_shader_in_db(s: rd.D3D11Shader) -> ShaderNameSet:
-        if s.resourceId in shader_names:
-            return shader_names[s.resourceId]
-        shader_names[s.resourceId] = None
-        print_d("resourceId", s.resourceId)
-
-        print_d("stage", s.stage)
-        if s.stage == rd.ShaderStage.Vertex:
-            shader_stage = "Vertex"
-        elif s.stage == rd.ShaderStage.Pixel:
-            shader_stage = "Fragment"
-        else:
-            return None
-        
-        print_d("encoding", s.reflection.encoding)
-        if s.reflection.encoding == rd.ShaderEncoding.DXBC:
-            bytes_type = "DXBC"
-        else:
-            return None
-        
-        h = sha256()
-        h.update(s.reflection.rawBytes)
-        d = h.digest()
-        print_d("digest", d)
-        
-        db.cur.execute("SELECT Category, ShaderName FROM ShaderBytes WHERE ShaderStage = ? AND BytesType = ? AND SHA256 = ?", (shader_stage, bytes_type, d, ))
-        possible_names: Optional[Set[Tuple[str, str]]] = set(
-            (str(cat), str(s_name))
-            for cat, s_name in db.cur.fetchall()
-        )
-        if not possible_names:
-            possible_names = None
-        print_d(f"shaderId@", s.resourceId, shader_stage, bytes_type, possible_names)
-        shader_names[s.resourceId] = possible_names
-        return possible_names
-    
-    # Given a pair of shaders, looks up both of them in the DB, sees if they have a common name and if so sets both their entries in shader_names to just that name.
-    def lookup_shader_pair(vert: rd.D3D11Shader, pix: rd.D3D11Shader) -> Tuple[ShaderNameSet, ShaderNameSet]:
-        vert_names = lookup_shader_in_db(vert)
-        pix_names = lookup_shader_in_db(pix)
-
-        if vert_names is None or pix_names is None:
-            return vert_names, pix_names
+def query_shader_names(db: ReadOnlyDb, keys: Set[ShaderKey]) -> Dict[ShaderKey, Set[Tuple[str, str]]]:
+    # Bulk version of looking up (Category, ShaderName) for each key in the ShaderBytes table.
+    # Keys with no matching names are left out of the result.
+    digests_by_type: Dict[Tuple[str, str], List[bytes]] = {}
+    for (shader_stage, bytes_type, digest) in keys:
+        digests_by_type.setdefault((shader_stage, bytes_type), []).append(digest)
 
-        common_names = vert_names.intersection(pix_names)
-        if common_names:
-            print_d("intersected vertId@", vert.resourceId, "pixId@", pix.resourceId, "new names", common_names)
-            # These are references to the objects inside shader_names
-            vert_names.intersection_update(common_names)
-            # shader_names[pix.resourceId] = vert_names # Don't do intersection_update, make them literally the same object so further refinements apply to both
-            pix_names.intersection_update(common_names)
-        return vert_names, pix_names
+    names: Dict[ShaderKey, Set[Tuple[str, str]]] = {}
+    for (shader_stage, bytes_type), digests in digests_by_type.items():
+        for i in range(0, len(digests), SHADER_LOOKUP_CHUNK_SIZE):
+            chunk = digests[i:i + SHADER_LOOKUP_CHUNK_SIZE]
+            for digest, cat, s_name in db.query(
+                f"SELECT SHA256, Category, ShaderName FROM ShaderBytes WHERE ShaderStage = ? AND BytesType = ? AND SHA256 IN ({', '.join('?' * len(chunk))})",
+                (shader_stage, bytes_type, *chunk)
+            ):
+                names.setdefault((shader_stage, bytes_type, bytes(digest)), set()).add((str(cat), str(s_name)))
+    return names
 
-    action_names: Dict[int, str] = {}
+def gmd_topology(topology: rd.Topology) -> Optional[str]:
+    if topology == rd.Topology.TriangleList:
+        return TOPOLOGY_TRIANGLE_LIST
+    elif topology == rd.Topology.TriangleStrip:
+        return TOPOLOGY_TRIANGLE_STRIP
+    return None
 
-    # First pass: find correct shader_names
+def iter_draw_actions(r: rd.ReplayController) -> Iterator[rd.ActionDescription]:
     # Start iterating from the first real action as a child of markers
     action = cast(rd.ActionDescription, r.GetRootActions()[0])
     while len(action.children) > 0:
@@ -99,43 +82,267 @@ def perform_analysis(r: rd.ReplayController, db_path: str, dbg_file) -> Tuple[Di
 
     while action is not None:
         if action.flags & rd.ActionFlags.Drawcall:
-            r.SetFrameEvent(action.eventId, False) # force=False
-            d3d11state = r.GetD3D11PipelineState()
-            vertex_name, pixel_name = lookup_shader_pair(d3d11state.vertexShader, d3d11state.pixelShader)
-
-            print_d("action@", action.eventId, "vertId@",  d3d11state.vertexShader.resourceId, vertex_name, "pixId@", d3d11state.pixelShader.resourceId,  pixel_name)
-
+            yield action
         action = action.next
 
-    # Second pass: find new action names
-    # Start iterating from the first real action as a child of markers
-    action = cast(rd.ActionDescription, r.GetRootActions()[0])
+def last_event_id(r: rd.ReplayController) -> int:
+    action = cast(rd.ActionDescription, r.GetRootActions()[-1])
     while len(action.children) > 0:
-        action = action.children[0]
+        action = action.children[-1]
+    return action.eventId
 
-    while action is not None:
-        if action.flags & rd.ActionFlags.Drawcall:
-            r.SetFrameEvent(action.eventId, False) # force=False
-            d3d11state = r.GetD3D11PipelineState()
-            
-            vertex_name = shader_names.get(d3d11state.vertexShader.resourceId)
-            pixel_name = shader_names.get(d3d11state.pixelShader.resourceId)
+def perform_analysis(r: rd.ReplayController, db_path: str, trace: Optional[AnalysisTrace] = None, use_name_cache: bool = True,
+                     progress: Optional[ProgressCallback] = None, cancel: Optional[Event] = None,
+                     results: Optional[ResultsCallback] = None, model_db_path: Optional[str] = None,
+                     binding_mode: str = "chunks", name_cache: Optional[ShaderNameCache] = None) -> Tuple[Dict[rd.ResourceId, ShaderNameSet], Dict[int, str]]:
+    # progress is called every so often from the replay thread, and the analysis raises AnalysisCancelled once cancel is set.
+    # If results is given, it's passed the names as soon as they're final, so they can be applied before the analysis finishes.
+    # If name_cache is given it's used instead of loading the one on disk, and the caller is responsible for saving it.
+    def check_progress(phase: str, done: int, total: int):
+        if cancel is not None and cancel.is_set():
+            raise AnalysisCancelled()
+        if progress is not None:
+            progress(phase, done, total)
+
+    if binding_mode not in BINDING_MODES:
+        raise ValueError(f"Unknown binding mode {binding_mode}, expected one of {BINDING_MODES}")
+    if trace is None:
+        trace = AnalysisTrace()
+    print_d = trace.event
+    traversal = trace.phase("traversal")
+    set_frame_event = trace.phase("SetFrameEvent")
+    pipeline_fetch = trace.phase("pipeline fetch")
+    hashing = trace.phase("sha256")
+    db_lookup = trace.phase("DB lookup")
+    naming = trace.phase("naming")
+
+    t = time.perf_counter()
+    # If prepare_db.py has built a shader table for this DB, binary search that instead of querying SQLite
+    shader_table = ShaderHashTable.open_for_db(db_path, expected_version=1)
+    db: Optional[ReadOnlyDb] = None
+    # Both are closed however the analysis ends, including when it's cancelled
+    try:
+        if shader_table is not None:
+            print_d("using shader table")
+        else:
+            print_d("opening db")
+            db = ReadOnlyDb(db_path, expected_version=1)
+            print_d("opened db")
+        t = db_lookup.lap(t)
+
+        # If a model DB is given, draws matching exactly one GMD node are named after it
+        gmd_nodes: Optional[GMDNodeIndex] = None
+        if model_db_path:
+            print_d("loading gmd nodes")
+            model_db = ReadOnlyDb(model_db_path, expected_version=1)
+            try:
+                gmd_nodes = GMDNodeIndex.load(model_db)
+            finally:
+                model_db.conn.close()
+            print_d("loaded", len(gmd_nodes.nodes), "gmd node keys")
+            t = trace.phase("GMD index load").lap(t)
+    
+        # (stage, encoding, sha256) for each shader resource seen so far, or None if it can't be in the DB
+        shader_keys: Dict[rd.ResourceId, Optional[ShaderKey]] = {}
+
+        # Given a RenderDoc shader object, translates its data into DB-compatible formats.
+        # Each resource is only hashed once, the actual DB lookup happens in bulk after the replay pass.
+        def record_shader_key(s: rd.D3D11Shader):
+            if s.resourceId in shader_keys:
+                return
+            shader_keys[s.resourceId] = None
+            print_d("resourceId", s.resourceId)
+
+            if s.reflection is None:
+                # Nothing bound
+                return
+
+            print_d("stage", s.stage)
+            if s.stage == rd.ShaderStage.Vertex:
+                shader_stage = "Vertex"
+            elif s.stage == rd.ShaderStage.Pixel:
+                shader_stage = "Fragment"
+            else:
+                return
+        
+            print_d("encoding", s.reflection.encoding)
+            if s.reflection.encoding == rd.ShaderEncoding.DXBC:
+                bytes_type = "DXBC"
+            else:
+                return
+        
+            h = sha256()
+            h.update(s.reflection.rawBytes)
+            d = h.digest()
+            print_d("digest", d)
+            shader_keys[s.resourceId] = (shader_stage, bytes_type, d)
+
+        # First pass: find the shaders bound at each draw, hash them and record the bindings for later passes.
+        # In "chunks" mode the bindings are worked out from the structured capture, and a draw is only replayed
+        # if it binds a shader that hasn't been hashed yet or its bindings couldn't be worked out.
+        # In "replay" mode every draw is replayed.
+        total_events = last_event_id(r)
+        check_progress("Replaying draws", 0, total_events)
+        t = time.perf_counter()
+        actions = list(iter_draw_actions(r))
+        t = traversal.lap(t)
+        bindings: List[Optional[ChunkBinding]] = [None] * len(actions)
+        if binding_mode == "chunks":
+            bindings = resolve_chunk_bindings(r.GetStructuredFile(), [action.events[-1].chunkIndex for action in actions], print_d)
+            t = trace.phase("chunk walk").lap(t)
+            print_d("resolved", sum(1 for b in bindings if b is not None), "of", len(bindings), "bindings from chunks")
+
+        def collect_draws(bindings: List[Optional[ChunkBinding]]) -> Optional[List[DrawRecord]]:
+            # Returns None if a replayed draw doesn't match the bindings worked out from the chunks
+            draws: List[DrawRecord] = []
+            t = time.perf_counter()
+            for i, (action, binding) in enumerate(zip(actions, bindings)):
+                if binding is not None and binding[0] in shader_keys and binding[1] in shader_keys:
+                    vs, ps, topology = binding
+                else:
+                    r.SetFrameEvent(action.eventId, False) # force=False
+                    t = set_frame_event.lap(t)
+                    d3d11state = r.GetD3D11PipelineState()
+                    t = pipeline_fetch.lap(t)
+                    record_shader_key(d3d11state.vertexShader)
+                    record_shader_key(d3d11state.pixelShader)
+                    t = hashing.lap(t)
+                    vs = d3d11state.vertexShader.resourceId
+                    ps = d3d11state.pixelShader.resourceId
+                    topology = gmd_topology(d3d11state.inputAssembly.topology)
+                    if binding is not None and binding != (vs, ps, topology):
+                        print_d("chunk binding", binding, "doesn't match replayed action@", action.eventId, vs, ps, topology)
+                        return None
+
+                print_d("action@", action.eventId, "vertId@", vs, "pixId@", ps)
+
+                draws.append(DrawRecord(
+                    eventId=action.eventId,
+                    vsResourceId=vs,
+                    psResourceId=ps,
+                    indexOffset=action.indexOffset,
+                    numIndices=action.numIndices,
+                    topology=topology,
+                ))
+                if (i + 1) % PROGRESS_INTERVAL == 0:
+                    check_progress("Replaying draws", action.eventId, total_events)
+                t = traversal.lap(t)
+            return draws
+
+        draws = collect_draws(bindings)
+        if draws is None:
+            # Something the chunk walk doesn't understand happened, so don't trust any of its bindings
+            print_d("falling back to replaying every draw")
+            draws = collect_draws([None] * len(actions))
+        t = time.perf_counter()
+        check_progress("Looking up shaders", 0, len(draws))
+
+        # Look up every unique shader in one go, outside the replay loop.
+        # Shaders seen in previous captures are answered by the name cache without touching the DB.
+        keys = set(key for key in shader_keys.values() if key is not None)
+        if shader_table is not None:
+            names_by_key = {}
+            for key in keys:
+                names = shader_table.lookup(*key)
+                if names:
+                    names_by_key[key] = names
+        elif use_name_cache or name_cache is not None:
+            owns_name_cache = name_cache is None
+            if name_cache is None:
+                name_cache = ShaderNameCache.load(db_path, db)
+            names_by_key, uncached_keys = name_cache.lookup(keys)
+            print_d("name cache hits", len(keys) - len(uncached_keys), "misses", len(uncached_keys))
+            queried_names = query_shader_names(db, uncached_keys)
+            names_by_key.update(queried_names)
+            name_cache.update(uncached_keys, queried_names)
+            if owns_name_cache:
+                try:
+                    name_cache.save()
+                except OSError as err:
+                    # The cache is only an optimization, e.g. the DB may be in a read-only directory
+                    print_d("couldn't save name cache", err)
+        else:
+            names_by_key = query_shader_names(db, keys)
+        t = db_lookup.lap(t)
+        shader_names: Dict[rd.ResourceId, ShaderNameSet] = {}
+        for resourceId, key in shader_keys.items():
+            possible_names: ShaderNameSet = None
+            if key is not None and names_by_key.get(key):
+                # Each resource gets its own set, because they're refined separately below
+                possible_names = set(names_by_key[key])
+            print_d(f"shaderId@", resourceId, key, possible_names)
+            shader_names[resourceId] = possible_names
+
+        # Given a pair of shaders used together, sees if they have a common name and if so sets both their entries in shader_names to just that name.
+        def refine_shader_pair(vert: rd.ResourceId, pix: rd.ResourceId) -> Tuple[ShaderNameSet, ShaderNameSet]:
+            vert_names = shader_names.get(vert)
+            pix_names = shader_names.get(pix)
+
+            if vert_names is None or pix_names is None:
+                return vert_names, pix_names
+
+            common_names = vert_names.intersection(pix_names)
+            if common_names:
+                print_d("intersected vertId@", vert, "pixId@", pix, "new names", common_names)
+                # These are references to the objects inside shader_names
+                vert_names.intersection_update(common_names)
+                # shader_names[pix.resourceId] = vert_names # Don't do intersection_update, make them literally the same object so further refinements apply to both
+                pix_names.intersection_update(common_names)
+            return vert_names, pix_names
+
+        action_names: Dict[int, str] = {}
+
+        # Refine shader_names by intersecting the vertex/pixel shaders used together, in draw order
+        for draw in draws:
+            vertex_name, pixel_name = refine_shader_pair(draw.vsResourceId, draw.psResourceId)
+            print_d("action@", draw.eventId, "vertId@", draw.vsResourceId, vertex_name, "pixId@", draw.psResourceId, pixel_name)
+        if results is not None:
+            results(shader_names, {})
+
+        # Second pass: find new action names.
+        # shader_names is final now, so this only needs the recorded draws - no more replay seeks.
+        action_names_batch: Dict[int, str] = {}
+        # How many draws have been named after each GMD node so far, e.g. a node drawn in several passes,
+        # so repeats are told apart as "name#2", "name#3" etc.
+        gmd_node_occurrences: Dict[str, int] = {}
+        for i, draw in enumerate(draws):
+            if i % RESULT_BATCH_SIZE == 0:
+                if results is not None and action_names_batch:
+                    results({}, action_names_batch)
+                    action_names_batch = {}
+                check_progress("Naming actions", i, len(draws))
+            vertex_name = shader_names.get(draw.vsResourceId)
+            pixel_name = shader_names.get(draw.psResourceId)
             if vertex_name is None and pixel_name is None:
                 action_name = None
             elif vertex_name == pixel_name:
                 action_name = f"{condensed_manyname(vertex_name)}"
             else:
                 action_name = f"{condensed_manyname(vertex_name)} - {condensed_manyname(pixel_name)}"
-            
+
+            if gmd_nodes is not None and vertex_name:
+                gmd_node_name = gmd_nodes.match((shader for _cat, shader in vertex_name), draw.numIndices, draw.topology)
+                if gmd_node_name:
+                    occurrence = gmd_node_occurrences.get(gmd_node_name, 0) + 1
+                    gmd_node_occurrences[gmd_node_name] = occurrence
+                    action_name = gmd_node_name if occurrence == 1 else f"{gmd_node_name}#{occurrence}"
+
             if action_name:
                 # action.GetName returns some extra cruft e.g. "ID3D11DeviceContext::DrawIndexed()" instead of DrawIndexed
-                if action.indexOffset:
-                    old_name = f"DrawIndexed({action.numIndices})"
+                if draw.indexOffset:
+                    old_name = f"DrawIndexed({draw.numIndices})"
                 else:
-                    old_name = f"Draw({action.numIndices})"
+                    old_name = f"Draw({draw.numIndices})"
                 # old_name = action.GetName(r.GetStructuredFile())
-                action_names[action.eventId] = f"{old_name} - {action_name}"
-
-        action = action.next
+                action_names[draw.eventId] = f"{old_name} - {action_name}"
+                action_names_batch[draw.eventId] = action_names[draw.eventId]
+        if results is not None and action_names_batch:
+            results({}, action_names_batch)
+        naming.lap(t)
 
-    return shader_names, action_names
\ No newline at end of file
+        return shader_names, action_names
+    finally:
+        if shader_table is not None:
+            shader_table.close()
+        if db is not None:
+            db.conn.close()
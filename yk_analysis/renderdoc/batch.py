@@ -0,0 +1,133 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Set, Tuple
+import renderdoc as rd
+from yk_analysis.analysis_helpers.db import ReadOnlyDb
+from yk_analysis.analysis_helpers.sidecar import shader_table_path
+from yk_analysis.renderdoc.analyse import BINDING_MODES, perform_analysis
+from yk_analysis.renderdoc.name_cache import ShaderKey, ShaderNameCache
+from yk_analysis.renderdoc.results_file import CaptureResults, ResultsWriter
+
+# Runs perform_analysis over many .rdc captures without the RenderDoc UI, using the headless renderdoc module
+# (put RenderDoc's renderdoc.pyd/.so on PYTHONPATH), and writes every capture's names to one results file
+# which the UI's "Yakuza Scan (Apply Results File)" menu can apply to a loaded capture.
+#
+# Captures are spread over a process pool. The shader name cache is shared: each worker starts from the cache on disk,
+# sends the names it had to look up back with its results, and the parent merges them into the cache and saves it at the end.
+
+def replay_succeeded(result) -> bool:
+    # Newer RenderDoc versions return ResultDetails, older ones a ReplayStatus
+    if hasattr(result, "OK"):
+        return result.OK()
+    return result == rd.ReplayStatus.Succeeded
+
+def open_capture(path: str):
+    # Returns (capture file, replay controller), both of which have to be Shutdown() afterwards
+    cap = rd.OpenCaptureFile()
+    result = cap.OpenFile(path, '', None)
+    if not replay_succeeded(result):
+        cap.Shutdown()
+        raise RuntimeError(f"Couldn't open {path}: {result}")
+    if cap.LocalReplaySupport() != rd.ReplaySupport.Supported:
+        cap.Shutdown()
+        raise RuntimeError(f"{path} can't be replayed on this machine")
+    result, controller = cap.OpenCapture(rd.ReplayOptions(), None)
+    if not replay_succeeded(result):
+        cap.Shutdown()
+        raise RuntimeError(f"Couldn't replay {path}: {result}")
+    return cap, controller
+
+# Each worker process keeps its own copy of the name cache, and remembers which entries it has already sent to the parent
+worker_args: Optional[Tuple[str, Optional[str], str]] = None
+worker_name_cache: Optional[ShaderNameCache] = None
+worker_sent_keys: Set[ShaderKey] = set()
+
+def init_worker(db_path: str, model_db_path: Optional[str], binding_mode: str):
+    global worker_args, worker_name_cache, worker_sent_keys
+    rd.InitialiseReplay(rd.GlobalEnvironment(), [])
+    worker_args = (db_path, model_db_path, binding_mode)
+    # With a shader table, perform_analysis doesn't need the cache
+    if not os.path.exists(shader_table_path(db_path)):
+        db = ReadOnlyDb(db_path, expected_version=1)
+        worker_name_cache = ShaderNameCache.load(db_path, db)
+        db.conn.close()
+        worker_sent_keys = set(worker_name_cache.entries)
+
+def analyse_capture_in_worker(path: str) -> Tuple[CaptureResults, Dict[ShaderKey, Set[Tuple[str, str]]], float]:
+    # Returns (results, name cache entries added since the last capture, seconds taken)
+    global worker_sent_keys
+    assert worker_args is not None
+    db_path, model_db_path, binding_mode = worker_args
+    start = time.perf_counter()
+    try:
+        cap, controller = open_capture(path)
+        try:
+            shader_names, action_names = perform_analysis(controller, db_path, model_db_path=model_db_path,
+                                                          binding_mode=binding_mode, name_cache=worker_name_cache)
+        finally:
+            controller.Shutdown()
+            cap.Shutdown()
+        results = CaptureResults(
+            capture=path,
+            shader_names={int(resource_id): sorted(names) for resource_id, names in shader_names.items() if names},
+            action_names=action_names,
+            error=None,
+        )
+    except Exception as err:
+        results = CaptureResults(path, {}, {}, f"{err}")
+
+    new_entries: Dict[ShaderKey, Set[Tuple[str, str]]] = {}
+    if worker_name_cache is not None:
+        new_entries = {key: names for key, names in worker_name_cache.entries.items() if key not in worker_sent_keys}
+        worker_sent_keys.update(new_entries)
+    return results, new_entries, time.perf_counter() - start
+
+def analyse_captures(captures: List[str], db_path: str, model_db_path: Optional[str], binding_mode: str, jobs: int, out_path: str):
+    name_cache: Optional[ShaderNameCache] = None
+    if not os.path.exists(shader_table_path(db_path)):
+        db = ReadOnlyDb(db_path, expected_version=1)
+        name_cache = ShaderNameCache.load(db_path, db)
+        db.conn.close()
+
+    n_failed = 0
+    start = time.perf_counter()
+    with open(out_path, "w") as f, multiprocessing.Pool(jobs, initializer=init_worker, initargs=(db_path, model_db_path, binding_mode)) as pool:
+        writer = ResultsWriter(f)
+        # imap keeps the output in the same order as the arguments
+        for results, new_entries, seconds in pool.imap(analyse_capture_in_worker, captures):
+            writer.write(results)
+            if name_cache is not None:
+                name_cache.update(new_entries.keys(), new_entries)
+            if results.error is not None:
+                n_failed += 1
+                print(f"{results.capture}: failed after {seconds:.1f}s: {results.error}", file=sys.stderr)
+            else:
+                print(f"{results.capture}: {len(results.shader_names)} shaders, {len(results.action_names)} actions named in {seconds:.1f}s")
+
+    if name_cache is not None:
+        try:
+            name_cache.save()
+        except OSError as err:
+            print(f"Couldn't save the name cache: {err}", file=sys.stderr)
+    print(f"Analysed {len(captures) - n_failed}/{len(captures)} captures in {time.perf_counter() - start:.1f}s, results in {out_path}")
+    return n_failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("captures", nargs="+", help=".rdc files to analyse")
+    parser.add_argument("--db", required=True, help="Shader DB")
+    parser.add_argument("--model-db", help="Model DB, to name draws after the GMD nodes they draw")
+    parser.add_argument("-o", "--output", required=True, help="Results file to write")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Number of captures to analyse in parallel")
+    parser.add_argument("--binding-mode", choices=BINDING_MODES, default="chunks")
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    # Absolute paths, so the UI can find the results for a capture
+    captures = [os.path.abspath(path) for path in args.captures]
+    n_failed = analyse_captures(captures, args.db, args.model_db, args.binding_mode, min(args.jobs, len(captures)), args.output)
+    sys.exit(1 if n_failed else 0)
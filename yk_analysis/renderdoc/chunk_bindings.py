@@ -0,0 +1,84 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from yk_analysis.renderdoc.gmd_matcher import TOPOLOGY_TRIANGLE_LIST, TOPOLOGY_TRIANGLE_STRIP
+
+# Works out the shaders and topology bound at each draw from the capture's structured chunks,
+# by walking the API calls in order and tracking the D3D11 immediate context state they set.
+# This needs no replay at all, unlike SetFrameEvent + GetD3D11PipelineState.
+#
+# State set before the capture started isn't in the chunks, so draws before the first VSSetShader etc. can't be resolved.
+# Neither can draws after calls which change state in ways that aren't tracked (e.g. executing a deferred command list).
+# Those draws come back as None, and the caller has to replay them.
+# So do draws after a state-setting call whose parameters are missing from its chunk.
+
+# (vertex shader, pixel shader, topology as a gmd_matcher TOPOLOGY_ constant or None)
+ChunkBinding = Tuple[Any, Any, Optional[str]]
+
+# D3D11_PRIMITIVE_TOPOLOGY values
+D3D11_TOPOLOGIES = {
+    4: TOPOLOGY_TRIANGLE_LIST,
+    5: TOPOLOGY_TRIANGLE_STRIP,
+}
+
+# Calls which leave the context in a state we don't track.
+# ClearState unbinds the shaders, and draws without shaders need replaying to see what happens to them anyway.
+UNTRACKABLE_CALLS = {"ClearState", "ExecuteCommandList", "SwapDeviceContextState"}
+
+class UnknownState:
+    pass
+
+UNKNOWN = UnknownState()
+
+def no_trace(*args):
+    pass
+
+def find_child(chunk, chunk_index: int, name: str, print_d: Callable[..., None]):
+    # Returns None if the chunk doesn't have the parameter, which leaves that piece of state unknown
+    child = chunk.FindChild(name)
+    if child is None:
+        print_d("chunk", chunk_index, chunk.name, "has no", name, "parameter, replaying draws until it's set again")
+    return child
+
+def resolve_chunk_bindings(sdfile, draw_chunk_indices: List[int], print_d: Callable[..., None] = no_trace) -> List[Optional[ChunkBinding]]:
+    # Returns the binding for the draw at each chunk index, or None if it couldn't be worked out.
+    # print_d is called with details of any chunks that couldn't be read, e.g. AnalysisTrace.event
+    bindings: List[Optional[ChunkBinding]] = [None] * len(draw_chunk_indices)
+    if not draw_chunk_indices:
+        return bindings
+    chunks = sdfile.chunks
+    # Usually already in order, draws are listed in the order they were called
+    order = sorted(range(len(draw_chunk_indices)), key=lambda d: draw_chunk_indices[d])
+    last_chunk = min(draw_chunk_indices[order[-1]], len(chunks) - 1)
+
+    vs: Any = UNKNOWN
+    ps: Any = UNKNOWN
+    topology: Any = UNKNOWN
+    next_draw = 0
+    # Chunk name -> method name, e.g. "ID3D11DeviceContext::VSSetShader" or "ID3D11DeviceContext1::VSSetShader" -> "VSSetShader".
+    # There are only a few distinct names, so only split each once.
+    calls: Dict[str, str] = {}
+    for i in range(last_chunk + 1):
+        name = chunks[i].name
+        call = calls.get(name)
+        if call is None:
+            call = calls[name] = str(name).rsplit("::", 1)[-1]
+        if call == "VSSetShader":
+            child = find_child(chunks[i], i, "pShader", print_d)
+            vs = UNKNOWN if child is None else child.AsResourceId()
+        elif call == "PSSetShader":
+            child = find_child(chunks[i], i, "pShader", print_d)
+            ps = UNKNOWN if child is None else child.AsResourceId()
+        elif call == "IASetPrimitiveTopology":
+            child = find_child(chunks[i], i, "Topology", print_d)
+            topology = UNKNOWN if child is None else D3D11_TOPOLOGIES.get(child.AsInt())
+        elif call in UNTRACKABLE_CALLS:
+            vs = UNKNOWN
+            ps = UNKNOWN
+            topology = UNKNOWN
+
+        while next_draw < len(order) and draw_chunk_indices[order[next_draw]] <= i:
+            d = order[next_draw]
+            if draw_chunk_indices[d] == i and not (vs is UNKNOWN or ps is UNKNOWN or topology is UNKNOWN):
+                bindings[d] = (vs, ps, topology)
+            next_draw += 1
+
+    return bindings
@@ -0,0 +1,68 @@
+from typing import Dict, Iterable, Optional, Tuple
+from yk_analysis.analysis_helpers.db import ReadOnlyDb
+
+# Matches draws in a capture to the GMD model nodes they draw, by their shader and index count.
+#
+# GMD files store shader names truncated, so only the first GMD_SHADER_PREFIX_LEN characters are compared.
+# A node has different index counts depending on whether it's drawn as a triangle list or a strip,
+# so the model DB stores both and the capture's topology picks which one to compare against.
+#
+# The model DB's DrawCalls table needs these columns on top of AttribSetId:
+# GMDFile, NodeName, DrawOrder, NumIndicesTriList, NumIndicesTriStrip
+# (benchmarks/generate_db.py --model-db generates a synthetic one)
+GMD_SHADER_PREFIX_LEN = 30
+GMD_NODE_COLUMNS = ["GMDFile", "NodeName", "DrawOrder", "NumIndicesTriList", "NumIndicesTriStrip"]
+
+TOPOLOGY_TRIANGLE_LIST = "TriangleList"
+TOPOLOGY_TRIANGLE_STRIP = "TriangleStrip"
+
+# (shader prefix, number of indices, topology)
+GMDNodeKey = Tuple[str, int, str]
+
+class GMDNodeIndex:
+    # In-memory hash index over every DrawCalls row of a model DB, loaded once per analysis.
+    # Each key maps to the name of the only node it matches, or None if it matches several distinct nodes.
+    nodes: Dict[GMDNodeKey, Optional[str]]
+
+    def __init__(self):
+        self.nodes = {}
+
+    def add(self, shader: str, num_indices: int, topology: str, name: str):
+        key = (shader[:GMD_SHADER_PREFIX_LEN], num_indices, topology)
+        existing = self.nodes.get(key, name)
+        self.nodes[key] = name if existing == name else None
+
+    @staticmethod
+    def load(db: ReadOnlyDb) -> 'GMDNodeIndex':
+        columns = set(name for (_cid, name, *_rest) in db.cur.execute("PRAGMA table_info(DrawCalls)"))
+        missing = [c for c in GMD_NODE_COLUMNS if c not in columns]
+        if missing:
+            raise ValueError(f"The model DB's DrawCalls table is missing GMD node columns {missing}")
+
+        index = GMDNodeIndex()
+        for shader, gmd_file, node_name, draw_order, num_indices_list, num_indices_strip in db.query(
+            "SELECT AttribSet.Shader, GMDFile, NodeName, DrawOrder, NumIndicesTriList, NumIndicesTriStrip "
+            "FROM DrawCalls JOIN AttribSet ON AttribSet.ROWID = DrawCalls.AttribSetId",
+            num_of_rows=10000
+        ):
+            name = f"{shader}.{gmd_file}.{node_name}.{draw_order}"
+            if num_indices_list is not None:
+                index.add(shader, int(num_indices_list), TOPOLOGY_TRIANGLE_LIST, name)
+            if num_indices_strip is not None:
+                index.add(shader, int(num_indices_strip), TOPOLOGY_TRIANGLE_STRIP, name)
+        return index
+
+    def match(self, shader_names: Iterable[str], num_indices: int, topology: Optional[str]) -> Optional[str]:
+        # Returns the node name if exactly one distinct node matches any of the (candidate) shader names
+        if topology is None:
+            return None
+        matched: Optional[str] = None
+        for shader in set(s[:GMD_SHADER_PREFIX_LEN] for s in shader_names):
+            key = (shader, num_indices, topology)
+            if key not in self.nodes:
+                continue
+            name = self.nodes[key]
+            if name is None or (matched is not None and matched != name):
+                return None
+            matched = name
+        return matched
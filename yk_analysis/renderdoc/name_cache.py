@@ -0,0 +1,91 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from yk_analysis.analysis_helpers.db import ReadOnlyDb, db_content_fingerprint
+
+# (ShaderStage, BytesType, SHA256) as stored in the ShaderBytes table
+ShaderKey = Tuple[str, str, bytes]
+
+# On-disk cache of ShaderBytes lookups, stored next to the shader DB.
+# Maps ShaderKey -> set of (Category, ShaderName). Keys with no names are cached too, so misses aren't re-queried.
+# The whole cache is thrown away if the DB's user_version or content fingerprint changes.
+NAME_CACHE_FORMAT = "yk_shader_name_cache"
+NAME_CACHE_VERSION = 1
+
+class ShaderNameCache:
+    path: str
+    user_version: int
+    fingerprint: str
+    entries: Dict[ShaderKey, Set[Tuple[str, str]]]
+    dirty: bool
+
+    def __init__(self, path: str, user_version: int, fingerprint: str):
+        self.path = path
+        self.user_version = user_version
+        self.fingerprint = fingerprint
+        self.entries = {}
+        self.dirty = False
+
+    @staticmethod
+    def cache_path_for_db(db_path: str) -> str:
+        return f"{db_path}.names.json"
+
+    @staticmethod
+    def load(db_path: str, db: ReadOnlyDb) -> 'ShaderNameCache':
+        # Returns the cache for this DB, or an empty one if it doesn't exist yet or is out of date
+        cache = ShaderNameCache(ShaderNameCache.cache_path_for_db(db_path), db.version, db_content_fingerprint(db_path))
+        try:
+            with open(cache.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cache
+
+        if (data.get("format") != NAME_CACHE_FORMAT
+                or data.get("version") != NAME_CACHE_VERSION
+                or data.get("user_version") != cache.user_version
+                or data.get("fingerprint") != cache.fingerprint):
+            return cache
+
+        for shader_stage, bytes_type, digest_hex, names in data["entries"]:
+            cache.entries[(shader_stage, bytes_type, bytes.fromhex(digest_hex))] = set(
+                (cat, s_name) for cat, s_name in names
+            )
+        return cache
+
+    def lookup(self, keys: Iterable[ShaderKey]) -> Tuple[Dict[ShaderKey, Set[Tuple[str, str]]], Set[ShaderKey]]:
+        # Returns ({key: names} for cached keys with names, set of keys that aren't cached)
+        hits: Dict[ShaderKey, Set[Tuple[str, str]]] = {}
+        misses: Set[ShaderKey] = set()
+        for key in keys:
+            names = self.entries.get(key)
+            if names is None:
+                misses.add(key)
+            elif names:
+                hits[key] = names
+        return hits, misses
+
+    def update(self, queried_keys: Iterable[ShaderKey], names_by_key: Dict[ShaderKey, Set[Tuple[str, str]]]):
+        # Records the result of looking up queried_keys in the DB. Keys missing from names_by_key had no names.
+        for key in queried_keys:
+            self.entries[key] = set(names_by_key.get(key, ()))
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = {
+            "format": NAME_CACHE_FORMAT,
+            "version": NAME_CACHE_VERSION,
+            "user_version": self.user_version,
+            "fingerprint": self.fingerprint,
+            "entries": [
+                [shader_stage, bytes_type, digest.hex(), sorted(names)]
+                for (shader_stage, bytes_type, digest), names in self.entries.items()
+            ],
+        }
+        # Write to a temporary file first, so a crash can't leave a half-written cache behind
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
@@ -0,0 +1,65 @@
+import json
+import os
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+# Naming results for a batch of captures, written by batch.py and re-applied in the UI.
+#
+# JSON Lines, starting with a {"format", "version"} header line, then one line per capture:
+# {"capture": path, "shader_names": {resourceId: [[category, name], ...]}, "action_names": {eventId: name}}
+# or {"capture": path, "error": message} if it couldn't be analysed.
+# ResourceIds and eventIds are stored as ints (JSON object keys, so strings), which are stable for a given capture file.
+RESULTS_FORMAT = "yk_capture_names"
+RESULTS_VERSION = 1
+
+class CaptureResults(NamedTuple):
+    capture: str
+    shader_names: Dict[int, List[Tuple[str, str]]]
+    action_names: Dict[int, str]
+    error: Optional[str]
+
+def capture_results_to_record(results: CaptureResults) -> Dict[str, Any]:
+    if results.error is not None:
+        return {"capture": results.capture, "error": results.error}
+    return {
+        "capture": results.capture,
+        "shader_names": {str(resource_id): [list(name) for name in sorted(names)] for resource_id, names in sorted(results.shader_names.items())},
+        "action_names": {str(event_id): name for event_id, name in sorted(results.action_names.items())},
+    }
+
+def capture_results_from_record(record: Dict[str, Any]) -> CaptureResults:
+    if "error" in record:
+        return CaptureResults(record["capture"], {}, {}, record["error"])
+    return CaptureResults(
+        capture=record["capture"],
+        shader_names={int(resource_id): [(cat, name) for cat, name in names] for resource_id, names in record["shader_names"].items()},
+        action_names={int(event_id): name for event_id, name in record["action_names"].items()},
+        error=None,
+    )
+
+class ResultsWriter:
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.f.write(json.dumps({"format": RESULTS_FORMAT, "version": RESULTS_VERSION}) + "\n")
+
+    def write(self, results: CaptureResults):
+        self.f.write(json.dumps(capture_results_to_record(results), separators=(",", ":")) + "\n")
+
+def iter_results(f: TextIO) -> Iterator[CaptureResults]:
+    header = json.loads(f.readline() or "{}")
+    if header.get("format") != RESULTS_FORMAT or header.get("version") != RESULTS_VERSION:
+        raise ValueError(f"Not a version {RESULTS_VERSION} capture results file")
+    for line in f:
+        if line.strip():
+            yield capture_results_from_record(json.loads(line))
+
+def find_capture_results(all_results: List[CaptureResults], capture_path: str) -> Optional[CaptureResults]:
+    # Finds the results for a capture, by path or, if the results were made on another machine, by unique file name
+    def normalize(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+    for results in all_results:
+        if normalize(results.capture) == normalize(capture_path):
+            return results
+    same_name = [results for results in all_results if os.path.basename(results.capture) == os.path.basename(capture_path)]
+    if len(same_name) == 1:
+        return same_name[0]
+    return None
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional, TextIO
+
+# Instrumentation for the RenderDoc analysis.
+#
+# Time is always accumulated per phase, which costs a couple of perf_counter calls per step
+# and is cheap enough to leave on. The detailed event trace is only recorded when an output path is given,
+# and is buffered in memory and written out in batches so debugging doesn't change the timings much.
+
+# Where the debug trace goes if the user doesn't pick a file
+DEFAULT_TRACE_PATH = os.path.join(tempfile.gettempdir(), "yk_analysis_trace.txt")
+
+# How many trace lines to buffer before writing them out
+TRACE_FLUSH_LINES = 10000
+
+class PhaseCounter:
+    __slots__ = ("name", "calls", "seconds")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+
+    def lap(self, start: float) -> float:
+        # Adds the time since start to this phase, and returns the current time to start the next phase from
+        now = time.perf_counter()
+        self.calls += 1
+        self.seconds += now - start
+        return now
+
+class AnalysisTrace:
+    # Phases in the order they're shown in the summary, other phases are added after them
+    PHASES = ["traversal", "chunk walk", "SetFrameEvent", "pipeline fetch", "sha256", "DB lookup", "naming", "UI name application"]
+
+    out_path: Optional[str]
+    recording: bool
+    phases: Dict[str, PhaseCounter]
+    buffer: List[str]
+
+    def __init__(self, out_path: Optional[str] = None):
+        self.out_path = out_path
+        self.recording = out_path is not None
+        self.phases = {name: PhaseCounter(name) for name in AnalysisTrace.PHASES}
+        self.buffer = []
+        self.start_time = time.perf_counter()
+        if self.recording:
+            # Start a fresh trace for each run
+            with open(self.out_path, "w") as f:
+                f.write(f"yk_analysis trace started {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+
+    def phase(self, name: str) -> PhaseCounter:
+        # Look phases up once outside of loops, and call lap() on the counter inside them
+        if name not in self.phases:
+            self.phases[name] = PhaseCounter(name)
+        return self.phases[name]
+
+    def event(self, *args):
+        if not self.recording:
+            return
+        # Format now, rather than when flushing, because some arguments are sets that get refined later
+        self.buffer.append(f"{time.perf_counter() - self.start_time:.6f} {' '.join(str(a) for a in args)}\n")
+        if len(self.buffer) >= TRACE_FLUSH_LINES:
+            self.flush()
+
+    def flush(self):
+        if self.recording and self.buffer:
+            with open(self.out_path, "a") as f:
+                f.writelines(self.buffer)
+        self.buffer = []
+
+    def summary(self) -> str:
+        total = sum(p.seconds for p in self.phases.values())
+        lines = [f"{'Phase': <22}{'Calls': >10}{'Seconds': >10}{'Mean us': >10}{'%': >7}"]
+        for p in self.phases.values():
+            if not p.calls:
+                continue
+            lines.append(
+                f"{p.name: <22}{p.calls: >10}{p.seconds: >10.3f}{p.seconds * 1e6 / p.calls: >10.1f}{100 * p.seconds / total if total else 0: >7.1f}"
+            )
+        lines.append(f"{'total': <22}{'': >10}{total: >10.3f}")
+        return "\n".join(lines)
+
+    def close(self, out: Optional[TextIO] = None):
+        # Writes out the remaining trace and the summary table, which is also printed to out if given
+        summary = self.summary()
+        if self.recording:
+            self.buffer.append(summary + "\n")
+            self.flush()
+        if out is not None:
+            out.write(summary + "\n")
@@ -1,7 +1,13 @@
 import renderdoc as rd
 import qrenderdoc as qrd
 import PySide2.QtWidgets as widgets
-from yk_analysis.renderdoc.analyse import condensed_manyname, perform_analysis
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+from yk_analysis.renderdoc.analyse import AnalysisCancelled, ShaderNameSet, condensed_manyname, perform_analysis
+from yk_analysis.renderdoc.results_file import find_capture_results, iter_results
+from yk_analysis.renderdoc.trace import DEFAULT_TRACE_PATH, AnalysisTrace
 
 # class YakuzaScanWindow(qrd.CaptureViewer):
 #     mqt: qrd.MiniQtHelper
@@ -38,6 +44,14 @@ from yk_analysis.renderdoc.analyse import condensed_manyname, perform_analysis
 extiface_version = ''
 # cur_window: Optional[YakuzaScanWindow] = None
 
+# Set to cancel the scan in progress, if there is one
+current_scan: Optional[threading.Event] = None
+
+# Maximum number of names set per UI thread invocation, so the UI stays responsive while a big capture's names are applied
+UI_NAME_BATCH_SIZE = 200
+# Resolution of the progress bar
+PROGRESS_STEPS = 1000
+
 def register(version: str, ctx: qrd.CaptureContext):
     global extiface_version
     extiface_version = version
@@ -47,6 +61,8 @@ def register(version: str, ctx: qrd.CaptureContext):
     # ctx.Extensions().RegisterWindowMenu(qrd.WindowMenu.Window, ["Extension Window"], open_window_callback)
     ctx.Extensions().RegisterWindowMenu(qrd.WindowMenu.Tools, ["Yakuza Scan"], menu_callback)
     ctx.Extensions().RegisterWindowMenu(qrd.WindowMenu.Tools, ["Yakuza Scan (Debug)"], menu_callback_dbg)
+    ctx.Extensions().RegisterWindowMenu(qrd.WindowMenu.Tools, ["Yakuza Scan (Cancel)"], menu_callback_cancel)
+    ctx.Extensions().RegisterWindowMenu(qrd.WindowMenu.Tools, ["Yakuza Scan (Apply Results File)"], menu_callback_apply_results)
 
 def unregister():
     print("Unregistering my extension")
@@ -56,7 +72,8 @@ def unregister():
     # if cur_window is not None:
     #     cur_window.mqt.CloseToplevelWidget(cur_window.top_window)
     # cur_window = None
-    pass
+    if current_scan is not None:
+        current_scan.set()
 
 def open_window_callback(ctx: qrd.CaptureContext, data):
     # global cur_window
@@ -92,51 +109,171 @@ def on_window_closed():
     # - check d3d11state.pixelShader is consistent
     # - lookup the (shadername[:30], action.numIndices) against a column (use d3d11state.inputAssembly.topology == Topology.TriangleList/Strip) and assign action.customName = f"{shader}.{gmdfile}.{nodename}.{draworder}" if there's only one distinct answer
 
-def menu_callback(ctx: qrd.CaptureContext, data):
+class ScanProgressWindow:
+    # Shows the progress of a scan, with a button to cancel it. Only use it from the UI thread.
+    def __init__(self, ctx: qrd.CaptureContext, mqt: qrd.MiniQtHelper, cancel: threading.Event):
+        self.ctx = ctx
+        self.mqt = mqt
+        self.cancel = cancel
+        self.closed = False
+
+        self.top_window = mqt.CreateToplevelWidget("Yakuza Scan", lambda c, w, d: self.on_closed())
+        vert = mqt.CreateVerticalContainer()
+        self.label = mqt.CreateLabel()
+        mqt.SetWidgetText(self.label, "Starting scan...")
+        self.progress_bar = mqt.CreateProgressBar(True)
+        mqt.SetProgressBarRange(self.progress_bar, 0, PROGRESS_STEPS)
+        cancel_button = mqt.CreateButton(lambda c, w, d: cancel.set())
+        mqt.SetWidgetText(cancel_button, "Cancel")
+        mqt.AddWidget(vert, self.label)
+        mqt.AddWidget(vert, self.progress_bar)
+        mqt.AddWidget(vert, cancel_button)
+        mqt.AddWidget(self.top_window, vert)
+        ctx.AddDockWindow(self.top_window, qrd.DockReference.MainToolArea, None)
+
+    def on_closed(self):
+        # Closing the window cancels the scan
+        self.closed = True
+        self.cancel.set()
+
+    def update(self, text: str, step: int):
+        if self.closed:
+            return
+        self.mqt.SetWidgetText(self.label, text)
+        self.mqt.SetProgressBarValue(self.progress_bar, step)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.mqt.CloseToplevelWidget(self.top_window)
+
+def start_scan(ctx: qrd.CaptureContext, trace_path: Optional[str]):
+    global current_scan
+    if current_scan is not None:
+        ctx.Extensions().MessageDialog("A scan is already running, cancel it first", "Extension message")
+        return
     db_path, _selected_filter = widgets.QFileDialog.getOpenFileName(caption="Select Yakuza Game Shader DB Path")
     if not db_path:
         ctx.Extensions().MessageDialog("No database selected!", "Extension message")
         return
+    # Optional, draws are only matched to GMD nodes if a model DB is selected
+    model_db_path, _selected_filter = widgets.QFileDialog.getOpenFileName(caption="Select Yakuza Model DB Path (cancel to skip GMD node matching)")
     
     mqt = ctx.Extensions().GetMiniQtHelper()
+    cancel = threading.Event()
+    current_scan = cancel
+    window = ScanProgressWindow(ctx, mqt, cancel)
 
-    ctx.Replay().AsyncInvoke('', lambda r: analysis_ui_wrapper(ctx, r, mqt, db_path, debug=False))
+    ctx.Replay().AsyncInvoke('', lambda r: analysis_ui_wrapper(ctx, r, mqt, db_path, model_db_path or None, trace_path, window, cancel))
+
+def menu_callback(ctx: qrd.CaptureContext, data):
+    start_scan(ctx, trace_path=None)
 
 def menu_callback_dbg(ctx: qrd.CaptureContext, data):
-    db_path, _selected_filter = widgets.QFileDialog.getOpenFileName(caption="Select Yakuza Game Shader DB Path")
-    if not db_path:
-        ctx.Extensions().MessageDialog("No database selected!", "Extension message")
+    trace_path, _selected_filter = widgets.QFileDialog.getSaveFileName(caption="Select Trace Output Path", dir=DEFAULT_TRACE_PATH)
+    if not trace_path:
+        trace_path = DEFAULT_TRACE_PATH
+    start_scan(ctx, trace_path=trace_path)
+
+def menu_callback_cancel(ctx: qrd.CaptureContext, data):
+    if current_scan is None:
+        ctx.Extensions().MessageDialog("No scan is running", "Extension message")
+    else:
+        current_scan.set()
+
+def menu_callback_apply_results(ctx: qrd.CaptureContext, data):
+    # Applies the names batch.py found for this capture, without analysing it again
+    if not ctx.IsCaptureLoaded():
+        ctx.Extensions().MessageDialog("No capture loaded!", "Extension message")
+        return
+    results_path, _selected_filter = widgets.QFileDialog.getOpenFileName(caption="Select Yakuza Scan Results File")
+    if not results_path:
+        return
+    try:
+        with open(results_path, "r") as f:
+            all_results = [results for results in iter_results(f) if results.error is None]
+    except (OSError, ValueError) as err:
+        ctx.Extensions().ErrorDialog(f"Couldn't read {results_path}: {err}")
+        return
+    results = find_capture_results(all_results, ctx.GetCaptureFilename())
+    if results is None:
+        ctx.Extensions().MessageDialog(f"{results_path} has no results for this capture", "Extension message")
         return
-    
-    mqt = ctx.Extensions().GetMiniQtHelper()
 
-    ctx.Replay().AsyncInvoke('', lambda r: analysis_ui_wrapper(ctx, r, mqt, db_path, debug=True))
+    resources = {int(res.resourceId): res.resourceId for res in ctx.GetResources()}
+    applied_names = 0
+    for resource_id, names in results.shader_names.items():
+        if resource_id in resources and names:
+            ctx.SetResourceCustomName(resources[resource_id], condensed_manyname(set(names)))
+            applied_names += 1
+    for eventId, action_name in results.action_names.items():
+        action = ctx.GetAction(eventId)
+        if action is not None:
+            action.customName = action_name
+            applied_names += 1
+    ctx.Extensions().MessageDialog(f"Done! Applied {applied_names} names.")
+
+def analysis_ui_wrapper(ctx: qrd.CaptureContext, r: rd.ReplayController, mqt: qrd.MiniQtHelper, db_path: str, model_db_path: Optional[str], trace_path: Optional[str],
+                        window: ScanProgressWindow, cancel: threading.Event):
+    # Runs on the replay thread. Progress and names are posted to the UI thread as they become available,
+    # names in batches of UI_NAME_BATCH_SIZE so each UI thread invocation is short.
+    # Without a trace_path, only the per-phase summary is recorded (and printed to RenderDoc's Python output)
+    trace = AnalysisTrace(trace_path)
+    ui_name_application = trace.phase("UI name application")
+    applied_names = 0
+    last_step = -1
+
+    def report_progress(phase: str, done: int, total: int):
+        nonlocal last_step
+        step = (done * PROGRESS_STEPS) // total if total else 0
+        # Don't flood the UI thread with updates it won't display
+        if step != last_step:
+            last_step = step
+            mqt.InvokeOntoUIThread(lambda: window.update(f"{phase} ({done}/{total})", step))
+
+    def apply_names(shader_names: List, action_names: List):
+        # UI thread
+        nonlocal applied_names
+        t = time.perf_counter()
+        for resourceId, possible_names in shader_names:
+            ctx.SetResourceCustomName(resourceId, condensed_manyname(possible_names))
+        for eventId, action_name in action_names:
+            # ctx.SetFrameEvent(eventId) # Update the name in the UI
+            ctx.GetAction(eventId).customName = action_name
+        applied_names += len(shader_names) + len(action_names)
+        ui_name_application.lap(t)
+
+    def post_results(shader_names: Dict[rd.ResourceId, ShaderNameSet], action_names: Dict[int, str]):
+        named_shaders = [(resourceId, possible_names) for resourceId, possible_names in shader_names.items() if possible_names]
+        for i in range(0, len(named_shaders), UI_NAME_BATCH_SIZE):
+            batch = named_shaders[i:i + UI_NAME_BATCH_SIZE]
+            mqt.InvokeOntoUIThread(lambda batch=batch: apply_names(batch, []))
+        action_name_items = list(action_names.items())
+        for i in range(0, len(action_name_items), UI_NAME_BATCH_SIZE):
+            batch = action_name_items[i:i + UI_NAME_BATCH_SIZE]
+            mqt.InvokeOntoUIThread(lambda batch=batch: apply_names([], batch))
+
+    def end_scan(message: Optional[str], err_msg: Optional[str]):
+        # UI thread, runs after every batch of names posted before it
+        global current_scan
+        if current_scan is cancel:
+            current_scan = None
+        window.close()
+        trace.close(sys.stdout)
+        if message:
+            if trace.recording:
+                message += f" Trace written to {trace.out_path}"
+            ctx.Extensions().MessageDialog(message)
+        if err_msg:
+            ctx.Extensions().ErrorDialog(err_msg)
 
-def analysis_ui_wrapper(ctx: qrd.CaptureContext, r: rd.ReplayController, mqt: qrd.MiniQtHelper, db_path: str, debug: bool):
     try:
-        if debug:
-            # TODO hardcoded path
-            dbg_file = open("C:\\Users\\Samuel\\ext_dbg.temp.txt", "a")
-        else:
-            dbg_file = None
-
-        shader_names, action_names = perform_analysis(r, db_path, dbg_file)
-        def finish():
-            for resourceId, possible_names in shader_names.items():
-                if not possible_names:
-                    continue
-                ctx.SetResourceCustomName(resourceId, condensed_manyname(possible_names))
-            for eventId, action_name in action_names.items():
-                # ctx.SetFrameEvent(eventId) # Update the name in the UI
-                ctx.GetAction(eventId).customName = action_name
-            ctx.Extensions().MessageDialog(f"Done!")
-        mqt.InvokeOntoUIThread(finish)
-
-        err_msg = None
+        perform_analysis(r, db_path, trace, progress=report_progress, cancel=cancel, results=post_results, model_db_path=model_db_path)
+        mqt.InvokeOntoUIThread(lambda: end_scan(f"Done! Applied {applied_names} names.", None))
+    except AnalysisCancelled:
+        trace.event("cancelled")
+        mqt.InvokeOntoUIThread(lambda: end_scan(f"Scan cancelled, {applied_names} names were already applied.", None))
     except Exception as err:
         err_msg = f"{err}"
-    finally:
-        if dbg_file:
-            dbg_file.close()
-        if err_msg:
-            mqt.InvokeOntoUIThread(lambda: ctx.Extensions().ErrorDialog(f"{err_msg}"))
\ No newline at end of file
+        trace.event("error", err_msg)
+        mqt.InvokeOntoUIThread(lambda: end_scan(None, err_msg))